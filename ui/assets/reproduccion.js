@@ -0,0 +1,112 @@
+// Reproducción de pasos en el navegador: la escena completa llega una sola vez
+// (una traza por pieza) y cada paso solo cambia la visibilidad de las trazas.
+
+// Arreglos tipados de plotly.js ({dtype, bdata}, ver utils/codificacion.py)
+const TIPOS = {
+    i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+    i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array
+};
+
+function decodificar(arreglo) {
+    if (!arreglo || arreglo.bdata === undefined) {
+        return arreglo;
+    }
+    const texto = atob(arreglo.bdata);
+    const bytes = new Uint8Array(texto.length);
+    for (let b = 0; b < texto.length; b++) {
+        bytes[b] = texto.charCodeAt(b);
+    }
+    return new TIPOS[arreglo.dtype](bytes.buffer);
+}
+
+// Coordenadas de una traza como números reales; las cuantizadas a int16
+// traen en meta.cuantizacion la escala y el desplazamiento de cada eje
+function coordenadas(traza) {
+    const cuantizacion = traza.meta && traza.meta.cuantizacion;
+    const ejes = [decodificar(traza.x), decodificar(traza.y), decodificar(traza.z)];
+    if (!cuantizacion) {
+        return {x: ejes[0], y: ejes[1], z: ejes[2]};
+    }
+    const reales = ejes.map((eje, n) => {
+        const escala = cuantizacion.escala[n], desplazamiento = cuantizacion.desplazamiento[n];
+        const valores = new Float32Array(eje.length);
+        for (let v = 0; v < eje.length; v++) {
+            valores[v] = eje[v] * escala + desplazamiento;
+        }
+        return valores;
+    });
+    return {x: reales[0], y: reales[1], z: reales[2]};
+}
+
+function sin_cuantizacion(meta) {
+    const copia = Object.assign({}, meta);
+    delete copia.cuantizacion;
+    return copia;
+}
+
+// Geometría de una instancia: vértices de la traza original rotados y
+// trasladados; las caras se comparten
+function ubicar(original, instancia) {
+    const r = instancia.rotacion;
+    const t = instancia.traslacion;
+    const o = coordenadas(original);
+    const n = o.x.length;
+    const x = new Float32Array(n), y = new Float32Array(n), z = new Float32Array(n);
+    for (let v = 0; v < n; v++) {
+        const ox = o.x[v], oy = o.y[v], oz = o.z[v];
+        x[v] = r[0][0] * ox + r[0][1] * oy + r[0][2] * oz + t[0];
+        y[v] = r[1][0] * ox + r[1][1] * oy + r[1][2] * oz + t[1];
+        z[v] = r[2][0] * ox + r[2][1] * oy + r[2][2] * oz + t[2];
+    }
+    return {x: x, y: y, z: z, i: original.i, j: original.j, k: original.k};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    reproduccion: {
+        paso: function (n_siguiente, n_anterior, n_completo, figura, orden, indice) {
+            const sin_cambios = window.dash_clientside.no_update;
+            const ctx = window.dash_clientside.callback_context;
+
+            if (!ctx.triggered.length || !figura) {
+                return [sin_cambios, 'Piezas generadas: 0', sin_cambios];
+            }
+
+            const boton = ctx.triggered[0].prop_id.split('.')[0];
+            let mensaje;
+
+            if (boton === 'btn-pieza-siguiente') {
+                if (indice >= orden.length - 1) {
+                    return [sin_cambios, sin_cambios, sin_cambios];
+                }
+                indice += 1;
+                mensaje = `Piezas generadas (Adelante): ${indice + 1}`;
+            } else if (boton === 'btn-pieza-anterior') {
+                if (indice <= 0) {
+                    return [sin_cambios, sin_cambios, sin_cambios];
+                }
+                indice -= 1;
+                mensaje = `Piezas generadas (Atrás): ${indice + 1}`;
+            } else {
+                indice = orden.length - 1;
+                mensaje = 'Modelo completo generado';
+            }
+
+            // Copias superficiales: los arreglos de geometría no se duplican.
+            // Las piezas repetidas llegan sin geometría y las cuantizadas en
+            // int16; unas y otras se arman la primera vez que se muestran
+            const visibles = new Set(orden.slice(0, indice + 1));
+            const data = figura.data.map((traza, n) => {
+                const copia = Object.assign({}, traza, {visible: visibles.has(n)});
+                const instancia = traza.meta && traza.meta.instancia;
+                if (copia.visible && instancia && !traza.x.length) {
+                    Object.assign(copia, ubicar(figura.data[instancia.traza], instancia));
+                } else if (copia.visible && traza.meta && traza.meta.cuantizacion) {
+                    Object.assign(copia, coordenadas(traza), {meta: sin_cuantizacion(traza.meta)});
+                }
+                return copia;
+            });
+
+            return [Object.assign({}, figura, {data: data}), mensaje, indice];
+        }
+    }
+});
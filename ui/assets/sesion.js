@@ -0,0 +1,15 @@
+// Identificador de sesión del visor: se genera una vez por pestaña y se
+// conserva en sessionStorage, así el servidor guarda el paso de cada operador.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    sesion: {
+        crear_id: function (_, id_sesion) {
+            if (id_sesion) {
+                return window.dash_clientside.no_update;
+            }
+            if (window.crypto && window.crypto.randomUUID) {
+                return window.crypto.randomUUID();
+            }
+            return Date.now().toString(36) + Math.random().toString(36).slice(2);
+        }
+    }
+});
@@ -0,0 +1,124 @@
+"""
+Compara el tamaño de las trazas que se envían al navegador y el tiempo de
+decodificarlas en cada modo de utils/codificacion.py, sobre las escenas del
+repositorio: una traza por pieza (animation.py, x.py) y una sola traza con
+todas (draw.py).
+
+La decodificación se mide con node (JSON.parse y el paso de base64 a arreglo
+tipado, el mismo trabajo que hacen el navegador y assets/reproduccion.js); sin
+node solo se informan los bytes.
+
+    python benchmark_codificacion.py [configuracion_unity25.json ...] [--repeticiones 20]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+import plotly.graph_objs as go
+from plotly.io.json import to_json_plotly
+
+from utils.ModeloGenerador import ModeloGenerador
+from utils.codificacion import MODOS, codificar_traza, decodificar_arreglo
+from utils.escena import cargar_escena
+
+# Decodifica cada arreglo tipado de la carga (y las coordenadas cuantizadas),
+# como assets/reproduccion.js; imprime el mejor tiempo en milisegundos
+_DECODIFICAR_JS = r"""
+const fs = require('fs');
+const texto = fs.readFileSync(process.argv[1], 'utf8');
+const repeticiones = Number(process.argv[2]);
+const TIPOS = {i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+               i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array};
+function decodificar(arreglo) {
+    if (!arreglo || arreglo.bdata === undefined) return arreglo;
+    const bytes = Buffer.from(arreglo.bdata, 'base64');
+    return new TIPOS[arreglo.dtype](bytes.buffer, bytes.byteOffset, bytes.length / TIPOS[arreglo.dtype].BYTES_PER_ELEMENT);
+}
+let mejor = Infinity;
+for (let r = 0; r < repeticiones; r++) {
+    const inicio = process.hrtime.bigint();
+    for (const traza of JSON.parse(texto)) {
+        const cuantizacion = traza.meta && traza.meta.cuantizacion;
+        ['x', 'y', 'z'].forEach((eje, n) => {
+            const valores = decodificar(traza[eje]);
+            if (cuantizacion) {
+                const reales = new Float32Array(valores.length);
+                for (let v = 0; v < valores.length; v++) {
+                    reales[v] = valores[v] * cuantizacion.escala[n] + cuantizacion.desplazamiento[n];
+                }
+            }
+        });
+        ['i', 'j', 'k', 'intensity'].forEach(eje => decodificar(traza[eje]));
+    }
+    mejor = Math.min(mejor, Number(process.hrtime.bigint() - inicio) / 1e6);
+}
+console.log(mejor.toFixed(2));
+"""
+
+
+def trazas_por_pieza(modelo, modo):
+    trazas = []
+    for indice in range(len(modelo.piezas_originales)):
+        x, y, z, colores, i, j, k = modelo.geometria_pieza(indice)
+        trazas.append(codificar_traza(go.Mesh3d(x=x, y=y, z=z, i=i, j=j, k=k, facecolor=colores), modo))
+    return trazas
+
+
+def traza_unica(modelo, modo):
+    vertices, caras = modelo.vertices, modelo.caras
+    return [codificar_traza(go.Mesh3d(x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+                                      i=caras[:, 0], j=caras[:, 1], k=caras[:, 2],
+                                      facecolor=modelo.colores), modo)]
+
+
+def error_maximo(trazas, modelo):
+    # Mayor diferencia entre las coordenadas enviadas y las reales, relativa a la escena
+    enviadas = []
+    for traza in trazas:
+        ejes = np.column_stack([decodificar_arreglo(traza[eje]).astype(float) for eje in 'xyz'])
+        cuantizacion = (traza.get('meta') or {}).get('cuantizacion')
+        if cuantizacion:
+            ejes = ejes * cuantizacion['escala'] + np.asarray(cuantizacion['desplazamiento'])
+        enviadas.append(ejes)
+    diagonal = np.linalg.norm(modelo.vertices.max(axis=0) - modelo.vertices.min(axis=0))
+    return float(np.abs(np.concatenate(enviadas) - modelo.vertices).max() / diagonal)
+
+
+def tiempo_decodificacion(carga, repeticiones):
+    if shutil.which('node') is None:
+        return None
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as archivo:
+        archivo.write(carga)
+    try:
+        salida = subprocess.run(['node', '-e', _DECODIFICAR_JS, archivo.name, str(repeticiones)],
+                                capture_output=True, text=True, check=True)
+        return float(salida.stdout)
+    finally:
+        os.remove(archivo.name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('archivos', nargs='*', help='Escenas (por defecto, configuracion_unity*.json)')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    for ruta in args.archivos or sorted(glob.glob('configuracion_unity*.json')):
+        modelo = ModeloGenerador(cargar_escena(ruta))
+        print(f"{ruta}: {len(modelo.piezas_originales)} piezas, {len(modelo.vertices)} vértices, "
+              f"{len(modelo.caras)} caras")
+        print(f"  {'trazas':<10} {'modo':<6} {'bytes':>10} {'relativo':>9} {'decodificar (ms)':>17} {'error':>9}")
+        for nombre, construir in (('por pieza', trazas_por_pieza), ('única', traza_unica)):
+            referencia = None
+            for modo in MODOS:
+                trazas = construir(modelo, modo)
+                carga = to_json_plotly(trazas)
+                referencia = referencia or len(carga)
+                ms = tiempo_decodificacion(carga, args.repeticiones)
+                print(f"  {nombre:<10} {modo:<6} {len(carga):>10} {len(carga) / referencia:>8.0%} "
+                      f"{'-' if ms is None else f'{ms:.2f}':>17} {error_maximo(trazas, modelo):>9.1e}")
@@ -0,0 +1,63 @@
+"""
+Mide utils.ensamblaje.validar_ensamblaje sobre una escena sintética de
+lado³ icoesferas apiladas en columnas sobre z, todas entrando de abajo
+hacia arriba en orden de altura: cada esfera queda bloqueada por las de
+abajo, así que la fase fina corre para cada par de la misma columna. Las
+esferas no se tocan, así que el eje vertical detectado sería el de Unity:
+se mide la detección aparte y se valida con z hacia arriba.
+
+    python benchmark_ensamblaje.py [--lado 10] [--subdivisiones 2]
+"""
+import argparse
+import time
+
+import numpy as np
+import trimesh
+
+from utils import ensamblaje
+from utils.ensamblaje import detectar_eje_vertical, validar_ensamblaje
+
+
+def escena_sintetica(lado, subdivisiones):
+    esfera = trimesh.creation.icosphere(subdivisions=subdivisiones)
+    return {'scene_configuration': {'pieces': [
+        {'id': n, 'priority': int(k), 'direction': 'de abajo hacia arriba',
+         'mesh': {'vertices': (esfera.vertices + 3.0 * np.array([i, j, k])).tolist(), 'faces': esfera.faces.tolist()}}
+        for n, (i, j, k) in enumerate(np.ndindex(lado, lado, lado))]}}
+
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return time.perf_counter() - inicio, resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lado', type=int, default=10)
+    parser.add_argument('--subdivisiones', type=int, default=2)
+    args = parser.parse_args()
+
+    escena = escena_sintetica(args.lado, args.subdivisiones)
+    piezas = escena['scene_configuration']['pieces']
+    mallas = [(p['mesh']['vertices'], p['mesh']['faces']) for p in piezas]
+    print(f"{len(piezas)} piezas de {len(mallas[0][1])} caras")
+
+    t_eje, _ = medir(lambda: detectar_eje_vertical(mallas))
+    print(f"  detección del eje vertical: {t_eje:.2f} s")
+
+    # Contar los pares que llegan a la fase fina
+    pares = []
+    bloquea = ensamblaje._bloquea
+    ensamblaje._bloquea = lambda *args: pares.append(1) or bloquea(*args)
+    try:
+        t_validar, conflictos = medir(lambda: validar_ensamblaje(escena, eje_vertical=2))
+    finally:
+        ensamblaje._bloquea = bloquea
+    print(f"  validación: {t_validar:.2f} s, {len(pares)} pares en la fase fina "
+          f"({1e3 * t_validar / max(len(pares), 1):.2f} ms por par), {len(conflictos)} conflictos")
+
+    # Todas menos la de abajo de cada columna, bloqueadas por las de abajo
+    assert len(conflictos) == len(piezas) - args.lado ** 2
+    assert all(len(c['bloqueada_por']) == c['priority'] for c in conflictos)
+    print(f"  total: {t_eje + t_validar:.2f} s")
@@ -0,0 +1,71 @@
+"""
+Compara la ingesta de STL binario de utils/stl.py contra trimesh.load_mesh
+sobre mallas sintéticas de tamaño creciente, y la separación en componentes
+con distinta cantidad de procesos contra mesh.split().
+
+    python benchmark_stl.py [--triangulos 20000 200000 2000000] [--procesos 1 2 4 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import trimesh
+
+from utils.stl import cargar_stl, separar_malla
+
+
+def crear_stl_sintetico(ruta, n_triangulos):
+    # Ensamble de esferas repetidas en una rejilla, hasta llegar al tamaño pedido
+    esfera = trimesh.creation.icosphere(subdivisions=3)
+    n_esferas = max(1, n_triangulos // len(esfera.faces))
+    lado = int(np.ceil(np.sqrt(n_esferas)))
+    desplazamientos = np.array([(3.0 * (n % lado), 3.0 * (n // lado), 0.0) for n in range(n_esferas)])
+
+    vertices = (esfera.vertices[None, :, :] + desplazamientos[:, None, :]).reshape(-1, 3)
+    caras = (esfera.faces[None, :, :] + (np.arange(n_esferas) * len(esfera.vertices))[:, None, None]).reshape(-1, 3)
+    trimesh.Trimesh(vertices=vertices, faces=caras, process=False).export(ruta)
+    return len(caras)
+
+
+def medir(funcion, repeticiones=3):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--triangulos', type=int, nargs='+', default=[20000, 200000, 2000000])
+    parser.add_argument('--procesos', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'triángulos':>12} {'MB':>8} {'trimesh (s)':>12} {'nativo (s)':>12} {'aceleración':>12}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for n in args.triangulos:
+            ruta = os.path.join(directorio, f'sintetico_{n}.stl')
+            n_real = crear_stl_sintetico(ruta, n)
+
+            t_trimesh, referencia = medir(lambda: trimesh.load_mesh(ruta))
+            t_nativo, malla = medir(lambda: cargar_stl(ruta))
+
+            # Misma geometría: cada cara apunta a las mismas coordenadas
+            assert np.array_equal(malla.vertices[malla.faces], referencia.vertices[referencia.faces])
+            assert len(malla.vertices) == len(referencia.vertices)
+
+            print(f"{n_real:>12} {os.path.getsize(ruta) / 2**20:>8.1f} {t_trimesh:>12.3f} "
+                  f"{t_nativo:>12.3f} {t_trimesh / t_nativo:>11.1f}x")
+
+            # Separación: la referencia es mesh.split() en un solo proceso
+            t_split, componentes = medir(lambda: malla.copy().split(), repeticiones=1)
+            for procesos in args.procesos:
+                t_paralelo, paralelo = medir(lambda: separar_malla(malla.copy(), procesos), repeticiones=1)
+                assert len(paralelo) == len(componentes)
+                assert all(np.array_equal(a.faces, b.faces) and np.array_equal(a.vertices, b.vertices)
+                           for a, b in zip(paralelo, componentes))
+                print(f"{'':>12} split: {procesos} proceso(s) {t_paralelo:>8.3f} s "
+                      f"({t_split / t_paralelo:.1f}x frente a {t_split:.3f} s, {len(componentes)} componentes)")
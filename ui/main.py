@@ -3,10 +3,18 @@ from dash import dcc, html, Input, Output, State
 import plotly.graph_objects as go
 import trimesh
 import json
+import os
+import threading
 import numpy as np
 from firebase_admin import firestore
 
+from utils.ColaTrabajos import ColaTrabajos, ERROR, LISTO
+from utils.EscrituraDiferida import EscrituraDiferida
 from utils.FirebaseAppSingleton import FirebaseAppSingleton
+from utils.analisis import analizar_stl
+from utils.codificacion import codificar_figura, modo_visor
+from utils.lod import elegir_niveles
+from utils.stl import cargar_componentes, hash_archivo
 
 # Simulated preconfigured model data
 PRECONFIGURED_MODEL_PATH = 'HACKATHON.1_AllCATPart.stl'
@@ -18,39 +26,94 @@ colores = [
     '#55E6C1', '#5F27CD', '#48DBFB', '#FF6B6B'
 ]
 
+# Face budget for the figure (PRESUPUESTO_CARAS); pieces drop to coarser
+# levels of detail to fit it, except the selected one. None = full detail
+PRESUPUESTO_CARAS = int(os.environ.get('PRESUPUESTO_CARAS', 0)) or None
+
+# Geometry encoding sent to the browser (CODIFICACION_GEOMETRIA, see
+# utils.codificacion); quantized 'i2' needs client-side decoding, which this
+# app lacks, so it falls back to 'f4' with a warning in the log
+CODIFICACION = modo_visor(os.environ.get('CODIFICACION_GEOMETRIA', 'f4'))
+
+# Export repeated parts as instances (EXPORTAR_INSTANCIAS=1, schema v3, see
+# utils.instancias). Off by default: the Unity app still reads only v1/v2 scenes
+EXPORTAR_INSTANCIAS = os.environ.get('EXPORTAR_INSTANCIAS') == '1'
+
 # Directions for piece placement
 direcciones = ['de abajo hacia arriba', 'de derecha a izquierda', 'de izquierda a derecha', 'de arriba hacia abajo']
 
+# Background job queue for Unity exports, stored on disk so any worker can poll it.
+# Its worker processes run apart (python -m utils.ColaTrabajos); only the dev server starts them itself
+cola_exportacion = ColaTrabajos(os.environ.get('RUTA_COLA_TRABAJOS', '.trabajos.sqlite'))
+
+# Editor saves go to Firestore in the background, through a local journal
+# (one journal per process: give each gunicorn worker its own RUTA_DIARIO_FIRESTORE).
+# It is created on first use, so only the process serving callbacks owns it: the
+# debug reloader parent and the export workers also import this file
+_escrituras_firestore = None
+_lock_escrituras = threading.Lock()
+
+
+def escrituras_firestore():
+    global _escrituras_firestore
+    with _lock_escrituras:
+        if _escrituras_firestore is None:
+            _escrituras_firestore = EscrituraDiferida(
+                os.environ.get('RUTA_DIARIO_FIRESTORE', '.diario_firestore.jsonl'))
+        return _escrituras_firestore
+
+
 def load_preconfigured_model():
     """Load a preconfigured STL model for demonstration"""
     try:
-        # Replace this with your actual preconfigured model loading logic
-        mesh = trimesh.load_mesh(PRECONFIGURED_MODEL_PATH)
-        componentes = mesh.split()
+        # Split components and their analysis (click index, suggestions, hidden
+        # faces) are cached on disk and in memory, keyed by file content, so
+        # callbacks in any worker look them up by path instead of sharing globals
+        componentes = cargar_componentes(PRECONFIGURED_MODEL_PATH)
+        analizar_stl(PRECONFIGURED_MODEL_PATH)
         return componentes
     except Exception as e:
         print(f"Error loading preconfigured model: {e}")
         return None
 
-def crear_figura(componentes, selected_piece=None, current_camera=None):
-    """Create 3D visualization figure"""
+def crear_figura(componentes, selected_piece=None, current_camera=None, presupuesto_caras=PRESUPUESTO_CARAS,
+                 analisis=None):
+    """Create 3D visualization figure (analisis: hidden faces and reduced levels, see utils.analisis)"""
     if not componentes:
         return go.Figure()
 
     fig = go.Figure()
 
+    # Full mesh of each piece plus its reduced levels (computed once per STL), only when there is a budget
+    if presupuesto_caras is None or analisis is None:
+        mallas = [[(componente.vertices, componente.faces)] for componente in componentes]
+        niveles = [0] * len(componentes)
+    else:
+        mallas = [[(componente.vertices, componente.faces)] + reducidos
+                  for componente, reducidos in zip(componentes, analisis['niveles'])]
+        niveles = elegir_niveles([[len(caras) for _, caras in m] for m in mallas], presupuesto_caras,
+                                 completas=[] if selected_piece is None else [selected_piece])
+
+    # Hidden contact faces only matter while every piece is drawn opaque
+    ocultas = None
+    if selected_piece is None and analisis is not None and len(analisis['ocultas']) == len(componentes):
+        ocultas = analisis['ocultas']
+
     for idx, componente in enumerate(componentes):
-        x = componente.vertices[:, 0]
-        y = componente.vertices[:, 1]
-        z = componente.vertices[:, 2]
+        vertices, caras = mallas[idx][niveles[idx]]
+        if ocultas is not None and niveles[idx] == 0:
+            caras = caras[ocultas[idx] < 0]
+        x = vertices[:, 0]
+        y = vertices[:, 1]
+        z = vertices[:, 2]
 
         mesh = go.Mesh3d(
             x=x,
             y=y,
             z=z,
-            i=componente.faces[:, 0],
-            j=componente.faces[:, 1],
-            k=componente.faces[:, 2],
+            i=caras[:, 0],
+            j=caras[:, 1],
+            k=caras[:, 2],
             color=colores[idx % len(colores)],
             opacity=0.7 if selected_piece is not None and idx != selected_piece else 1.0,
             name=f'Piece {idx}'
@@ -69,7 +132,9 @@ def crear_figura(componentes, selected_piece=None, current_camera=None):
             }
         ),
         showlegend=True,
-        margin=dict(l=0, r=0, t=0, b=0)
+        margin=dict(l=0, r=0, t=0, b=0),
+        # Keep the user's camera when the figure is redrawn (e.g. on selection)
+        uirevision='modelo'
     )
     for idx, componente in enumerate(componentes):
         mesh = go.Mesh3d(
@@ -77,7 +142,7 @@ def crear_figura(componentes, selected_piece=None, current_camera=None):
             opacity=0.7 if selected_piece is not None and idx != selected_piece else 1.0,
         )
 
-    return fig
+    return codificar_figura(fig, CODIFICACION)
 
 # Create Dash app
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
@@ -279,6 +344,9 @@ app.layout = html.Div(style={
             dcc.Store(id='pieza-seleccionada-store', data=None),
             dcc.Store(id='configuracion-store', data=None),
             dcc.Download(id="download-json"),
+            dcc.Store(id='trabajo-exportacion', data=None),
+            dcc.Interval(id='progreso-exportacion', interval=1000, disabled=True),
+            html.Div(id='estado-exportacion', style={'textAlign': 'center'}),
 
             html.Div(
                 html.Img(
@@ -356,7 +424,7 @@ def simular_carga_modelo(dummy):
 
     if componentes:
         # Create figure
-        figura = crear_figura(componentes)
+        figura = crear_figura(componentes, analisis=analizar_stl(PRECONFIGURED_MODEL_PATH))
 
         # Create piece dropdown options
         piece_options = [{'label': f'Pieza {i + 1}', 'value': i} for i in range(len(componentes))]
@@ -400,22 +468,46 @@ def seleccionar_pieza(clickData, piece_options):
     if not clickData:
         return None, None, None, None, ''
 
-    # Obtener el índice de la pieza seleccionada
+    # Obtener el índice de la pieza seleccionada a partir del punto 3D del
+    # clic, para no depender del orden ni de la agrupación de las trazas
     punto_seleccionado = clickData['points'][0]
-    indice_pieza = punto_seleccionado.get('curveNumber', None)
+    analisis = analizar_stl(PRECONFIGURED_MODEL_PATH)
+    if all(eje in punto_seleccionado for eje in 'xyz'):
+        cercana = analisis['indice'].pieza_mas_cercana([punto_seleccionado[eje] for eje in 'xyz'])
+        indice_pieza = None if cercana is None else cercana[0]
+    else:
+        indice_pieza = punto_seleccionado.get('curveNumber', None)
 
     if indice_pieza is not None:
+        # Dirección y prioridad sugeridas por el grafo de contactos
+        direccion = analisis['sugerencias'][indice_pieza]['direction']
+        prioridad = analisis['sugerencias'][indice_pieza]['priority']
+
         # Configurar los valores de los campos basados en la pieza seleccionada
         return (
             indice_pieza,  # Guardar en store
             indice_pieza,  # Valor del dropdown
-            direcciones[indice_pieza % len(direcciones)],  # Dirección por defecto
-            indice_pieza,  # Prioridad inicial
+            direccion,  # Dirección por defecto
+            prioridad,  # Prioridad inicial
             f'Configuración para Pieza {indice_pieza + 1}'  # Texto de ayuda inicial
         )
 
     return None, None, None, None, ''
 
+# Redraw with the selected piece at full detail and the others translucent,
+# keeping the camera the user left
+@app.callback(
+    Output('modelo-3d', 'figure', allow_duplicate=True),
+    [Input('pieza-seleccionada-store', 'data')],
+    [State('modelo-3d', 'relayoutData')],
+    prevent_initial_call=True
+)
+def resaltar_pieza(pieza_seleccionada, relayout_data):
+    componentes = cargar_componentes(PRECONFIGURED_MODEL_PATH)
+    camara = (relayout_data or {}).get('scene.camera')
+    return crear_figura(componentes, selected_piece=pieza_seleccionada, current_camera=camara,
+                        analisis=analizar_stl(PRECONFIGURED_MODEL_PATH))
+
 @app.callback(
     [Output('configuracion-store', 'data'),
      Output('texto-modificado', 'children')],
@@ -423,100 +515,90 @@ def seleccionar_pieza(clickData, piece_options):
     [State('pieza-seleccionada-store', 'data'),
      State('direccion-pieza', 'value'),
      State('prioridad-pieza', 'value'),
-     State('ayuda-pieza', 'value')]
+     State('ayuda-pieza', 'value'),
+     State('configuracion-store', 'data')]
 )
-def guardar_configuracion(n_clicks, pieza_seleccionada, direccion, prioridad, ayuda):
+def guardar_configuracion(n_clicks, pieza_seleccionada, direccion, prioridad, ayuda, configuraciones):
     if not n_clicks or pieza_seleccionada is None:
-        return None, ''
+        return dash.no_update, ''
 
-    configuracion = {
+    # Se acumula una configuración por pieza (claves str por el JSON del store)
+    configuraciones = dict(configuraciones or {})
+    configuraciones[str(pieza_seleccionada)] = {
         'pieza': pieza_seleccionada,
         'direccion': direccion,
         'prioridad': prioridad,
         'ayuda': ayuda
     }
 
-    return configuracion, f'Configuración guardada para Pieza {pieza_seleccionada + 1}'
+    # Se anota y vuelve enseguida; el envío a Firestore ocurre en segundo plano
+    escrituras_firestore().guardar_documento(
+        f"configuraciones/{hash_archivo(PRECONFIGURED_MODEL_PATH)}",
+        {str(pieza_seleccionada): configuraciones[str(pieza_seleccionada)]},
+        merge=True
+    )
+
+    return configuraciones, f'Configuración guardada para Pieza {pieza_seleccionada + 1}'
 
 
-# Callback to generate export JSON
+# Callback to generate export JSON: queues a background job and starts polling it
 @app.callback(
-    Output("download-json", "data"),
+    [Output('trabajo-exportacion', 'data'),
+     Output('progreso-exportacion', 'disabled')],
     [Input('generar-json', 'n_clicks')],
-    [State('configuracion-store', 'data'),
-     State('stl-components-store', 'data')],
-    prevent_initial_call=True,
-    allow_duplicate=True
+    [State('configuracion-store', 'data')],
+    prevent_initial_call=True
 )
 #Samuel
-def generar_json(n_clicks, config_data, stl_components_data):
-    # try:
-    #     if n_clicks and config_data and stl_components_data:
-    #         # Cargar componentes
-    #         componentes_vertices = json.loads(stl_components_data)
-    #         componentes = [
-    #             trimesh.Trimesh(vertices=np.array(comp_vertices))
-    #             for comp_vertices in componentes_vertices
-    #         ]
-    #
-    #         config = json.loads(config_data)
-    #
-    #         # Calcular dimensiones del modelo
-    #         all_vertices = np.concatenate([comp.vertices for comp in componentes])
-    #         bbox_min = np.min(all_vertices, axis=0)
-    #         bbox_max = np.max(all_vertices, axis=0)
-    #         model_dimensions = bbox_max - bbox_min
-    #
-    #         configuracion_unity = {
-    #             "scene_configuration": {
-    #                 "total_pieces": len(componentes),
-    #                 "pieces": []
-    #             }
-    #         }
-    #
-    #         for pieza in config:
-    #             piece_config = {
-    #                 "id": pieza["id"],
-    #                 "direction": pieza.get('direccion', 'de abajo hacia arriba'),
-    #                 "position": {
-    #                     "x": componentes[pieza['id']].vertices[:, 0].tolist(),
-    #                     "y": componentes[pieza['id']].vertices[:, 1].tolist(),
-    #                     "z": componentes[pieza['id']].vertices[:, 2].tolist()
-    #                 },
-    #                 "rotation": {
-    #                     "x": pieza['coordenadas_finales']['rotacion_x'],
-    #                     "y": pieza['coordenadas_finales']['rotacion_y'],
-    #                     "z": pieza['coordenadas_finales']['rotacion_z']
-    #                 },
-    #                 "color": pieza["color"],
-    #                 "enabled": pieza["habilitado"],
-    #                 "mesh": {
-    #                     "vertices": componentes[pieza['id']].vertices.tolist(),
-    #                     "faces": componentes[pieza['id']].faces.tolist()
-    #                 },
-    #                 "priority": pieza['prioridad'],
-    #                 "help_text": pieza.get('ayuda', ''),
-    #             }
-    #             configuracion_unity["scene_configuration"]["pieces"].append(piece_config)
-    #
-    #         # Convertir configuración a JSON
-    #         json_str = json.dumps(configuracion_unity, separators=(',', ':'), ensure_ascii=False)
-    #
-    #         # Guardar en Firebase
-    #         firebase_instance = FirebaseAppSingleton()
-    #         db = firestore.client(app=firebase_instance.app)
-    #         db.collection("3DModels").add({
-    #             "model": configuracion_unity
-    #         })
-    #
-    #
-    #     return dict(content=json_str, filename="configuracion_unity.json")
-    # except Exception as e:
-    #     import logging
-    #     logging.error(f"Error generating JSON: {e}")
-    return None
+def generar_json(n_clicks, config_data):
+    if not n_clicks:
+        return dash.no_update, dash.no_update
+
+    id_trabajo = cola_exportacion.encolar('utils.exportacion:exportar_escena', {
+        'ruta_stl': PRECONFIGURED_MODEL_PATH,
+        'configuraciones': config_data or {},
+        'colores': colores,
+        'firestore': True,
+        'instancias': EXPORTAR_INSTANCIAS,
+    })
+    return id_trabajo, False
+
+
+# Poll the export job; the file is sent once it is done
+@app.callback(
+    [Output('estado-exportacion', 'children'),
+     Output('download-json', 'data'),
+     Output('progreso-exportacion', 'disabled', allow_duplicate=True)],
+    [Input('progreso-exportacion', 'n_intervals')],
+    [State('trabajo-exportacion', 'data')],
+    prevent_initial_call=True
+)
+def seguir_exportacion(n_intervals, id_trabajo):
+    estado = cola_exportacion.estado(id_trabajo) if id_trabajo else None
+    if estado is None:
+        return '', None, True
+
+    avance = [
+        html.Progress(value=str(estado['progreso']), max='1', style={'width': '250px'}),
+        html.Div(estado['mensaje'])
+    ]
+    if estado['estado'] == LISTO:
+        resultado = estado['resultado']
+        if not os.path.exists(resultado['ruta']):
+            return html.Div('La exportación expiró, genérala de nuevo'), None, True
+        return avance, send_file(resultado['ruta'], filename=resultado['nombre']), True
+    if estado['estado'] == ERROR:
+        return avance, None, True
+    return avance, dash.no_update, False
 
 
 # Main
 if __name__ == '__main__':
+    # The debug reloader re-runs this file in a child process; start the export
+    # workers once, in the parent, which outlives the reloads
+    if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        cola_exportacion.iniciar()
+    else:
+        # The serving child: resend what a previous run left in the journal
+        escrituras_firestore()
     app.run_server(host='0.0.0.0', debug=True, port=8050)
\ No newline at end of file
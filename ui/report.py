@@ -1,10 +1,10 @@
 import json
 from openai import OpenAI
 from Config import Config
+from utils.escena import cargar_escena
 
-# Cargar el archivo JSON
-with open('configuracion_unity25.json', 'r') as file:
-    data = json.load(file)
+# Cargar la escena (JSON v1/v2 o binaria)
+data = cargar_escena('configuracion_unity25.json')
 
 # Configurar el cliente de OpenAI
 client = OpenAI(api_key=Config.OPEN_AI)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import trimesh
+
+# Las pruebas importan los módulos de la aplicación como lo hacen los
+# visores (from utils...), que se ejecutan desde ui/
+UI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if UI not in sys.path:
+    sys.path.insert(0, UI)
+
+ESCENAS = [os.path.join(UI, nombre) for nombre in (
+    'configuracion_unity1.json', 'configuracion_unity16.json',
+    'configuracion_unity25.json', 'configuracion_unity(9).json',
+)]
+
+
+@pytest.fixture
+def ruta_stl(tmp_path, monkeypatch):
+    """STL con dos cubos apilados y una placa aparte; el caché de componentes va a tmp_path"""
+    from utils import stl
+    monkeypatch.setattr(stl, 'DIRECTORIO_CACHE', str(tmp_path / 'cache_stl'))
+    cajas = [trimesh.creation.box(extents=(1, 1, 1)),
+             trimesh.creation.box(extents=(1, 1, 1)).apply_translation((0, 0, 1)),
+             trimesh.creation.box(extents=(2, 2, 0.5)).apply_translation((3, 0, 0))]
+    ruta = tmp_path / 'ensamblaje.stl'
+    trimesh.util.concatenate(cajas).export(ruta)
+    return str(ruta)
+
+
+def comparar_superficies(vertices, caras, vertices_esperados, caras_esperadas, atol):
+    """Los mismos triángulos (con el mismo sentido) a menos de atol, aunque los vértices estén numerados distinto"""
+    from scipy.spatial import cKDTree
+    vertices, vertices_esperados = (np.asarray(v, dtype=float).reshape(-1, 3) for v in (vertices, vertices_esperados))
+    assert vertices.shape == vertices_esperados.shape
+    distancia, correspondencia = cKDTree(vertices_esperados).query(vertices)
+    assert distancia.max() <= atol and len(set(correspondencia.tolist())) == len(vertices)
+
+    def canonicas(caras):
+        return {tuple(t[t.index(min(t)):] + t[:t.index(min(t))]) for t in np.asarray(caras).reshape(-1, 3).tolist()}
+    assert canonicas(correspondencia[np.asarray(caras, dtype=np.int64)]) == canonicas(caras_esperadas)
@@ -0,0 +1,100 @@
+"""
+Cliente de Firestore en memoria, con lo que usan AlmacenEscenas y
+EscrituraDiferida: colecciones, documentos, subcolecciones y lotes.
+fallar_en_commit hace fallar los commits de lote a partir del n-ésimo
+(todos, o solo `fallos` de ellos si se indica).
+"""
+import copy
+import threading
+import uuid
+
+
+class Instantanea:
+    def __init__(self, id, datos):
+        self.id = id
+        self._datos = datos
+        self.exists = datos is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos)
+
+
+class Documento:
+    def __init__(self, cliente, ruta):
+        self._cliente = cliente
+        self.ruta = ruta
+        self.id = ruta[-1]
+
+    def get(self):
+        return Instantanea(self.id, self._cliente.documentos.get(self.ruta))
+
+    def set(self, datos, merge=False):
+        with self._cliente.lock:
+            anteriores = self._cliente.documentos.get(self.ruta) if merge else None
+            self._cliente.documentos[self.ruta] = {**(anteriores or {}), **copy.deepcopy(datos)}
+
+    def delete(self):
+        with self._cliente.lock:
+            self._cliente.documentos.pop(self.ruta, None)
+
+    def collection(self, nombre):
+        return Coleccion(self._cliente, self.ruta + (nombre,))
+
+
+class Coleccion:
+    def __init__(self, cliente, ruta):
+        self._cliente = cliente
+        self.ruta = ruta
+
+    def document(self, id=None):
+        return Documento(self._cliente, self.ruta + (id or uuid.uuid4().hex,))
+
+    def stream(self):
+        return [Instantanea(ruta[-1], datos) for ruta, datos in list(self._cliente.documentos.items())
+                if len(ruta) == len(self.ruta) + 1 and ruta[:-1] == self.ruta]
+
+
+class Lote:
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._operaciones = []
+
+    def set(self, documento, datos, merge=False):
+        self._operaciones.append(lambda: documento.set(datos, merge))
+
+    def delete(self, documento):
+        self._operaciones.append(documento.delete)
+
+    def commit(self):
+        with self._cliente.lock:
+            self._cliente.commits += 1
+            if (self._cliente.fallar_en_commit is not None and self._cliente.commits >= self._cliente.fallar_en_commit
+                    and self._cliente.fallos != 0):
+                if self._cliente.fallos is not None:
+                    self._cliente.fallos -= 1
+                raise ConnectionError('Firestore no disponible')
+        # Un lote se aplica entero o nada
+        for operacion in self._operaciones:
+            operacion()
+
+
+class ClienteFalso:
+    def __init__(self):
+        self.documentos = {}
+        self.lock = threading.RLock()
+        self.commits = 0
+        self.fallar_en_commit = None
+        self.fallos = None
+
+    def collection(self, nombre):
+        return Coleccion(self, (nombre,))
+
+    def document(self, ruta):
+        return Documento(self, tuple(ruta.split('/')))
+
+    def batch(self):
+        return Lote(self)
+
+    def rutas(self, *prefijo):
+        """Rutas de los documentos guardados bajo `prefijo`"""
+        return sorted(ruta for ruta in self.documentos if ruta[:len(prefijo)] == prefijo)
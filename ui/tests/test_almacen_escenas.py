@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import ESCENAS
+from firestore_falso import ClienteFalso
+from utils import AlmacenEscenas as almacen_escenas
+from utils import exportacion
+from utils.AlmacenEscenas import AlmacenEscenas
+from utils.escena import cargar_escena, leer_escena
+
+
+def comparar_piezas(guardadas, originales):
+    assert len(guardadas) == len(originales)
+    for guardada, original in zip(guardadas, originales):
+        guardada = {k: v for k, v in guardada.items() if k != 'content_hash'}
+        np.testing.assert_array_equal(guardada.pop('mesh')['vertices'], original['mesh']['vertices'])
+        # position es {x, y, z}: listas en v1, el centroide en v2
+        posicion = guardada.pop('position')
+        np.testing.assert_allclose([posicion[eje] for eje in 'xyz'], [original['position'][eje] for eje in 'xyz'])
+        assert guardada == {k: v for k, v in original.items() if k not in ('mesh', 'position')}
+
+
+def test_ida_y_vuelta():
+    cliente = ClienteFalso()
+    escena = cargar_escena(ESCENAS[0])
+    almacen = AlmacenEscenas(cliente, max_bytes_documento=50_000)
+    id_escena = almacen.guardar(escena)
+    cargada = almacen.cargar(id_escena)
+    comparar_piezas(cargada['scene_configuration']['pieces'], escena['scene_configuration']['pieces'])
+
+
+def test_guardado_incremental():
+    cliente = ClienteFalso()
+    escena = cargar_escena(ESCENAS[0])
+    almacen = AlmacenEscenas(cliente)
+    id_escena = almacen.guardar(escena)
+    partes = cliente.rutas('3DModels', id_escena, 'piezas')
+
+    escena['scene_configuration']['pieces'][3] = dict(escena['scene_configuration']['pieces'][3], color='#123456')
+    almacen.guardar(escena, id_escena)
+    assert almacen.piezas_subidas == 1
+    # La versión anterior de la pieza se borró; las demás siguen
+    assert len(cliente.rutas('3DModels', id_escena, 'piezas')) == len(partes)
+    comparar_piezas(almacen.cargar(id_escena)['scene_configuration']['pieces'], escena['scene_configuration']['pieces'])
+
+
+@pytest.mark.parametrize('comprimir', [False, True])
+@pytest.mark.parametrize('instancias', [False, True])
+def test_exportacion_sube_las_piezas_desde_el_archivo(ruta_stl, tmp_path, monkeypatch, comprimir, instancias):
+    monkeypatch.setattr(exportacion, 'DIRECTORIO_EXPORTACIONES', str(tmp_path / 'exportaciones'))
+    cliente = ClienteFalso()
+    monkeypatch.setattr(exportacion, 'AlmacenEscenas', lambda: AlmacenEscenas(cliente))
+
+    # La escena exportada no se vuelve a cargar entera para subirla
+    def sin_cargar_entera(*args, **kwargs):
+        raise AssertionError('json.load de la escena exportada')
+    with monkeypatch.context() as parche:
+        parche.setattr(json, 'load', sin_cargar_entera)
+        resultado = exportacion.exportar_escena({'ruta_stl': ruta_stl, 'colores': ['#ff0000'], 'firestore': True,
+                                                 'gzip': comprimir, 'instancias': instancias},
+                                                lambda *_: None)
+
+    (id_escena,) = {ruta[1] for ruta in cliente.rutas('3DModels')}
+    cargada = AlmacenEscenas(cliente).cargar(id_escena)
+    exportada = exportacion.gzip.open(resultado['ruta'], 'rt') if comprimir else open(resultado['ruta'])
+    with exportada:
+        escrita = json.load(exportada)
+    if instancias:
+        escrita = leer_escena(escrita)
+    comparar_piezas(cargada['scene_configuration']['pieces'], escrita['scene_configuration']['pieces'])
+
+
+def test_guardado_fallido_no_deja_piezas_huerfanas(monkeypatch):
+    monkeypatch.setattr(almacen_escenas, 'ESCRITURAS_POR_LOTE', 5)
+    cliente = ClienteFalso()
+    escena = cargar_escena(ESCENAS[0])
+    almacen = AlmacenEscenas(cliente, lotes_en_paralelo=1)
+    id_escena = almacen.guardar(escena)
+    partes = cliente.rutas('3DModels', id_escena, 'piezas')
+
+    # Un guardado nuevo de la misma escena falla en el tercer lote de subidas
+    modificada = cargar_escena(ESCENAS[0])
+    piezas = modificada['scene_configuration']['pieces']
+    for n in range(20):
+        piezas[n] = dict(piezas[n], color=f'#0000{n:02d}')
+    cliente.fallar_en_commit, cliente.fallos = cliente.commits + 3, 1
+    with pytest.raises(ConnectionError):
+        almacen.guardar(modificada, id_escena)
+
+    # Los dos primeros lotes se subieron y se volvieron a borrar
+    assert almacen.piezas_subidas >= 10
+    assert cliente.rutas('3DModels', id_escena, 'piezas') == partes
+    comparar_piezas(almacen.cargar(id_escena)['scene_configuration']['pieces'], escena['scene_configuration']['pieces'])
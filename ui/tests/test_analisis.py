@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+
+from utils import analisis, exportacion
+
+
+def test_se_calcula_una_vez_por_contenido(ruta_stl, monkeypatch):
+    monkeypatch.setattr(analisis, '_lru', type(analisis._lru)())
+    calculado = analisis.analizar_stl(ruta_stl)
+    assert analisis.analizar_stl(ruta_stl) is calculado
+
+    # Otro worker (sin nada en memoria) lo lee del disco, sin recalcular
+    def no_calcular(componentes):
+        raise AssertionError('se recalculó un análisis que ya estaba en disco')
+    monkeypatch.setattr(analisis, '_calcular', no_calcular)
+    monkeypatch.setattr(analisis, '_lru', type(analisis._lru)())
+    leido = analisis.analizar_stl(ruta_stl)
+
+    assert leido['sugerencias'] == calculado['sugerencias']
+    assert len(leido['ocultas']) == len(calculado['ocultas']) == 3
+    for a, b in zip(leido['ocultas'], calculado['ocultas']):
+        np.testing.assert_array_equal(a, b)
+    for niveles_leidos, niveles_calculados in zip(leido['niveles'], calculado['niveles']):
+        assert len(niveles_leidos) == len(niveles_calculados)
+        for (v, c), (v_calc, c_calc) in zip(niveles_leidos, niveles_calculados):
+            np.testing.assert_array_equal(v, v_calc)
+            np.testing.assert_array_equal(c, c_calc)
+    # Los cubos apilados se tapan la cara de contacto
+    assert sum(int((o >= 0).sum()) for o in leido['ocultas']) == 4
+    for punto in ([0, 0, 0.4], [0, 0, 1.6], [3, 0.5, 0.3], [10, 10, 10]):
+        assert leido['indice'].pieza_mas_cercana(punto)[0] == calculado['indice'].pieza_mas_cercana(punto)[0]
+
+
+def test_exportacion_usa_el_orden_del_analisis(ruta_stl, tmp_path, monkeypatch):
+    monkeypatch.setattr(analisis, '_lru', type(analisis._lru)())
+    monkeypatch.setattr(exportacion, 'DIRECTORIO_EXPORTACIONES', str(tmp_path / 'exportaciones'))
+    calculado = analisis.analizar_stl(ruta_stl)
+
+    # La exportación toma el orden del análisis ya hecho en lugar de recalcularlo
+    sugerencias = [{'priority': 10 - n, 'direction': 'de arriba hacia abajo'} for n in range(3)]
+    calculado['sugerencias'] = sugerencias
+    resultado = exportacion.exportar_escena({'ruta_stl': ruta_stl, 'colores': ['#ff0000']}, lambda *_: None)
+    with open(resultado['ruta']) as f:
+        piezas = json.load(f)['scene_configuration']['pieces']
+    assert [{'priority': p['priority'], 'direction': p['direction']} for p in piezas] == sugerencias
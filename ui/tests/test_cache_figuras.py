@@ -0,0 +1,40 @@
+import os
+
+from dash import Patch
+
+from utils.CacheFiguras import CacheFiguras
+
+
+def patch(n):
+    figura = Patch()
+    figura['data'].append({'x': list(range(n))})
+    return figura
+
+
+def test_acierto_en_memoria_devuelve_el_mismo_objeto():
+    cache = CacheFiguras()
+    primera = cache.obtener(('escena', 0, 1), lambda: patch(10))
+    assert cache.obtener(('escena', 0, 1), lambda: patch(99)) is primera
+    assert cache.estadisticas()['aciertos'] == 1 and cache.estadisticas()['fallos'] == 1
+
+
+def test_workers_comparten_el_directorio(tmp_path):
+    # B se crea antes de que A escriba, y aun así encuentra lo que calculó A
+    a = CacheFiguras(directorio=str(tmp_path))
+    b = CacheFiguras(directorio=str(tmp_path))
+    a.obtener(('escena', 0, 1), lambda: patch(10))
+
+    def no_calcular():
+        raise AssertionError('B recalculó una figura que ya estaba en disco')
+    figura = b.obtener(('escena', 0, 1), no_calcular)
+    assert figura['operations'][0]['params']['value'] == {'x': list(range(10))}
+    assert b.estadisticas()['aciertos_disco'] == 1
+
+
+def test_desalojo_de_memoria_y_tope_de_disco(tmp_path):
+    cache = CacheFiguras(max_bytes=300, directorio=str(tmp_path), max_bytes_disco=1000)
+    for paso in range(20):
+        cache.obtener(('escena', paso), lambda: patch(20))
+    estadisticas = cache.estadisticas()
+    assert estadisticas['bytes'] <= 300
+    assert sum(entrada.stat().st_size for entrada in os.scandir(tmp_path)) <= 1000
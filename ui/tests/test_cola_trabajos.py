@@ -0,0 +1,50 @@
+import os
+import time
+
+from utils import ColaTrabajos as modulo_cola
+from utils import exportacion
+from utils.ColaTrabajos import ColaTrabajos, LISTO
+
+
+def trabajo_con_avance(parametros, progreso):
+    for n in range(parametros['pasos']):
+        progreso(n / parametros['pasos'], f'Paso {n}')
+    return {'pasos': parametros['pasos']}
+
+
+def test_encolar_no_arranca_procesos(tmp_path):
+    cola = ColaTrabajos(str(tmp_path / 'cola.sqlite'))
+    id_trabajo = cola.encolar('test_cola_trabajos:trabajo_con_avance', {'pasos': 3})
+    assert cola._trabajadores == []
+    assert cola.estado(id_trabajo)['mensaje'] == 'En cola'
+
+
+def test_progreso_limitado_por_intervalo(tmp_path, monkeypatch):
+    cola = ColaTrabajos(str(tmp_path / 'cola.sqlite'), intervalo_progreso=3600)
+    id_trabajo = cola.encolar('test_cola_trabajos:trabajo_con_avance', {'pasos': 1000})
+
+    escrituras = []
+    actualizar = cola._actualizar
+
+    def contar(id_trabajo, **campos):
+        escrituras.append(campos)
+        actualizar(id_trabajo, **campos)
+    monkeypatch.setattr(cola, '_actualizar', contar)
+    modulo_cola._ejecutar_trabajo(cola, *cola._tomar())
+
+    # La primera actualización y el resultado, no una por paso
+    assert len(escrituras) == 2
+    estado = cola.estado(id_trabajo)
+    assert estado['estado'] == LISTO and estado['resultado'] == {'pasos': 1000}
+
+
+def test_exportaciones_vencidas_se_borran(tmp_path, monkeypatch):
+    monkeypatch.setattr(exportacion, 'DIRECTORIO_EXPORTACIONES', str(tmp_path))
+    vieja, nueva = tmp_path / 'vieja.json', tmp_path / 'nueva.json'
+    vieja.write_text('{}')
+    nueva.write_text('{}')
+    hace_dos_dias = time.time() - 48 * 3600
+    os.utime(vieja, (hace_dos_dias, hace_dos_dias))
+
+    exportacion.limpiar_exportaciones(antiguedad=24)
+    assert not vieja.exists() and nueva.exists()
@@ -0,0 +1,56 @@
+import numpy as np
+import trimesh
+
+from utils import ensamblaje
+
+
+def caja(minimo, maximo):
+    minimo, maximo = np.asarray(minimo, dtype=float), np.asarray(maximo, dtype=float)
+    malla = trimesh.creation.box(extents=maximo - minimo,
+                                 transform=trimesh.transformations.translation_matrix((minimo + maximo) / 2))
+    return malla.vertices, malla.faces
+
+
+def escena(mallas, direcciones):
+    return {'scene_configuration': {'pieces': [
+        {'id': n, 'priority': n, 'direction': direccion,
+         'mesh': {'vertices': np.asarray(v).tolist(), 'faces': np.asarray(c).tolist()}}
+        for n, ((v, c), direccion) in enumerate(zip(mallas, direcciones))]}}
+
+
+def test_eje_vertical_detectado_de_las_caras_de_contacto():
+    # Dos cajas apiladas en z, como las escenas que vienen del CAD
+    apiladas = [caja([0, 0, 0], [2, 2, 1]), caja([0, 0, 1], [2, 2, 2])]
+    assert ensamblaje.detectar_eje_vertical(apiladas) == 2
+
+    assert ensamblaje.validar_ensamblaje(escena(apiladas, ['de abajo hacia arriba', 'de arriba hacia abajo'])) == []
+    conflictos = ensamblaje.validar_ensamblaje(escena(apiladas, ['de abajo hacia arriba', 'de abajo hacia arriba']))
+    assert [c['pieza'] for c in conflictos] == [1]
+    # Con y hacia arriba, como en Unity, la de arriba entra de costado sin chocar
+    assert ensamblaje.validar_ensamblaje(
+        escena(apiladas, ['de abajo hacia arriba', 'de abajo hacia arriba']), eje_vertical=1) == []
+
+
+def test_choque_de_aristas(monkeypatch):
+    # Dos barras en cruz: ningún vértice ni centroide de una cae sobre la otra
+    fija = caja([-5, -0.1, 1], [5, 0.1, 1.2])
+    movil = caja([-0.1, -5, 0], [0.1, 5, 0.2])
+    tolerancia = 1e-6
+
+    assert not ensamblaje.puede_entrar(movil, [fija], 'de arriba hacia abajo', tolerancia, 2)
+    assert ensamblaje.puede_entrar(movil, [fija], 'de abajo hacia arriba', tolerancia, 2)
+
+    monkeypatch.setattr(ensamblaje, '_cruce_aristas', lambda *args: False)
+    assert ensamblaje.puede_entrar(movil, [fija], 'de arriba hacia abajo', tolerancia, 2)
+
+
+def test_columnas_de_esferas():
+    # Como benchmark_ensamblaje.py: cada esfera entra desde abajo y choca con las de abajo de su columna
+    esfera = trimesh.creation.icosphere(subdivisions=1)
+    celdas = list(np.ndindex(2, 2, 3))
+    mallas = [(esfera.vertices + 3.0 * np.array(celda), esfera.faces) for celda in celdas]
+
+    conflictos = ensamblaje.validar_ensamblaje(escena(mallas, ['de abajo hacia arriba'] * len(mallas)), eje_vertical=2)
+    assert [c['pieza'] for c in conflictos] == [n for n, (_, _, k) in enumerate(celdas) if k > 0]
+    assert all(c['bloqueada_por'] == list(range(c['pieza'] - celdas[c['pieza']][2], c['pieza'])) for c in conflictos)
+    assert ensamblaje.validar_ensamblaje(escena(mallas, ['de arriba hacia abajo'] * len(mallas)), eje_vertical=2) == []
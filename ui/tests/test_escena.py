@@ -0,0 +1,59 @@
+import gzip
+import json
+
+import numpy as np
+
+from conftest import ESCENAS, comparar_superficies
+from utils.escena import VERSION_ESQUEMA, cargar_escena, iterar_piezas, leer_escena
+from utils.escena_binaria import cargar_escena_binaria, convertir_json_a_binario
+from utils.instancias import instanciar_escena
+
+
+def escena_v3(tmp_path):
+    escena = cargar_escena(ESCENAS[0])
+    ruta = tmp_path / 'escena_v3.json'
+    ruta.write_text(json.dumps(instanciar_escena(escena)))
+    return escena, str(ruta)
+
+
+def test_convertir_a_binario_una_escena_v3(tmp_path):
+    escena, ruta = escena_v3(tmp_path)
+    binaria = cargar_escena_binaria(convertir_json_a_binario(ruta))
+    piezas = binaria['scene_configuration']['pieces']
+    assert len(piezas) == len(escena['scene_configuration']['pieces'])
+    # Las instancias se rearman con los vértices del original: misma superficie, otra numeración
+    for pieza, original in zip(piezas, escena['scene_configuration']['pieces']):
+        comparar_superficies(pieza['mesh']['vertices'], pieza['mesh']['faces'],
+                             original['mesh']['vertices'], original['mesh']['faces'], atol=5e-3)
+
+
+def test_iterar_piezas_con_las_mallas_despues_de_las_piezas(tmp_path):
+    escena = cargar_escena(ESCENAS[0])
+    instanciada = instanciar_escena(escena)['scene_configuration']
+    # Mismo contenido, con pieces primero y meshes y schema_version al final
+    reordenada = {'pieces': instanciada['pieces'],
+                  **{k: v for k, v in instanciada.items() if k != 'pieces'}}
+    ruta = tmp_path / 'escena_v3.json'
+    ruta.write_text(json.dumps({'scene_configuration': reordenada}))
+
+    piezas = list(iterar_piezas(str(ruta), tam_bloque=1024))
+    originales = escena['scene_configuration']['pieces']
+    assert [p['id'] for p in piezas] == [p['id'] for p in originales]
+    for pieza, original in zip(piezas, originales):
+        comparar_superficies(pieza['mesh']['vertices'], pieza['mesh']['faces'],
+                             original['mesh']['vertices'], original['mesh']['faces'], atol=5e-3)
+        np.testing.assert_allclose([pieza['position'][eje] for eje in 'xyz'],
+                                   [original['position'][eje] for eje in 'xyz'], atol=5e-3)
+
+
+def test_cargar_escena_comprimida(tmp_path):
+    # Como las exportaciones con gzip: cargar_escena las lee igual que iterar_piezas
+    ruta = tmp_path / 'escena.json.gz'
+    with open(ESCENAS[0], 'rb') as original, gzip.open(ruta, 'wb') as comprimida:
+        comprimida.write(original.read())
+    assert cargar_escena(str(ruta)) == cargar_escena(ESCENAS[0])
+
+
+def test_v1_con_version_explicita():
+    escena = leer_escena({'scene_configuration': {'schema_version': 1, 'total_pieces': 0, 'pieces': []}})
+    assert escena['scene_configuration'] == {'schema_version': VERSION_ESQUEMA, 'total_pieces': 0, 'pieces': []}
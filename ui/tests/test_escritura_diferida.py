@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import ESCENAS
+from firestore_falso import ClienteFalso
+from utils.AlmacenEscenas import AlmacenEscenas
+from utils.EscrituraDiferida import EscrituraDiferida
+from utils.escena import cargar_escena
+
+
+def diferida(ruta, cliente):
+    # Sin esperas del hilo: las pruebas envían con vaciar()
+    return EscrituraDiferida(str(ruta), cliente, intervalo=3600, sincronizar=False)
+
+
+def test_escrituras_al_mismo_documento_se_combinan(tmp_path):
+    cliente = ClienteFalso()
+    escrituras = diferida(tmp_path / 'diario.jsonl', cliente)
+    escrituras.guardar_documento('modelos/a', {'color': '#ff0000'})
+    escrituras.guardar_documento('modelos/a', {'color': '#00ff00'})
+    escrituras.guardar_documento('modelos/b', {'color': '#0000ff'}, merge=True)
+    escrituras.guardar_documento('modelos/b', {'prioridad': 3}, merge=True)
+    assert escrituras.pendientes() == 2
+
+    assert escrituras.vaciar()
+    assert cliente.commits == 1
+    assert cliente.documentos == {('modelos', 'a'): {'color': '#00ff00'},
+                                  ('modelos', 'b'): {'color': '#0000ff', 'prioridad': 3}}
+    assert escrituras.pendientes() == 0
+
+
+def test_lo_no_enviado_se_reenvia_al_reiniciar(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    caido = ClienteFalso()
+    caido.fallar_en_commit = 1
+    escrituras = diferida(ruta, caido)
+    escrituras.guardar_documento('modelos/a', {'color': '#ff0000'})
+    escrituras.guardar_escena('escena', cargar_escena(ESCENAS[0]))
+    assert not escrituras.vaciar()
+    assert caido.documentos == {}
+
+    # Mientras el diario está tomado, otra instancia no puede usarlo
+    with pytest.raises(RuntimeError):
+        diferida(ruta, ClienteFalso())
+
+    # Otro proceso (tras un reinicio) lee el diario y envía lo pendiente
+    escrituras.cerrar()
+    cliente = ClienteFalso()
+    reiniciado = diferida(ruta, cliente)
+    assert reiniciado.pendientes() == 2
+    assert reiniciado.vaciar()
+    assert cliente.documentos[('modelos', 'a')] == {'color': '#ff0000'}
+    cargada = AlmacenEscenas(cliente).cargar('escena')
+    assert len(cargada['scene_configuration']['pieces']) == len(cargar_escena(ESCENAS[0])['scene_configuration']['pieces'])
+
+    # Enviado todo, el diario queda vacío y no se vuelve a enviar nada
+    reiniciado.cerrar()
+    assert diferida(ruta, ClienteFalso()).pendientes() == 0
@@ -0,0 +1,50 @@
+import numpy as np
+import trimesh
+from scipy.spatial.transform import Rotation
+
+from conftest import comparar_superficies
+from utils.instancias import detectar_instancias, expandir_pieza, instanciar_piezas
+
+
+def pieza_irregular():
+    puntos = np.random.default_rng(1).normal(size=(40, 3)) * (3.0, 2.0, 1.0)
+    malla = trimesh.convex.convex_hull(puntos)
+    return np.asarray(malla.vertices), np.asarray(malla.faces)
+
+
+def copia_girada_y_renumerada(vertices, caras, rotacion, traslacion, rng):
+    # Vértices en otro orden, cada cara empezando por otro vértice y las caras en otro orden
+    permutacion = rng.permutation(len(vertices))
+    nuevo = np.empty(len(vertices), dtype=np.int64)
+    nuevo[permutacion] = np.arange(len(vertices))
+    copia = (vertices @ rotacion.T + traslacion)[permutacion]
+    caras = np.roll(nuevo[caras], 1, axis=1)[rng.permutation(len(caras))]
+    return copia, caras
+
+
+def test_copia_girada_y_renumerada_es_instancia():
+    rng = np.random.default_rng(2)
+    vertices, caras = pieza_irregular()
+    rotacion = Rotation.from_euler('xyz', (30, -50, 110), degrees=True).as_matrix()
+    copia = copia_girada_y_renumerada(vertices, caras, rotacion, np.array([60.0, -5.0, 12.0]), rng)
+    espejo = (vertices * (-1, 1, 1), caras[:, ::-1])
+
+    asignaciones = detectar_instancias([(vertices, caras), copia, espejo])
+    original, rotacion_hallada, traslacion = asignaciones[1]
+    assert original == 0
+    np.testing.assert_allclose(rotacion_hallada, rotacion, atol=1e-9)
+    # Las reflexiones no son instancias
+    assert asignaciones[2][0] == 2
+
+    piezas = [{'id': n, 'mesh': {'vertices': v.tolist(), 'faces': c.tolist()}}
+              for n, (v, c) in enumerate([(vertices, caras), copia])]
+    meshes, instanciadas = instanciar_piezas(piezas)
+    assert len(meshes) == 1
+    expandida = expandir_pieza(instanciadas[1], meshes)
+    comparar_superficies(expandida['mesh']['vertices'], expandida['mesh']['faces'], *copia, atol=1e-9)
+
+
+def test_mismas_caras_en_otra_forma_no_es_instancia():
+    vertices, caras = pieza_irregular()
+    deformada = vertices * (1.0, 1.0, 1.01)
+    assert [o for o, _, _ in detectar_instancias([(vertices, caras), (deformada, caras)])] == [0, 1]
@@ -0,0 +1,108 @@
+"""
+ModeloGenerador frente a la reconstrucción por paso original (la de
+animation.py antes de los buffers preasignados), paso a paso.
+"""
+import json
+
+import numpy as np
+import pytest
+
+from conftest import ESCENAS
+from utils.ModeloGenerador import ModeloGenerador
+from utils.escena import cargar_escena, iterar_piezas
+from utils.mallas import hex_to_rgb
+
+
+def reconstruccion_original(piezas_generadas):
+    # Copia de ModeloGenerador._reconstruir_modelo_parcial anterior a los buffers
+    x_all, y_all, z_all = [], [], []
+    colores = []
+    i_all, j_all, k_all = [], [], []
+    vertex_offset = 0
+
+    for pieza in piezas_generadas:
+        vertices = np.array(pieza['mesh']['vertices'])
+        faces = np.array(pieza['mesh']['faces'])
+
+        x_all.extend(vertices[:, 0])
+        y_all.extend(vertices[:, 1])
+        z_all.extend(vertices[:, 2])
+
+        rgb_normalized = [c / 255.0 for c in hex_to_rgb(pieza['color'])]
+        colores.extend([rgb_normalized] * len(faces))
+
+        for cara in faces:
+            i_all.append(cara[0] + vertex_offset)
+            j_all.append(cara[1] + vertex_offset)
+            k_all.append(cara[2] + vertex_offset)
+
+        vertex_offset += len(vertices)
+
+    return x_all, y_all, z_all, colores, i_all, j_all, k_all
+
+
+def comparar(obtenido, esperado):
+    assert obtenido is not None
+    for a, b in zip(obtenido, esperado):
+        np.testing.assert_array_equal(np.asarray(a).reshape(len(b), -1), np.asarray(b).reshape(len(b), -1))
+
+
+def piezas_ordenadas(ruta):
+    piezas = cargar_escena(ruta)['scene_configuration']['pieces']
+    return sorted(piezas, key=lambda x: x.get('prioridad', float('inf')))
+
+
+@pytest.fixture(params=ESCENAS, ids=lambda ruta: ruta.rsplit('/', 1)[-1])
+def ruta(request):
+    return request.param
+
+
+@pytest.mark.parametrize('desde_flujo', [False, True], ids=['escena', 'flujo'])
+def test_cada_paso_igual_al_original(ruta, desde_flujo):
+    piezas = piezas_ordenadas(ruta)
+    if desde_flujo:
+        # iterar_piezas entrega las piezas en el orden del archivo; el flujo
+        # supone que ya vienen en orden de ensamblaje
+        modelo = ModeloGenerador.desde_flujo(iter(json.loads(json.dumps(piezas))))
+    else:
+        modelo = ModeloGenerador(cargar_escena(ruta))
+
+    # Hacia adelante, todos los pasos
+    for n in range(len(piezas)):
+        comparar(modelo.generar_siguiente_pieza(), reconstruccion_original(piezas[:n + 1]))
+    assert modelo.generar_siguiente_pieza() is None
+
+    # Hacia atrás, hasta la primera pieza
+    for n in range(len(piezas) - 1, 0, -1):
+        comparar(modelo.generar_pieza_anterior(), reconstruccion_original(piezas[:n]))
+    assert modelo.generar_pieza_anterior() is None
+
+
+def test_flujo_desde_archivo(ruta):
+    # El flujo leído del archivo da la misma geometría que la escena cargada entera
+    escena = ModeloGenerador.desde_flujo(iterar_piezas(ruta))
+    archivo = cargar_escena(ruta)['scene_configuration']['pieces']
+    for n in range(len(archivo)):
+        comparar(escena.generar_siguiente_pieza(), reconstruccion_original(archivo[:n + 1]))
+
+
+def test_vistas_independientes(ruta):
+    modelo = ModeloGenerador.desde_flujo(iterar_piezas(ruta))
+    piezas = cargar_escena(ruta)['scene_configuration']['pieces']
+    a, b = modelo.con_indice(-1), modelo.con_indice(-1)
+    a.generar_siguiente_pieza()
+    a.generar_siguiente_pieza()
+    comparar(b.generar_siguiente_pieza(), reconstruccion_original(piezas[:1]))
+    assert (a.indice_actual, b.indice_actual) == (1, 0)
+
+
+def test_modelo_completo_sin_caras_ocultas(ruta):
+    # El ensamblaje completo es el original sin las caras de contacto ocultas
+    piezas = piezas_ordenadas(ruta)
+    modelo = ModeloGenerador(cargar_escena(ruta))
+    visibles = modelo.ocultantes() < 0
+    x, y, z, colores, i, j, k = reconstruccion_original(piezas)
+    esperado = (x, y, z, np.asarray(colores)[visibles],
+                np.asarray(i)[visibles], np.asarray(j)[visibles], np.asarray(k)[visibles])
+    comparar(modelo.generar_modelo_completo(), esperado)
+    assert modelo.indice_actual == len(piezas) - 1
@@ -0,0 +1,53 @@
+import numpy as np
+
+from utils.ocultas import caras_ocultas
+
+
+def malla(triangulos, z=0.0, hacia_abajo=False):
+    # Triángulos sueltos (x, y) en el plano z, mirando hacia +z o hacia -z
+    vertices = [(x, y, z) for triangulo in triangulos
+                for x, y in (triangulo[::-1] if hacia_abajo else triangulo)]
+    return np.array(vertices, dtype=float), np.arange(len(vertices)).reshape(-1, 3)
+
+
+def cuadrado(x0, y0, x1, y1, otra_diagonal=False):
+    if otra_diagonal:
+        return [((x0, y0), (x1, y0), (x0, y1)), ((x1, y0), (x1, y1), (x0, y1))]
+    return [((x0, y0), (x1, y0), (x1, y1)), ((x0, y0), (x1, y1), (x0, y1))]
+
+
+def test_cara_apoyada_en_una_mayor():
+    # La base de la pieza 1 cubre una zona que cruza la diagonal de la pieza 0
+    arriba = malla(cuadrado(0, 0, 4, 4))
+    abajo = malla(cuadrado(1, 1, 2, 2, otra_diagonal=True), hacia_abajo=True)
+    ocultas = caras_ocultas([arriba, abajo])
+    assert (ocultas[1] == 0).all()
+    assert (ocultas[0] == -1).all()
+
+
+def test_cuadrados_iguales_con_distinta_diagonal():
+    ocultas = caras_ocultas([malla(cuadrado(0, 0, 1, 1)),
+                             malla(cuadrado(0, 0, 1, 1, otra_diagonal=True), hacia_abajo=True)])
+    assert (ocultas[0] == 1).all() and (ocultas[1] == 0).all()
+
+
+def test_cara_que_sobresale():
+    ocultas = caras_ocultas([malla(cuadrado(0, 0, 1, 1)),
+                             malla(cuadrado(0.5, 0, 1.5, 1), hacia_abajo=True)])
+    assert (ocultas[1] == -1).all()
+
+
+def test_esquinas_y_centro_cubiertos_pero_no_toda_la_cara():
+    # Tres triángulos en las esquinas y uno en el centro: las esquinas y el
+    # centroide de la cara caen en la otra pieza, los puntos medios de las aristas no
+    cara = malla([((0, 0), (4, 0), (0, 4))], hacia_abajo=True)
+    parches = malla([((-1, -1), (1.5, -1), (-1, 1.5)), ((3, -1), (5, 0), (3, 1)),
+                     ((-1, 3), (1, 3), (0, 5)), ((0.8, 0.8), (2, 0.8), (0.8, 2))])
+    ocultas = caras_ocultas([parches, cara])
+    assert (ocultas[1] == -1).all()
+
+
+def test_piezas_separadas():
+    ocultas = caras_ocultas([malla(cuadrado(0, 0, 1, 1)),
+                             malla(cuadrado(0, 0, 1, 1), z=0.5, hacia_abajo=True)])
+    assert all((o == -1).all() for o in ocultas)
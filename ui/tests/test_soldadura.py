@@ -0,0 +1,52 @@
+import numpy as np
+import trimesh
+
+from utils import soldadura, stl
+from utils.soldadura import ordenar_para_cache, soldar
+
+
+def fallos_por_cara(caras, tam_cache=16):
+    # Caché FIFO, como la de vértices de la GPU
+    cache, fallos = [], 0
+    for v in np.asarray(caras).ravel():
+        if v not in cache:
+            fallos += 1
+            cache = [v] + cache[:tam_cache - 1]
+    return fallos / len(caras)
+
+
+def rotar_al_menor(triangulo):
+    n = triangulo.index(min(triangulo))
+    return tuple(triangulo[n:] + triangulo[:n])
+
+
+def test_orden_de_caras_para_la_cache():
+    esfera = trimesh.creation.icosphere(subdivisions=3)
+    caras = esfera.faces[np.random.default_rng(0).permutation(len(esfera.faces))]
+
+    orden = ordenar_para_cache(caras)
+    assert sorted(orden.tolist()) == list(range(len(caras)))
+    assert fallos_por_cara(caras[orden]) < 0.75 * fallos_por_cara(caras)
+
+    # Después de soldar quedan los mismos triángulos, con el mismo sentido
+    vertices, soldadas, _ = soldar(esfera.vertices, caras)
+    original = {tuple(v): n for n, v in enumerate(esfera.vertices.tolist())}
+    soldadas = np.array([original[tuple(v)] for v in vertices.tolist()])[soldadas]
+    assert {rotar_al_menor(t) for t in soldadas.tolist()} == {rotar_al_menor(t) for t in caras.tolist()}
+
+
+def test_soldar_componentes_en_procesos(monkeypatch):
+    componentes = [trimesh.creation.icosphere(subdivisions=n) for n in (1, 2, 3, 2, 1)]
+    secuencial, datos = soldadura.soldar_componentes(componentes)
+    paralelo, datos_paralelo = soldadura.soldar_componentes(componentes, procesos=2)
+    assert datos == datos_paralelo
+    for a, b in zip(secuencial, paralelo):
+        assert np.array_equal(a.vertices, b.vertices) and np.array_equal(a.faces, b.faces)
+
+    # Por encima del umbral las caras se dejan en su orden, y el caché lo distingue
+    clave = stl.clave_cache('abc')
+    monkeypatch.setattr(soldadura, 'MAX_CARAS_ORDEN', 0)
+    assert stl.clave_cache('abc') != clave
+    esfera = componentes[2]
+    vertices, caras, _ = soldadura.soldar(esfera.vertices, esfera.faces)
+    assert np.array_equal(vertices[caras], esfera.vertices[esfera.faces])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import trimesh
+
+from conftest import comparar_superficies
+from utils import stl
+
+
+def test_cargar_componentes_devuelve_copias(ruta_stl):
+    primera = stl.cargar_componentes(ruta_stl)
+    vertices = primera[0].vertices.copy()
+    primera[0].vertices += 100
+
+    segunda = stl.cargar_componentes(ruta_stl)
+    assert segunda[0] is not primera[0]
+    np.testing.assert_array_equal(segunda[0].vertices, vertices)
+
+
+def test_lectura_binaria_igual_a_trimesh(ruta_stl, tmp_path):
+    vertices, caras = stl.leer_stl_binario(ruta_stl)
+    esperada = trimesh.load_mesh(ruta_stl)
+    assert vertices.dtype == np.float64 and caras.dtype == np.int64
+    # Las esquinas idénticas quedan soldadas y las caras en el orden del archivo
+    comparar_superficies(vertices, caras, esperada.vertices, esperada.faces, atol=0)
+    np.testing.assert_array_equal(vertices[caras], esperada.vertices[esperada.faces])
+
+    # Sin triángulos: una malla vacía
+    vacio = tmp_path / 'vacio.stl'
+    vacio.write_bytes(bytes(80) + np.uint32(0).tobytes())
+    vertices, caras = stl.leer_stl_binario(str(vacio))
+    assert vertices.shape == (0, 3) and caras.shape == (0, 3)
+
+    # Truncado (o más corto que la cabecera): no es un STL binario válido
+    with open(ruta_stl, 'rb') as f:
+        contenido = f.read()
+    for n, largo in enumerate((len(contenido) - 10, 50)):
+        truncado = tmp_path / f'truncado{n}.stl'
+        truncado.write_bytes(contenido[:largo])
+        with pytest.raises(ValueError):
+            stl.leer_stl_binario(str(truncado))
+
+
+def test_separar_en_procesos_igual_a_split(ruta_stl, monkeypatch):
+    def triangulos(malla):
+        return {tuple(sorted(map(tuple, t))) for t in np.asarray(malla.vertices)[malla.faces].tolist()}
+
+    esperadas = stl.cargar_stl(ruta_stl).split()
+
+    # Con el umbral en 0 se usa el pool aunque la malla sea chica, nunca mesh.split()
+    monkeypatch.setattr(stl, 'MIN_CARAS_PARALELO', 0)
+    monkeypatch.setattr(trimesh.Trimesh, 'split', lambda *args, **kwargs: pytest.fail('se usó mesh.split()'))
+    # Los cubos apilados se tocan en aristas de cuatro caras, que no los unen
+    separadas = stl.separar_malla(stl.cargar_stl(ruta_stl), procesos=2)
+    assert len(separadas) == len(esperadas) == 3
+    assert [triangulos(m) for m in separadas] == [triangulos(m) for m in esperadas]
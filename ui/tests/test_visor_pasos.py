@@ -0,0 +1,112 @@
+import importlib
+import json
+import logging
+import os
+
+import numpy as np
+import pytest
+from plotly.io.json import to_json_plotly
+
+from conftest import ESCENAS, UI
+from utils.VisorPasos import VisorPasos
+from utils.codificacion import decodificar_arreglo
+from utils.escena import cargar_escena
+
+
+def aplicar(figura, patch):
+    # Las operaciones de dash.Patch que usan los visores, sobre figura['data']
+    for operacion in patch['operations']:
+        ubicacion, valor = operacion['location'], operacion['params'].get('value')
+        destino = figura
+        for clave in ubicacion[:-1]:
+            destino = destino[clave]
+        if operacion['operation'] == 'Assign':
+            destino[ubicacion[-1]] = valor
+        elif operacion['operation'] == 'Append':
+            destino[ubicacion[-1]].append(valor)
+        elif operacion['operation'] == 'Delete':
+            del destino[ubicacion[-1]]
+        else:
+            raise AssertionError(operacion['operation'])
+
+
+def caras_traza(traza):
+    return len(decodificar_arreglo(traza['i']))
+
+
+@pytest.fixture(scope='module')
+def visor():
+    return VisorPasos(ESCENAS[0])
+
+
+def test_pasos_en_cualquier_orden(visor):
+    # Cualquier secuencia de pasos deja en pantalla exactamente las trazas del paso final
+    # Con el flujo, piezas_originales se llena a medida que se leen
+    total = len(cargar_escena(ESCENAS[0])['scene_configuration']['pieces'])
+    figura = {'data': []}
+    mostradas = 0
+    for destino in (1, 3, 2, total, total - 1, 0, total, 1):
+        aplicar(figura, json.loads(to_json_plotly(visor.diferencia_pasos(mostradas, destino))))
+        mostradas = destino
+        assert len(figura['data']) == destino
+        completo = visor.modelo_generador.ensamblaje_completo(destino)
+        for indice, traza in enumerate(figura['data']):
+            esperada = visor.crear_traza_pieza(indice, sin_ocultas=completo)
+            assert caras_traza(traza) == caras_traza(esperada)
+            assert traza['opacity'] == esperada['opacity']
+            np.testing.assert_array_equal(decodificar_arreglo(traza['x']), decodificar_arreglo(esperada['x']))
+
+
+@pytest.mark.parametrize('modulo', ['animation', 'x'])
+def test_visores_registran_los_callbacks(modulo, monkeypatch):
+    monkeypatch.chdir(UI)
+    visor = importlib.import_module(modulo)
+    assert any('grafica-3d.figure' in salida for salida in visor.app.callback_map)
+    assert visor.visor.trazas_iniciales() == []
+
+
+def test_i2_sin_reproduccion_en_cliente_avisa(caplog):
+    # Sin assets/reproduccion.js nadie decodifica 'i2': se envía 'f4' y queda el aviso
+    with caplog.at_level(logging.WARNING):
+        assert VisorPasos(ESCENAS[0], codificacion='i2').codificacion == 'f4'
+    assert any("'i2'" in registro.getMessage() for registro in caplog.records)
+
+    caplog.clear()
+    assert VisorPasos(ESCENAS[0], reproduccion_en_cliente=True, codificacion='i2').codificacion == 'i2'
+    assert not caplog.records
+    with pytest.raises(ValueError):
+        VisorPasos(ESCENAS[0], codificacion='f8')
+
+
+def test_recarga_envia_solo_las_piezas_que_cambiaron(tmp_path):
+    ruta = tmp_path / 'escena.json'
+    escena = cargar_escena(ESCENAS[0])
+    piezas = escena['scene_configuration']['pieces']
+    ruta.write_text(json.dumps(escena))
+    visor = VisorPasos(str(ruta))
+    assert visor.recargar() is None
+    version = visor.hash_escena
+
+    # Cambia el color de una pieza y desaparecen las del final
+    piezas[2]['color'] = '#123456'
+    eliminadas = [pieza['id'] for pieza in piezas[6:]]
+    del piezas[6:]
+    ruta.write_text(json.dumps(escena))
+    os.utime(ruta, ns=(0, 0))
+    assert visor.recargar() == {'agregadas': [], 'eliminadas': eliminadas,
+                                'modificadas': [piezas[2]['id']], 'iguales': 5}
+
+    # Con parte del ensamblaje a la vista solo viaja la pieza modificada
+    patch, piezas_visibles = visor.diferencia_versiones(version, 5)
+    patch = json.loads(to_json_plotly(patch))
+    assert piezas_visibles == 5
+    assert [(o['operation'], o['location']) for o in patch['operations']] == [('Assign', ['data', 2])]
+
+    # Con más piezas a la vista de las que quedan se quitan las que sobran; el
+    # ensamblaje queda completo, así que las demás se reenvían sin caras ocultas
+    figura = {'data': [None] * 8}
+    patch, piezas_visibles = visor.diferencia_versiones(version, 8)
+    aplicar(figura, json.loads(to_json_plotly(patch)))
+    assert piezas_visibles == 6
+    assert figura['data'] == [json.loads(to_json_plotly(visor.crear_traza_pieza(indice, sin_ocultas=True)))
+                              for indice in range(6)]
@@ -0,0 +1,246 @@
+import json
+import logging
+import struct
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from utils.escena import VERSION_ESQUEMA
+from utils.instancias import VERSION_INSTANCIAS, expandir_pieza
+from utils.mallas import centroide
+from utils.versiones import hash_pieza
+
+# Firestore admite documentos de hasta 1 MiB; se deja margen para los demás campos
+MAX_BYTES_DOCUMENTO = 900_000
+
+# Límites de un lote de escrituras (cantidad de documentos y tamaño del pedido)
+ESCRITURAS_POR_LOTE = 500
+MAX_BYTES_LOTE = 9_000_000
+
+FORMATO = 2
+
+_CABECERA_PIEZA = struct.Struct('<QQQ')
+
+# Entrada del índice del manifiesto: hash de la pieza y cantidad de partes
+_ENTRADA_INDICE = struct.Struct('<16sH')
+
+
+class AlmacenEscenas:
+    """
+    Guarda escenas de Unity en Firestore repartidas en varios documentos.
+
+    Una escena real supera el límite de 1 MiB por documento (y Firestore no
+    admite arreglos anidados como mesh.vertices), así que se guarda como:
+
+        <coleccion>/<id>                      manifiesto: metadatos de la escena
+                                              y la lista de piezas (sus hashes)
+        <coleccion>/<id>/piezas/<hash>-<n>    cada pieza, en partes de hasta
+                                              MAX_BYTES_DOCUMENTO
+
+    Cada pieza se serializa a un bloque binario comprimido (sus campos en
+    JSON, vértices float64 y caras int64) guardado bajo su hash de contenido
+    (versiones.hash_pieza). Al volver a guardar una escena solo se suben las
+    piezas cuyo hash no estaba, y después del manifiesto se borran las que
+    ya nadie usa. Las escrituras van en lotes (batch) con a lo sumo
+    `lotes_en_paralelo` lotes en vuelo; el manifiesto se escribe al final,
+    así que un lector nunca ve piezas a medio subir. Si el guardado falla,
+    se borran las piezas que alcanzó a subir.
+
+    El cliente de Firestore respeta FIRESTORE_EMULATOR_HOST, de modo que con
+    el emulador local (firebase emulators:start --only firestore) todo esto
+    se prueba sin tocar el proyecto real; las pruebas usan además un cliente
+    en memoria (tests/firestore_falso.py).
+    """
+
+    def __init__(self, cliente=None, coleccion='3DModels', lotes_en_paralelo=4,
+                 max_bytes_documento=MAX_BYTES_DOCUMENTO):
+        self._cliente = cliente
+        self.coleccion = coleccion
+        self.lotes_en_paralelo = lotes_en_paralelo
+        self.max_bytes_documento = max_bytes_documento
+        # Piezas subidas en el último guardar(), para medir las subidas incrementales
+        self.piezas_subidas = 0
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            # Import diferido: firebase_admin solo hace falta si no se pasa un cliente
+            from utils.FirestoreSingleton import FirestoreSingleton
+            self._cliente = FirestoreSingleton().client
+        return self._cliente
+
+    def guardar(self, config_data, id_escena=None):
+        """
+        Guarda la escena (dict v1, v2 o v3) y devuelve el id de su documento.
+        Las piezas pueden ser cualquier iterable, p. ej. iterar_piezas(ruta):
+        se suben a medida que llegan, sin tenerlas todas en memoria. Si la
+        escena ya existía, solo se suben las piezas nuevas o modificadas.
+        """
+        escena = dict(config_data['scene_configuration'])
+        piezas = escena.pop('pieces')
+        if escena.get('schema_version') == VERSION_INSTANCIAS:
+            # Cada pieza se guarda con su propia malla; la escena queda en v2
+            meshes = escena.pop('meshes')
+            escena['schema_version'] = VERSION_ESQUEMA
+            piezas = (expandir_pieza(pieza, meshes) for pieza in piezas)
+
+        documento = self.cliente.collection(self.coleccion).document(id_escena)
+        anteriores = {}
+        if id_escena is not None:
+            manifiesto = documento.get().to_dict()
+            if manifiesto is not None and manifiesto.get('formato') == FORMATO:
+                anteriores = dict(_leer_indice(manifiesto['indice']))
+
+        indice = []
+        subidas = dict(anteriores)
+        nuevos = []
+        self.piezas_subidas = 0
+
+        def documentos_nuevos():
+            for pieza in piezas:
+                digest = bytes.fromhex(hash_pieza(pieza))
+                if digest not in subidas:
+                    bloque = _bloque_pieza(pieza)
+                    partes = range(0, max(len(bloque), 1), self.max_bytes_documento)
+                    subidas[digest] = len(partes)
+                    self.piezas_subidas += 1
+                    for n, inicio in enumerate(partes):
+                        nuevos.append(f"{digest.hex()}-{n}")
+                        yield nuevos[-1], bloque[inicio:inicio + self.max_bytes_documento]
+                indice.append((digest, subidas[digest]))
+
+        try:
+            self._escribir(documento.collection('piezas'), documentos_nuevos())
+            documento.set({'formato': FORMATO, 'escena': json.dumps(escena, ensure_ascii=False),
+                           'total_pieces': len(indice),
+                           'indice': b''.join(_ENTRADA_INDICE.pack(*entrada) for entrada in indice)})
+        except Exception:
+            # Ningún manifiesto apunta a las piezas de este intento: se borran
+            # (las que no llegaron a escribirse no molestan) y sigue el error
+            try:
+                self._borrar(documento.collection('piezas'), nuevos)
+            except Exception as e:
+                logging.error(f"No se pudieron borrar las piezas del guardado fallido de {documento.id}: {e}")
+            raise
+
+        # Piezas que ya no usa la escena; borrarlas después del manifiesto
+        # evita que un lector de la versión nueva no las encuentre
+        en_uso = {digest for digest, _ in indice}
+        self._borrar(documento.collection('piezas'),
+                     [f"{digest.hex()}-{n}" for digest, partes in anteriores.items()
+                      if digest not in en_uso for n in range(partes)])
+        return documento.id
+
+    def cargar(self, id_escena):
+        """
+        La escena guardada con guardar(), como dict con el mismo esquema; cada
+        pieza trae además su content_hash.
+        """
+        documento = self.cliente.collection(self.coleccion).document(id_escena)
+        manifiesto = documento.get().to_dict()
+        if manifiesto is None:
+            raise KeyError(f"No existe la escena {id_escena}")
+        if manifiesto.get('formato') != FORMATO:
+            raise ValueError(f"Formato de escena no soportado: {manifiesto.get('formato')}")
+
+        indice = _leer_indice(manifiesto['indice'])
+        partes = {}
+        for parte in documento.collection('piezas').stream():
+            partes[parte.id] = parte.to_dict()['datos']
+
+        escena = json.loads(manifiesto['escena'])
+        version_esquema = escena.get('schema_version', 1)
+        piezas = []
+        for digest, n_partes in indice:
+            nombres = [f"{digest.hex()}-{n}" for n in range(n_partes)]
+            faltantes = [nombre for nombre in nombres if nombre not in partes]
+            if faltantes:
+                # Un guardado posterior borró piezas de esta versión: se puede reintentar
+                raise ValueError(f"La escena {id_escena} cambió durante la lectura")
+            pieza = _pieza_desde_bloque(b''.join(partes[nombre] for nombre in nombres), version_esquema)
+            pieza['content_hash'] = digest.hex()
+            piezas.append(pieza)
+        escena['pieces'] = piezas
+        return {'scene_configuration': escena}
+
+    def borrar(self, id_escena):
+        """Borra el manifiesto y todas las piezas de una escena"""
+        documento = self.cliente.collection(self.coleccion).document(id_escena)
+        piezas = documento.collection('piezas')
+        self._borrar(piezas, [parte.id for parte in piezas.stream()])
+        documento.delete()
+
+    def _escribir(self, coleccion, documentos):
+        # Escribe los pares (nombre, datos) en lotes, con a lo sumo
+        # lotes_en_paralelo lotes esperando respuesta a la vez
+        with ThreadPoolExecutor(max_workers=self.lotes_en_paralelo) as ejecutor:
+            en_vuelo = set()
+            for lote in _lotes(documentos):
+                if len(en_vuelo) >= self.lotes_en_paralelo:
+                    hechos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for hecho in hechos:
+                        hecho.result()
+                escritura = self.cliente.batch()
+                for nombre, datos in lote:
+                    escritura.set(coleccion.document(nombre), {'datos': datos})
+                en_vuelo.add(ejecutor.submit(escritura.commit))
+            for hecho in wait(en_vuelo).done:
+                hecho.result()
+
+    def _borrar(self, coleccion, nombres):
+        for inicio in range(0, len(nombres), ESCRITURAS_POR_LOTE):
+            escritura = self.cliente.batch()
+            for nombre in nombres[inicio:inicio + ESCRITURAS_POR_LOTE]:
+                escritura.delete(coleccion.document(nombre))
+            escritura.commit()
+
+
+def _lotes(documentos):
+    # Agrupa documentos en lotes que respetan los límites de un batch de Firestore
+    lote, tam = [], 0
+    for nombre, datos in documentos:
+        if lote and (len(lote) >= ESCRITURAS_POR_LOTE or tam + len(datos) > MAX_BYTES_LOTE):
+            yield lote
+            lote, tam = [], 0
+        lote.append((nombre, datos))
+        tam += len(datos)
+    if lote:
+        yield lote
+
+
+def _leer_indice(datos):
+    return [_ENTRADA_INDICE.unpack_from(datos, inicio) for inicio in range(0, len(datos), _ENTRADA_INDICE.size)]
+
+
+def _bloque_pieza(pieza):
+    # Campos de la pieza en JSON (en su orden, sin la geometría) seguidos de
+    # vértices float64 y caras int64, todo comprimido. position se deriva de
+    # los vértices y content_hash es el nombre del bloque: se rearman al cargar
+    vertices = np.ascontiguousarray(np.asarray(pieza['mesh']['vertices'], dtype='<f8').reshape(-1, 3))
+    caras = np.ascontiguousarray(np.asarray(pieza['mesh']['faces'], dtype='<i8').reshape(-1, 3))
+    campos = {k: v for k, v in pieza.items() if k != 'content_hash'}
+    campos['mesh'] = None
+    if 'position' in campos:
+        campos['position'] = None
+    texto = json.dumps(campos, ensure_ascii=False).encode('utf-8')
+    return zlib.compress(_CABECERA_PIEZA.pack(len(texto), len(vertices), len(caras))
+                         + texto + vertices.tobytes() + caras.tobytes(), 1)
+
+
+def _pieza_desde_bloque(bloque, version_esquema):
+    datos = zlib.decompress(bloque)
+    tam_texto, n_vertices, n_caras = _CABECERA_PIEZA.unpack_from(datos)
+    inicio = _CABECERA_PIEZA.size
+    pieza = json.loads(datos[inicio:inicio + tam_texto].decode('utf-8'))
+    inicio += tam_texto
+    vertices = np.frombuffer(datos, dtype='<f8', count=3 * n_vertices, offset=inicio).reshape(-1, 3)
+    caras = np.frombuffer(datos, dtype='<i8', count=3 * n_caras, offset=inicio + vertices.nbytes).reshape(-1, 3)
+
+    pieza['mesh'] = {'vertices': vertices.tolist(), 'faces': caras.tolist()}
+    if 'position' in pieza:
+        if version_esquema == 1:
+            pieza['position'] = {eje: vertices[:, n].tolist() for n, eje in enumerate('xyz')}
+        else:
+            pieza['position'] = centroide(vertices)
+    return pieza
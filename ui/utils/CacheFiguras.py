@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+
+
+class CacheFiguras:
+    """
+    Figuras por clave, p. ej. (hash de la escena, paso, opciones de render),
+    con tope de bytes en memoria (medidos serializadas) y desalojo LRU. En
+    memoria queda el objeto que devolvió calcular() (un Patch o un dict), así
+    que un acierto lo entrega sin volver a parsear JSON; Dash lo serializa
+    una vez al responder.
+
+    Con `directorio`, cada figura calculada se escribe también a disco (JSON,
+    un archivo por clave) y, si no está en memoria, se busca primero el
+    archivo: los workers que comparten el directorio aprovechan lo que
+    calculó cualquiera de ellos. El tope de disco es aproximado: se revisa el
+    directorio cuando lo escrito lo supera y se borran los archivos usados
+    hace más tiempo. Los contadores de aciertos (en memoria y en disco) y
+    fallos están en estadisticas().
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directorio=None, max_bytes_disco=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()
+        self._bytes = 0
+        self._bytes_disco = 0
+        self.aciertos = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+        if directorio is not None:
+            os.makedirs(directorio, exist_ok=True)
+            self._recortar_disco()
+
+    def obtener(self, clave, calcular):
+        """La figura de `clave`; si no está, la calcula con calcular()"""
+        digest = hashlib.blake2b(repr(clave).encode('utf-8'), digest_size=16).hexdigest()
+        with self._lock:
+            if digest in self._memoria:
+                self._memoria.move_to_end(digest)
+                self.aciertos += 1
+                return self._memoria[digest][0]
+
+        # El disco se lee y se escribe fuera del lock
+        leida = self._leer_disco(digest) if self.directorio is not None else None
+        if leida is not None:
+            figura, tam = leida
+        else:
+            # Dos pedidos iguales a la vez calculan dos veces
+            figura = calcular()
+            datos = to_json_plotly(figura).encode('utf-8')
+            tam = len(datos)
+            if self.directorio is not None and tam <= self.max_bytes_disco:
+                self._escribir_disco(digest, datos)
+
+        with self._lock:
+            if leida is not None:
+                self.aciertos_disco += 1
+            else:
+                self.fallos += 1
+            if digest not in self._memoria:
+                self._memoria[digest] = (figura, tam)
+                self._bytes += tam
+            # Las menos usadas salen de memoria (si hay directorio, en disco ya están)
+            while self._bytes > self.max_bytes and self._memoria:
+                _, (_, tam_viejo) = self._memoria.popitem(last=False)
+                self._bytes -= tam_viejo
+            recortar = self._bytes_disco > self.max_bytes_disco
+
+        if recortar:
+            self._recortar_disco()
+        return figura
+
+    def estadisticas(self):
+        with self._lock:
+            return {'aciertos': self.aciertos, 'aciertos_disco': self.aciertos_disco, 'fallos': self.fallos,
+                    'entradas': len(self._memoria), 'bytes': self._bytes, 'bytes_disco': self._bytes_disco}
+
+    def _ruta(self, digest):
+        return os.path.join(self.directorio, f"{digest}.json")
+
+    def _leer_disco(self, digest):
+        try:
+            with open(self._ruta(digest), 'rb') as archivo:
+                datos = archivo.read()
+            # La fecha de modificación hace de "último uso" para el recorte
+            os.utime(self._ruta(digest))
+        except FileNotFoundError:
+            # Nadie la calculó todavía, o se borró en un recorte
+            return None
+        return json.loads(datos), len(datos)
+
+    def _escribir_disco(self, digest, datos):
+        # Escribir a un temporal y renombrar, para que otro worker nunca lea un archivo a medias
+        temporal = f"{self._ruta(digest)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, self._ruta(digest))
+        with self._lock:
+            self._bytes_disco += len(datos)
+
+    def _recortar_disco(self):
+        # Lo que hay en el directorio (de todos los workers), del usado hace más tiempo al más reciente
+        archivos = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith('.json'):
+                try:
+                    estado = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        archivos.sort()
+        total = sum(tam for _, tam, _ in archivos)
+        for _, tam, ruta in archivos:
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tam
+        with self._lock:
+            self._bytes_disco = total
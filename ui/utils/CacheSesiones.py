@@ -0,0 +1,90 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class CacheSesiones:
+    """
+    Estado por sesión con expiración (TTL), desalojo LRU y tope de memoria.
+
+    Sin ruta, el estado vive en el proceso. Con ruta se guarda en un archivo
+    SQLite que comparten todos los workers (p. ej. gunicorn con varios
+    procesos), así que cualquier worker puede atender cualquier sesión.
+    """
+
+    def __init__(self, ruta=None, ttl=3600, max_sesiones=10000, max_bytes=64 * 1024 * 1024):
+        self.ruta = ruta or ':memory:'
+        self.ttl = ttl
+        self.max_sesiones = max_sesiones
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+
+    def _conectar(self):
+        # Una conexión por proceso: tras un fork la heredada no se reutiliza
+        if self._conexion is None or self._pid != os.getpid():
+            self._conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False,
+                                             isolation_level=None)
+            if self.ruta != ':memory:':
+                self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute(
+                'CREATE TABLE IF NOT EXISTS sesiones ('
+                'id TEXT PRIMARY KEY, valor BLOB NOT NULL, acceso REAL NOT NULL, tam INTEGER NOT NULL)'
+            )
+            self._conexion.execute('CREATE INDEX IF NOT EXISTS sesiones_acceso ON sesiones (acceso)')
+            self._pid = os.getpid()
+        return self._conexion
+
+    def obtener(self, id_sesion, por_defecto=None):
+        ahora = time.time()
+        with self._lock:
+            conexion = self._conectar()
+            fila = conexion.execute('SELECT valor, acceso FROM sesiones WHERE id = ?',
+                                    (id_sesion,)).fetchone()
+            if fila is None:
+                return por_defecto
+            if fila[1] < ahora - self.ttl:
+                conexion.execute('DELETE FROM sesiones WHERE id = ?', (id_sesion,))
+                return por_defecto
+            conexion.execute('UPDATE sesiones SET acceso = ? WHERE id = ?', (ahora, id_sesion))
+        return pickle.loads(fila[0])
+
+    def guardar(self, id_sesion, valor):
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute('BEGIN IMMEDIATE')
+            try:
+                conexion.execute('INSERT OR REPLACE INTO sesiones (id, valor, acceso, tam) VALUES (?, ?, ?, ?)',
+                                 (id_sesion, datos, time.time(), len(datos)))
+                self._desalojar(conexion)
+                conexion.execute('COMMIT')
+            except BaseException:
+                conexion.execute('ROLLBACK')
+                raise
+
+    def eliminar(self, id_sesion):
+        with self._lock:
+            self._conectar().execute('DELETE FROM sesiones WHERE id = ?', (id_sesion,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conectar().execute('SELECT COUNT(*) FROM sesiones').fetchone()[0]
+
+    def _desalojar(self, conexion):
+        # Primero las expiradas, luego las menos usadas hasta respetar los topes
+        conexion.execute('DELETE FROM sesiones WHERE acceso < ?', (time.time() - self.ttl,))
+        conexion.execute(
+            'DELETE FROM sesiones WHERE id IN ('
+            'SELECT id FROM sesiones ORDER BY acceso DESC LIMIT -1 OFFSET ?)',
+            (self.max_sesiones,)
+        )
+        conexion.execute(
+            'DELETE FROM sesiones WHERE id IN ('
+            'SELECT id FROM (SELECT id, SUM(tam) OVER (ORDER BY acceso DESC) AS acumulado FROM sesiones) '
+            'WHERE acumulado > ?)',
+            (self.max_bytes,)
+        )
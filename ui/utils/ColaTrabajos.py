@@ -0,0 +1,181 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+LISTO = 'listo'
+ERROR = 'error'
+
+# Segundos mínimos entre dos escrituras del progreso de un trabajo
+INTERVALO_PROGRESO = 1.0
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos en segundo plano guardada en un archivo SQLite.
+
+    Los trabajos se ejecutan en procesos aparte (con menor prioridad que el
+    servidor), así que varias exportaciones pueden correr a la vez sin
+    quitarle CPU ni GIL a los callbacks interactivos. Cada trabajo es una
+    función 'modulo:funcion' que recibe sus parámetros (JSON) y una función
+    progreso(fraccion, mensaje), y devuelve un resultado JSON. Como la cola
+    vive en disco, cualquier worker de gunicorn puede consultar cualquier
+    trabajo, y los que quedaron a medias al reiniciar se vuelven a encolar.
+
+    encolar no arranca procesos: los trabajadores se inician una sola vez,
+    con iniciar() desde un único proceso o aparte, con
+    python -m utils.ColaTrabajos .trabajos.sqlite
+    """
+
+    def __init__(self, ruta, procesos=2, espera=0.5, intervalo_progreso=INTERVALO_PROGRESO):
+        self.ruta = ruta
+        self.procesos = procesos
+        self.espera = espera
+        self.intervalo_progreso = intervalo_progreso
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+        self._trabajadores = []
+
+    def _conectar(self):
+        # Una conexión por proceso: tras un fork la heredada no se reutiliza
+        if self._conexion is None or self._pid != os.getpid():
+            self._conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False,
+                                             isolation_level=None)
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute(
+                'CREATE TABLE IF NOT EXISTS trabajos ('
+                'id TEXT PRIMARY KEY, funcion TEXT NOT NULL, parametros TEXT NOT NULL, '
+                'estado TEXT NOT NULL, progreso REAL NOT NULL, mensaje TEXT NOT NULL, '
+                'resultado TEXT, pid INTEGER, creado REAL NOT NULL, actualizado REAL NOT NULL)'
+            )
+            self._conexion.execute('CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, creado)')
+            self._pid = os.getpid()
+        return self._conexion
+
+    def _ejecutar(self, sql, parametros=()):
+        with self._lock:
+            return self._conectar().execute(sql, parametros).fetchall()
+
+    def encolar(self, funcion, parametros):
+        """Agrega un trabajo y devuelve su id"""
+        id_trabajo = uuid.uuid4().hex
+        ahora = time.time()
+        self._ejecutar(
+            'INSERT INTO trabajos (id, funcion, parametros, estado, progreso, mensaje, creado, actualizado) '
+            'VALUES (?, ?, ?, ?, 0, ?, ?, ?)',
+            (id_trabajo, funcion, json.dumps(parametros), PENDIENTE, 'En cola', ahora, ahora)
+        )
+        return id_trabajo
+
+    def estado(self, id_trabajo):
+        """{'estado', 'progreso', 'mensaje', 'resultado'} del trabajo, o None si no existe"""
+        filas = self._ejecutar('SELECT estado, progreso, mensaje, resultado FROM trabajos WHERE id = ?',
+                               (id_trabajo,))
+        if not filas:
+            return None
+        estado, progreso, mensaje, resultado = filas[0]
+        return {'estado': estado, 'progreso': progreso, 'mensaje': mensaje,
+                'resultado': None if resultado is None else json.loads(resultado)}
+
+    def iniciar(self):
+        """Arranca los procesos trabajadores de este proceso, si no están corriendo"""
+        self._trabajadores = [p for p in self._trabajadores if p.is_alive()]
+        if self._trabajadores:
+            return
+        self._reencolar_huerfanos()
+        contexto = multiprocessing.get_context('spawn')
+        for _ in range(self.procesos):
+            proceso = contexto.Process(target=_trabajar, args=(self.ruta, self.espera, self.intervalo_progreso),
+                                       daemon=True)
+            proceso.start()
+            self._trabajadores.append(proceso)
+
+    def _reencolar_huerfanos(self):
+        # Trabajos en curso cuyo proceso ya no existe (p. ej. tras un reinicio)
+        for id_trabajo, pid in self._ejecutar('SELECT id, pid FROM trabajos WHERE estado = ?', (EN_CURSO,)):
+            if not _proceso_vivo(pid):
+                self._ejecutar('UPDATE trabajos SET estado = ?, mensaje = ? WHERE id = ? AND estado = ?',
+                               (PENDIENTE, 'En cola', id_trabajo, EN_CURSO))
+
+    def _tomar(self):
+        # Reserva atómicamente el trabajo pendiente más antiguo
+        filas = self._ejecutar(
+            'UPDATE trabajos SET estado = ?, pid = ?, actualizado = ? '
+            'WHERE id = (SELECT id FROM trabajos WHERE estado = ? ORDER BY creado LIMIT 1) '
+            'RETURNING id, funcion, parametros',
+            (EN_CURSO, os.getpid(), time.time(), PENDIENTE)
+        )
+        return filas[0] if filas else None
+
+    def _actualizar(self, id_trabajo, **campos):
+        campos['actualizado'] = time.time()
+        asignaciones = ', '.join(f'{campo} = ?' for campo in campos)
+        self._ejecutar(f'UPDATE trabajos SET {asignaciones} WHERE id = ?', (*campos.values(), id_trabajo))
+
+
+def _proceso_vivo(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _trabajar(ruta, espera, intervalo_progreso):
+    # Bucle de cada proceso trabajador, con menos prioridad que el servidor
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    cola = ColaTrabajos(ruta, intervalo_progreso=intervalo_progreso)
+    while True:
+        trabajo = cola._tomar()
+        if trabajo is None:
+            time.sleep(espera)
+            continue
+        _ejecutar_trabajo(cola, *trabajo)
+
+
+def _ejecutar_trabajo(cola, id_trabajo, funcion, parametros):
+    ultima = -float('inf')
+
+    def progreso(fraccion, mensaje=''):
+        # Como mucho una escritura por intervalo; el final se escribe siempre al terminar
+        nonlocal ultima
+        ahora = time.monotonic()
+        if ahora - ultima >= cola.intervalo_progreso:
+            ultima = ahora
+            cola._actualizar(id_trabajo, progreso=float(fraccion), mensaje=mensaje)
+
+    try:
+        modulo, nombre = funcion.split(':')
+        resultado = getattr(importlib.import_module(modulo), nombre)(json.loads(parametros), progreso)
+        cola._actualizar(id_trabajo, estado=LISTO, progreso=1.0, mensaje='Listo',
+                         resultado=json.dumps(resultado))
+    except Exception as e:
+        traceback.print_exc()
+        cola._actualizar(id_trabajo, estado=ERROR, mensaje=f'Error: {e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Procesos trabajadores de la cola de trabajos')
+    parser.add_argument('ruta', nargs='?', default=os.environ.get('RUTA_COLA_TRABAJOS', '.trabajos.sqlite'),
+                        help='Archivo SQLite de la cola')
+    parser.add_argument('--procesos', type=int, default=2, help='Trabajos que corren a la vez')
+    args = parser.parse_args()
+
+    cola = ColaTrabajos(args.ruta, procesos=args.procesos)
+    cola.iniciar()
+    for proceso in cola._trabajadores:
+        proceso.join()
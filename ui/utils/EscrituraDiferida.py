@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin bloqueo del diario entre procesos
+    fcntl = None
+
+from utils.AlmacenEscenas import AlmacenEscenas
+
+# Espera entre reintentos: crece al doble tras cada fallo, hasta ESPERA_MAXIMA
+ESPERA_INICIAL = 1.0
+ESPERA_MAXIMA = 300.0
+
+ESCRITURAS_POR_LOTE = 500
+
+
+class EscrituraDiferida:
+    """
+    Escrituras a Firestore en segundo plano (write-behind) con un diario local.
+
+    guardar_documento y guardar_escena anotan la escritura en un diario de
+    solo agregado (una línea JSON por escritura, con fsync) y vuelven de
+    inmediato. Un hilo la envía después: junta las escrituras pendientes al
+    mismo documento o escena en una sola (la última gana; con merge=True los
+    campos se combinan) y, si Firestore falla, reintenta con espera
+    exponencial. Lo enviado se marca en el diario, que se vacía cuando no
+    queda nada pendiente; al arrancar se reenvía todo lo que no llegó a
+    marcarse, así que un reinicio no pierde ediciones.
+
+    El diario es de un solo proceso: con varios workers, cada uno necesita
+    su propia ruta. Mientras la instancia vive tiene un bloqueo exclusivo
+    sobre <ruta>.lock, y otra instancia sobre la misma ruta (en otro proceso
+    o en este) falla con RuntimeError en lugar de reenviar o compactar el
+    diario a la vez; cerrar() lo suelta. El cliente se puede pasar (p. ej.
+    uno falso en memoria); si no, se usa el de FirestoreSingleton.
+    """
+
+    def __init__(self, ruta, cliente=None, intervalo=1.0, sincronizar=True):
+        self.ruta = ruta
+        self._cliente = cliente
+        self.intervalo = intervalo
+        self.sincronizar = sincronizar
+        self._lock = threading.Lock()
+        self._envio = threading.Lock()
+        self._hay_pendientes = threading.Event()
+        self._pendientes = {}
+        self._secuencia = 0
+        self._hilo = None
+        self._cerrada = False
+        self._bloqueo = self._bloquear()
+        self._reproducir()
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            # Import diferido: firebase_admin solo hace falta si no se pasa un cliente
+            from utils.FirestoreSingleton import FirestoreSingleton
+            self._cliente = FirestoreSingleton().client
+        return self._cliente
+
+    def guardar_documento(self, ruta_documento, datos, merge=False):
+        """Anota datos para el documento 'coleccion/id[/subcoleccion/id...]'"""
+        self._anotar({'tipo': 'documento', 'clave': ruta_documento, 'datos': datos, 'merge': merge})
+
+    def guardar_escena(self, id_escena, config_data):
+        """Anota una escena completa para guardarla con AlmacenEscenas"""
+        self._anotar({'tipo': 'escena', 'clave': id_escena, 'datos': config_data, 'merge': False})
+
+    def pendientes(self):
+        """Cantidad de documentos y escenas que faltan enviar"""
+        with self._lock:
+            return len(self._pendientes)
+
+    def vaciar(self):
+        """Intenta enviar ya lo pendiente; devuelve True si no quedó nada"""
+        with self._envio:
+            return self._enviar()
+
+    def cerrar(self):
+        """Suelta el diario para que otra instancia lo tome; lo pendiente queda en él"""
+        with self._envio:
+            self._cerrada = True
+        if self._bloqueo is not None:
+            self._bloqueo.close()
+            self._bloqueo = None
+
+    def _bloquear(self):
+        if fcntl is None:
+            return None
+        bloqueo = open(f"{self.ruta}.lock", 'a')
+        try:
+            fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            bloqueo.close()
+            raise RuntimeError(f"El diario {self.ruta} ya está en uso por otra EscrituraDiferida; "
+                               f"cada proceso necesita su propia ruta")
+        return bloqueo
+
+    def iniciar(self):
+        """Arranca el hilo que envía las escrituras, si no está corriendo"""
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+                self._hilo.start()
+
+    def _anotar(self, escritura):
+        if self._cerrada:
+            raise RuntimeError(f"El diario {self.ruta} ya se cerró")
+        with self._lock:
+            self._secuencia += 1
+            escritura['secuencia'] = self._secuencia
+            self._agregar_al_diario(escritura)
+            self._combinar(escritura)
+        self._hay_pendientes.set()
+        self.iniciar()
+
+    def _agregar_al_diario(self, registro):
+        with open(self.ruta, 'a', encoding='utf-8') as diario:
+            diario.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            diario.flush()
+            if self.sincronizar:
+                os.fsync(diario.fileno())
+
+    def _combinar(self, escritura):
+        # Una sola escritura pendiente por documento o escena
+        clave = (escritura['tipo'], escritura['clave'])
+        anterior = self._pendientes.get(clave)
+        if anterior is not None and escritura['merge']:
+            escritura = dict(escritura, datos={**anterior['datos'], **escritura['datos']},
+                             merge=anterior['merge'])
+        self._pendientes[clave] = escritura
+
+    def _reproducir(self):
+        # Lo anotado después de la última marca de envío sigue pendiente
+        if not os.path.exists(self.ruta):
+            return
+        escrituras = []
+        enviado = 0
+        with open(self.ruta, encoding='utf-8') as diario:
+            for linea in diario:
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Línea cortada por una caída a mitad de escritura
+                    logging.warning(f"Línea inválida en el diario {self.ruta}, se descarta")
+                    continue
+                if 'enviado_hasta' in registro:
+                    enviado = max(enviado, registro['enviado_hasta'])
+                else:
+                    escrituras.append(registro)
+                self._secuencia = max(self._secuencia, registro.get('secuencia', registro.get('enviado_hasta', 0)))
+
+        for escritura in escrituras:
+            if escritura['secuencia'] > enviado:
+                self._combinar(escritura)
+        if self._pendientes:
+            self._hay_pendientes.set()
+            self.iniciar()
+
+    def _trabajar(self):
+        espera = ESPERA_INICIAL
+        while not self._cerrada:
+            self._hay_pendientes.wait()
+            # Un momento para juntar escrituras seguidas al mismo documento
+            time.sleep(self.intervalo)
+            with self._envio:
+                enviado = self._enviar()
+            if enviado:
+                espera = ESPERA_INICIAL
+            else:
+                time.sleep(espera)
+                espera = min(espera * 2, ESPERA_MAXIMA)
+
+    def _enviar(self):
+        if self._cerrada:
+            return False
+        with self._lock:
+            escrituras = list(self._pendientes.values())
+            hasta = self._secuencia
+        if not escrituras:
+            return True
+
+        try:
+            documentos = [e for e in escrituras if e['tipo'] == 'documento']
+            for inicio in range(0, len(documentos), ESCRITURAS_POR_LOTE):
+                lote = self.cliente.batch()
+                for escritura in documentos[inicio:inicio + ESCRITURAS_POR_LOTE]:
+                    lote.set(self.cliente.document(escritura['clave']), escritura['datos'],
+                             merge=escritura['merge'])
+                lote.commit()
+            for escritura in escrituras:
+                if escritura['tipo'] == 'escena':
+                    AlmacenEscenas(self.cliente).guardar(escritura['datos'], escritura['clave'])
+        except Exception as e:
+            logging.error(f"Error writing to Firestore, will retry: {e}")
+            return False
+
+        with self._lock:
+            # Se quitan solo las escrituras enviadas; las anotadas mientras
+            # tanto quedan para la próxima vuelta
+            for escritura in escrituras:
+                clave = (escritura['tipo'], escritura['clave'])
+                if self._pendientes.get(clave) is escritura:
+                    del self._pendientes[clave]
+            if self._pendientes:
+                # Lo que queda se anotó después de `hasta` y sale en la próxima vuelta
+                self._agregar_al_diario({'enviado_hasta': hasta})
+                return True
+            # Nada pendiente: el diario se vacía de forma atómica
+            temporal = f"{self.ruta}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as diario:
+                diario.write(json.dumps({'enviado_hasta': hasta}) + '\n')
+            os.replace(temporal, self.ruta)
+            self._hay_pendientes.clear()
+        return True
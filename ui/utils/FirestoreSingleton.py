@@ -1,6 +1,6 @@
 from firebase_admin import firestore
-from FirebaseAppSingleton import FirebaseAppSingleton
-from SingletonMeta import SingletonMeta
+from utils.FirebaseAppSingleton import FirebaseAppSingleton
+from utils.SingletonMeta import SingletonMeta
 
 
 class FirestoreSingleton(metaclass=SingletonMeta):
@@ -15,6 +15,5 @@ class FirestoreSingleton(metaclass=SingletonMeta):
     @property
     def client(self):
         if self._client is None:
-            FirebaseAppSingleton().app
-            self._client = firestore.client()
+            self._client = firestore.client(app=FirebaseAppSingleton().app)
         return self._client
\ No newline at end of file
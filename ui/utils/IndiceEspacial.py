@@ -0,0 +1,242 @@
+import heapq
+
+import numpy as np
+
+# Triángulos por hoja del árbol
+TAM_HOJA = 8
+
+# Rayo de las pruebas de contención; levemente inclinado respecto de +x para
+# no pasar justo por aristas o vértices de mallas alineadas a los ejes
+_DIRECCION_RAYO = np.array([1.0, 0.0137, 0.0071]) / np.linalg.norm([1.0, 0.0137, 0.0071])
+
+
+class IndiceEspacial:
+    """
+    Árbol de cajas (BVH) sobre los triángulos de todas las piezas, para saber
+    qué pieza contiene o está más cerca de un punto sin recorrerlas todas.
+
+    Los triángulos se ordenan por el código de Morton de su centroide y se
+    agrupan en hojas de TAM_HOJA; encima se arma un árbol binario completo
+    (guardado como heap: los hijos del nodo n son 2n y 2n + 1) cuyas cajas
+    se calculan nivel por nivel, de abajo hacia arriba.
+    """
+
+    def __init__(self, mallas):
+        # mallas: secuencia de (vertices, caras), una por pieza
+        triangulos, piezas = [], []
+        for indice, (vertices, caras) in enumerate(mallas):
+            vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+            caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+            triangulos.append(vertices[caras])
+            piezas.append(np.full(len(caras), indice, dtype=np.int64))
+
+        triangulos = np.concatenate(triangulos) if triangulos else np.empty((0, 3, 3))
+        piezas = np.concatenate(piezas) if piezas else np.empty(0, dtype=np.int64)
+
+        orden = np.argsort(_codigos_morton(triangulos.mean(axis=1)), kind='stable')
+        self.triangulos = triangulos[orden]
+        self.piezas = piezas[orden]
+
+        # Hojas: bloques consecutivos de TAM_HOJA triángulos; el árbol se
+        # completa hasta una potencia de dos con cajas vacías
+        n_hojas = max(1, -(-len(self.triangulos) // TAM_HOJA))
+        self._primera_hoja = 1 << (n_hojas - 1).bit_length()
+        self.minimo = np.full((2 * self._primera_hoja, 3), np.inf)
+        self.maximo = np.full((2 * self._primera_hoja, 3), -np.inf)
+
+        if len(self.triangulos):
+            inicios = np.arange(0, len(self.triangulos), TAM_HOJA)
+            hojas = slice(self._primera_hoja, self._primera_hoja + len(inicios))
+            self.minimo[hojas] = np.minimum.reduceat(self.triangulos.min(axis=1), inicios)
+            self.maximo[hojas] = np.maximum.reduceat(self.triangulos.max(axis=1), inicios)
+
+        nivel = self._primera_hoja // 2
+        while nivel >= 1:
+            padres = np.arange(nivel, 2 * nivel)
+            self.minimo[padres] = np.minimum(self.minimo[2 * padres], self.minimo[2 * padres + 1])
+            self.maximo[padres] = np.maximum(self.maximo[2 * padres], self.maximo[2 * padres + 1])
+            nivel //= 2
+
+    def arreglos(self):
+        """Arreglos del árbol ya armado, para guardarlo y rearmarlo con desde_arreglos"""
+        return {'triangulos': self.triangulos, 'piezas': self.piezas, 'minimo': self.minimo, 'maximo': self.maximo}
+
+    @classmethod
+    def desde_arreglos(cls, triangulos, piezas, minimo, maximo):
+        """Índice a partir de lo que devolvió arreglos(), sin volver a ordenar ni calcular cajas"""
+        indice = cls.__new__(cls)
+        indice.triangulos, indice.piezas = triangulos, piezas
+        indice.minimo, indice.maximo = minimo, maximo
+        indice._primera_hoja = len(minimo) // 2
+        return indice
+
+    def _triangulos_hoja(self, nodo):
+        inicio = (nodo - self._primera_hoja) * TAM_HOJA
+        return slice(inicio, min(inicio + TAM_HOJA, len(self.triangulos)))
+
+    def pieza_mas_cercana(self, punto):
+        """
+        (pieza, distancia, punto_mas_cercano) para la superficie más cercana al
+        punto, o None si el índice está vacío.
+        """
+        punto = np.asarray(punto, dtype=float)
+        mejor = (np.inf, None)
+        pendientes = [(_distancia2_caja(punto, self.minimo[1], self.maximo[1]), 1)]
+
+        # Primero el nodo cuya caja está más cerca; se descartan las ramas
+        # cuya caja ya está más lejos que el mejor triángulo encontrado
+        while pendientes:
+            distancia2, nodo = heapq.heappop(pendientes)
+            if distancia2 >= mejor[0]:
+                break
+            if nodo >= self._primera_hoja:
+                tramo = self._triangulos_hoja(nodo)
+                cercanos = punto_mas_cercano_triangulos(punto, self.triangulos[tramo])
+                distancias2 = ((cercanos - punto) ** 2).sum(axis=1)
+                n = int(np.argmin(distancias2))
+                if distancias2[n] < mejor[0]:
+                    mejor = (distancias2[n], (tramo.start + n, cercanos[n]))
+                continue
+            for hijo in (2 * nodo, 2 * nodo + 1):
+                d2 = _distancia2_caja(punto, self.minimo[hijo], self.maximo[hijo])
+                if d2 < mejor[0]:
+                    heapq.heappush(pendientes, (d2, hijo))
+
+        if mejor[1] is None:
+            return None
+        triangulo, cercano = mejor[1]
+        return int(self.piezas[triangulo]), float(np.sqrt(mejor[0])), cercano
+
+    def piezas_que_contienen(self, punto):
+        """
+        Piezas cerradas que encierran el punto, por paridad de cruces de un
+        rayo desde el punto.
+        """
+        punto = np.asarray(punto, dtype=float)
+        candidatos = []
+        pendientes = [1]
+        while pendientes:
+            nodo = pendientes.pop()
+            if not _rayo_toca_caja(punto, self.minimo[nodo], self.maximo[nodo]):
+                continue
+            if nodo >= self._primera_hoja:
+                tramo = self._triangulos_hoja(nodo)
+                candidatos.append(np.arange(tramo.start, tramo.stop))
+            else:
+                pendientes.extend((2 * nodo, 2 * nodo + 1))
+
+        if not candidatos:
+            return []
+        candidatos = np.concatenate(candidatos)
+        cruces = _cruces_rayo(punto, self.triangulos[candidatos])
+        conteo = np.bincount(self.piezas[candidatos[cruces]])
+        return np.flatnonzero(conteo % 2 == 1).tolist()
+
+    def pieza_en_punto(self, punto):
+        """La pieza que contiene el punto o, si ninguna, la más cercana"""
+        contienen = self.piezas_que_contienen(punto)
+        if contienen:
+            return contienen[0]
+        cercana = self.pieza_mas_cercana(punto)
+        return None if cercana is None else cercana[0]
+
+
+def _codigos_morton(puntos, bits=10):
+    # Intercala los bits de x, y, z cuantizados para que puntos cercanos queden juntos al ordenar
+    if len(puntos) == 0:
+        return np.empty(0, dtype=np.uint64)
+    minimo = puntos.min(axis=0)
+    escala = (puntos.max(axis=0) - minimo).max()
+    escala = ((1 << bits) - 1) / escala if escala > 0 else 0.0
+    celdas = ((puntos - minimo) * escala).astype(np.uint64)
+
+    codigos = np.zeros(len(puntos), dtype=np.uint64)
+    for bit in range(bits):
+        for eje in range(3):
+            codigos |= ((celdas[:, eje] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + eje)
+    return codigos
+
+
+def _distancia2_caja(punto, minimo, maximo):
+    exceso = np.maximum(np.maximum(minimo - punto, punto - maximo), 0.0)
+    return float((exceso ** 2).sum())
+
+
+def _rayo_toca_caja(origen, minimo, maximo):
+    # Prueba de losas: el rayo entra a la caja antes de salir de ella
+    if not (minimo <= maximo).all():
+        return False
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (minimo - origen) / _DIRECCION_RAYO
+        t2 = (maximo - origen) / _DIRECCION_RAYO
+    entrada = np.minimum(t1, t2).max()
+    salida = np.maximum(t1, t2).min()
+    return salida >= max(entrada, 0.0)
+
+
+def punto_mas_cercano_triangulos(p, triangulos):
+    """
+    Punto más cercano a p sobre cada triángulo (n, 3, 3), por regiones de
+    Voronoi. p es un punto (3,) o un punto por triángulo (n, 3).
+    """
+    a, b, c = triangulos[:, 0], triangulos[:, 1], triangulos[:, 2]
+    ab, ac = b - a, c - a
+    ap, bp, cp = p - a, p - b, p - c
+    d1, d2 = (ab * ap).sum(axis=1), (ac * ap).sum(axis=1)
+    d3, d4 = (ab * bp).sum(axis=1), (ac * bp).sum(axis=1)
+    d5, d6 = (ab * cp).sum(axis=1), (ac * cp).sum(axis=1)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Interior; luego se pisan las regiones de aristas y vértices, de la
+        # menos a la más prioritaria
+        denominador = va + vb + vc
+        cercano = a + ab * (vb / denominador)[:, None] + ac * (vc / denominador)[:, None]
+
+        region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        cercano[region] = (b + (c - b) * t[:, None])[region]
+
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        t = d2 / (d2 - d6)
+        cercano[region] = (a + ac * t[:, None])[region]
+
+        region = (d6 >= 0) & (d5 <= d6)
+        cercano[region] = c[region]
+
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        t = d1 / (d1 - d3)
+        cercano[region] = (a + ab * t[:, None])[region]
+
+        region = (d3 >= 0) & (d4 <= d3)
+        cercano[region] = b[region]
+
+        region = (d1 <= 0) & (d2 <= 0)
+        cercano[region] = a[region]
+
+    # Triángulos degenerados: el vértice más cercano
+    invalidos = ~np.isfinite(cercano).all(axis=1)
+    if invalidos.any():
+        vertices = triangulos[invalidos]
+        origen = p[invalidos][:, None, :] if p.ndim == 2 else p
+        n = ((vertices - origen) ** 2).sum(axis=2).argmin(axis=1)
+        cercano[invalidos] = vertices[np.arange(len(n)), n]
+    return cercano
+
+
+def _cruces_rayo(p, triangulos, eps=1e-12):
+    """Máscara de los triángulos que cruza el rayo p + t * _DIRECCION_RAYO, t > 0 (Möller-Trumbore)"""
+    a = triangulos[:, 0]
+    e1, e2 = triangulos[:, 1] - a, triangulos[:, 2] - a
+    direccion = _DIRECCION_RAYO
+    h = np.cross(direccion, e2)
+    det = (e1 * h).sum(axis=1)
+    validos = np.abs(det) > eps
+    inverso = np.divide(1.0, det, out=np.zeros_like(det), where=validos)
+
+    s = p - a
+    u = inverso * (s * h).sum(axis=1)
+    q = np.cross(s, e1)
+    v = inverso * (q @ direccion)
+    t = inverso * (e2 * q).sum(axis=1)
+    return validos & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > eps)
@@ -0,0 +1,260 @@
+import copy
+import json
+import math
+import threading
+
+import numpy as np
+
+from utils.instancias import detectar_instancias
+from utils.lod import generar_niveles
+from utils.mallas import fusionar_piezas
+from utils.ocultas import caras_ocultas
+from utils.versiones import hash_guardado
+
+
+class _BufferCreciente:
+    """Arreglo (n, 3) que crece duplicando su capacidad"""
+
+    def __init__(self, dtype):
+        self._datos = np.empty((0, 3), dtype=dtype)
+        self._n = 0
+
+    def agregar(self, filas):
+        fin = self._n + len(filas)
+        if fin > len(self._datos):
+            nuevo = np.empty((max(fin, 2 * len(self._datos)), 3), dtype=self._datos.dtype)
+            nuevo[:self._n] = self._datos[:self._n]
+            self._datos = nuevo
+        self._datos[self._n:fin] = filas
+        self._n = fin
+
+    @property
+    def datos(self):
+        return self._datos[:self._n]
+
+
+class ModeloGenerador:
+    def __init__(self, json_data):
+        # Parsear JSON (o usar la escena ya cargada) y ordenar piezas por prioridad
+        config_data = json.loads(json_data) if isinstance(json_data, str) else json_data
+        piezas = sorted(
+            config_data['scene_configuration']['pieces'],
+            key=lambda x: x.get('prioridad', float('inf'))
+        )
+        self._iniciar()
+        self._agregar_piezas(piezas)
+
+    @classmethod
+    def desde_flujo(cls, piezas):
+        """
+        Crea el generador a partir de un iterable de piezas que ya vienen en
+        orden de ensamblaje (p. ej. escena.iterar_piezas). Las piezas se leen a
+        demanda, así que el primer paso se sirve sin esperar a toda la escena.
+        """
+        modelo = cls.__new__(cls)
+        modelo._iniciar(iter(piezas))
+        return modelo
+
+    def con_indice(self, indice_actual):
+        """
+        Vista que comparte la geometría (y la lectura pendiente del flujo) con
+        este generador pero navega con su propio índice, p. ej. uno por sesión.
+        """
+        vista = copy.copy(self)
+        vista.indice_actual = indice_actual
+        return vista
+
+    def _iniciar(self, pendientes=None):
+        self.piezas_originales = []
+        self.indice_actual = -1
+        self._pendientes = pendientes
+        self._lock_flujo = threading.Lock()
+
+        # Geometría de todas las piezas recibidas, concatenada en orden de
+        # prioridad; cada paso solo mueve el límite del prefijo visible.
+        self._vertices = _BufferCreciente(float)
+        self._caras = _BufferCreciente(np.int64)
+        self._colores = _BufferCreciente(float)
+
+        # fin_*[n] = cantidad de vértices/caras de las primeras n piezas
+        self._fin_vertices = [0]
+        self._fin_caras = [0]
+
+        # Niveles de detalle reducidos por pieza, compartidos entre vistas
+        self._niveles = {}
+
+        # Primera pieza que oculta cada cara (-1 si ninguna) y el modelo
+        # completo sin esas caras, compartidos entre vistas; se calculan la
+        # primera vez que se piden
+        self._ocultas = {}
+
+    def _agregar_piezas(self, piezas):
+        vertices, caras, colores, fin_v, fin_c = fusionar_piezas(piezas)
+        base_v, base_c = self._fin_vertices[-1], self._fin_caras[-1]
+
+        self._vertices.agregar(vertices)
+        self._caras.agregar(caras + base_v)
+        self._colores.agregar(colores)
+        self._fin_vertices.extend((fin_v[1:] + base_v).tolist())
+        self._fin_caras.extend((fin_c[1:] + base_c).tolist())
+        self.piezas_originales.extend(piezas)
+
+    def _cargar_hasta(self, indice):
+        # Leer del flujo hasta tener la pieza `indice`; la malla ya quedó en los
+        # buffers, así que de cada pieza solo se conservan sus metadatos
+        with self._lock_flujo:
+            while len(self.piezas_originales) <= indice and self._pendientes is not None:
+                pieza = next(self._pendientes, None)
+                if pieza is None:
+                    self._pendientes = None
+                    break
+                self._agregar_piezas([pieza])
+                self.piezas_originales[-1] = {k: v for k, v in pieza.items() if k != 'mesh'}
+        return indice < len(self.piezas_originales)
+
+    @property
+    def vertices(self):
+        return self._vertices.datos
+
+    @property
+    def caras(self):
+        return self._caras.datos
+
+    @property
+    def colores(self):
+        return self._colores.datos
+
+    @property
+    def piezas_generadas(self):
+        return self.piezas_originales[:self.indice_actual + 1]
+
+    def generar_siguiente_pieza(self):
+        if self._cargar_hasta(self.indice_actual + 1):
+            self.indice_actual += 1
+            return self._reconstruir_modelo_parcial()
+        return None
+
+    def generar_pieza_anterior(self):
+        if self.indice_actual > 0:
+            self.indice_actual -= 1
+            return self._reconstruir_modelo_parcial()
+        return None
+
+    def generar_modelo_completo(self):
+        # Resetear y generar todas las piezas; con todas colocadas, las caras
+        # de contacto entre ellas no se ven y se dejan fuera
+        self._cargar_hasta(math.inf)
+        self.indice_actual = len(self.piezas_originales) - 1
+        if 'completo' not in self._ocultas:
+            visibles = self.ocultantes() < 0
+            caras = self.caras[visibles]
+            self._ocultas['completo'] = (self.vertices[:, 0], self.vertices[:, 1], self.vertices[:, 2],
+                                         self.colores[visibles], caras[:, 0], caras[:, 1], caras[:, 2])
+        return self._ocultas['completo']
+
+    def ensamblaje_completo(self, piezas_visibles):
+        """True si con las primeras piezas_visibles piezas ya está todo el ensamblaje"""
+        return piezas_visibles > 0 and not self._cargar_hasta(piezas_visibles)
+
+    def ocultantes(self):
+        """
+        Para cada cara del modelo, la primera pieza (en orden de ensamblaje)
+        que la tapa por completo al apoyarse sobre ella, o -1 si ninguna.
+        """
+        if 'ocultantes' not in self._ocultas:
+            self._cargar_hasta(math.inf)
+            fin_v, fin_c = self._fin_vertices, self._fin_caras
+            self._ocultas['ocultantes'] = np.concatenate([np.empty(0, dtype=np.int64)] + caras_ocultas([
+                (self.vertices[fin_v[n]:fin_v[n + 1]], self.caras[fin_c[n]:fin_c[n + 1]] - fin_v[n])
+                for n in range(len(self.piezas_originales))
+            ]))
+        return self._ocultas['ocultantes']
+
+    def geometria_pieza(self, indice, nivel=0, sin_ocultas=False):
+        """
+        Geometría de una sola pieza, con los índices de las caras locales a
+        ella. Con nivel > 0 se devuelve ese nivel de detalle reducido; con
+        sin_ocultas, la malla completa sin las caras que le tapan otras piezas
+        (para cuando todo el ensamblaje está a la vista).
+        """
+        self._cargar_hasta(indice)
+        ini_v, fin_v = self._fin_vertices[indice], self._fin_vertices[indice + 1]
+        ini_c, fin_c = self._fin_caras[indice], self._fin_caras[indice + 1]
+
+        if nivel == 0:
+            vertices = self.vertices[ini_v:fin_v]
+            caras = self.caras[ini_c:fin_c] - ini_v
+            colores = self.colores[ini_c:fin_c]
+            if sin_ocultas:
+                visibles = self.ocultantes()[ini_c:fin_c] < 0
+                caras, colores = caras[visibles], colores[visibles]
+        else:
+            vertices, caras = self.niveles_pieza(indice)[nivel - 1]
+            colores = np.repeat(self.colores[ini_c:ini_c + 1], len(caras), axis=0)
+
+        return (vertices[:, 0], vertices[:, 1], vertices[:, 2], colores,
+                caras[:, 0], caras[:, 1], caras[:, 2])
+
+    def niveles_pieza(self, indice):
+        """
+        Niveles reducidos (vertices, caras) de una pieza, de más a menos
+        detalle: los guardados con la escena o, si no los hay, calculados una vez.
+        """
+        if indice not in self._niveles:
+            self._cargar_hasta(indice)
+            guardados = self.piezas_originales[indice].get('lod')
+            if guardados is not None:
+                niveles = [(np.asarray(n['vertices'], dtype=float).reshape(-1, 3),
+                            np.asarray(n['faces'], dtype=np.int64).reshape(-1, 3)) for n in guardados]
+            else:
+                ini_v, fin_v = self._fin_vertices[indice], self._fin_vertices[indice + 1]
+                ini_c, fin_c = self._fin_caras[indice], self._fin_caras[indice + 1]
+                niveles = generar_niveles(self.vertices[ini_v:fin_v], self.caras[ini_c:fin_c] - ini_v)
+            self._niveles[indice] = niveles
+        return self._niveles[indice]
+
+    def instancias(self):
+        """
+        (original, rotacion, traslacion) de cada pieza: la primera pieza con
+        la misma malla y la transformación que la lleva a su lugar.
+        """
+        self._cargar_hasta(math.inf)
+        fin_v, fin_c = self._fin_vertices, self._fin_caras
+        return detectar_instancias([
+            (self.vertices[fin_v[n]:fin_v[n + 1]], self.caras[fin_c[n]:fin_c[n + 1]] - fin_v[n])
+            for n in range(len(self.piezas_originales))
+        ])
+
+    def hashes_piezas(self):
+        """
+        {id de pieza: content_hash} de todas las piezas en orden de
+        ensamblaje, como versiones.hashes_escena; sin la malla en
+        piezas_originales se hashea la de los buffers.
+        """
+        self._cargar_hasta(math.inf)
+        fin_v, fin_c = self._fin_vertices, self._fin_caras
+        return {
+            pieza.get('id', n): hash_guardado({**pieza, 'mesh': {
+                'vertices': self.vertices[fin_v[n]:fin_v[n + 1]],
+                'faces': self.caras[fin_c[n]:fin_c[n + 1]] - fin_v[n]}})
+            for n, pieza in enumerate(self.piezas_originales)
+        }
+
+    def tiene_ocultas(self, indice):
+        """True si alguna cara de la pieza queda tapada en el ensamblaje completo"""
+        return bool((self.ocultantes()[self._fin_caras[indice]:self._fin_caras[indice + 1]] >= 0).any())
+
+    def caras_por_nivel(self, indice):
+        """Cantidad de caras de la pieza en cada nivel, empezando por el completo"""
+        completas = self._fin_caras[indice + 1] - self._fin_caras[indice]
+        return [completas] + [len(caras) for _, caras in self.niveles_pieza(indice)]
+
+    def _reconstruir_modelo_parcial(self):
+        # Vistas sobre los buffers: no se copia ni se recorre ninguna pieza
+        fin_v = self._fin_vertices[self.indice_actual + 1]
+        fin_c = self._fin_caras[self.indice_actual + 1]
+        vertices = self.vertices[:fin_v]
+        caras = self.caras[:fin_c]
+
+        return (vertices[:, 0], vertices[:, 1], vertices[:, 2], self.colores[:fin_c],
+                caras[:, 0], caras[:, 1], caras[:, 2])
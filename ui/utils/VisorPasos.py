@@ -0,0 +1,324 @@
+import os
+import threading
+
+import dash
+import plotly.graph_objs as go
+from dash import dcc, Input, Output, State, Patch, ClientsideFunction
+
+from utils.CacheFiguras import CacheFiguras
+from utils.CacheSesiones import CacheSesiones
+from utils.ModeloGenerador import ModeloGenerador
+from utils.codificacion import codificar_traza, modo_visor
+from utils.escena import cargar_escena, iterar_piezas
+from utils.lod import elegir_niveles
+from utils.stl import hash_archivo
+from utils.versiones import diferencias
+
+# Tope de caras en pantalla (PRESUPUESTO_CARAS); las piezas bajan de nivel de
+# detalle para respetarlo, salvo la última agregada. Sin tope, todo completo
+PRESUPUESTO_CARAS = int(os.environ.get('PRESUPUESTO_CARAS', 0)) or None
+
+# Codificación de la geometría de las trazas (CODIFICACION_GEOMETRIA: 'lista',
+# 'f4' o 'i2', ver utils.codificacion); las coordenadas cuantizadas las
+# decodifica assets/reproduccion.js, así que sin la reproducción en cliente
+# se envía 'f4' (con un aviso en el log)
+CODIFICACION = os.environ.get('CODIFICACION_GEOMETRIA', 'f4')
+
+# Cada cuántos segundos revisa el navegador si cambió el archivo de la escena
+# (INTERVALO_RECARGA); 0 lo desactiva. Solo con los pasos en el servidor: con
+# la reproducción en cliente la escena viaja con la página y basta recargarla
+INTERVALO_RECARGA = float(os.environ.get('INTERVALO_RECARGA', 5))
+
+
+class VisorPasos:
+    """
+    Lógica común de los visores paso a paso (animation.py, x.py): la
+    geometría compartida de la escena, las trazas por pieza, las diferencias
+    entre pasos y los callbacks de navegación. Cada visor pone su propio
+    layout con los ids de botones y gráfica de abajo y llama a
+    registrar_callbacks(app).
+
+    Con reproduccion_en_cliente la escena completa viaja una sola vez con la
+    página y los pasos se resuelven en el navegador (assets/reproduccion.js);
+    si no, las piezas se leen a demanda y cada paso envía solo su diferencia.
+    Si en ese caso cambia el archivo de la escena, cada navegador recibe solo
+    las piezas que cambiaron (ver recargar y diferencia_versiones).
+    """
+
+    def __init__(self, ruta_escena, reproduccion_en_cliente=False, presupuesto_caras=PRESUPUESTO_CARAS,
+                 codificacion=CODIFICACION, showscale=False, intervalo_recarga=INTERVALO_RECARGA):
+        self.ruta_escena = ruta_escena
+        self.reproduccion_en_cliente = reproduccion_en_cliente
+        self.presupuesto_caras = presupuesto_caras
+        self.codificacion = modo_visor(codificacion, reproduccion_en_cliente)
+        self.showscale = showscale
+        self.intervalo_recarga = intervalo_recarga
+        self.modelo_generador = self._cargar_modelo()
+
+        # Paso en el que va cada sesión; la geometría de modelo_generador se comparte.
+        # Con RUTA_SESIONES el estado queda en un archivo que comparten todos los
+        # workers (p. ej. gunicorn -w 4 x:server)
+        self.sesiones = CacheSesiones(os.environ.get('RUTA_SESIONES'))
+
+        # Diferencias entre pasos, compartidas por todas las sesiones: la clave
+        # es (contenido de la escena, paso de origen, paso de destino, opciones
+        # de render). Tope en memoria TAM_CACHE_FIGURAS (bytes); con
+        # DIRECTORIO_CACHE_FIGURAS también van a disco, compartidas entre workers
+        self.cache_figuras = CacheFiguras(int(os.environ.get('TAM_CACHE_FIGURAS', 64 * 1024 * 1024)),
+                                          os.environ.get('DIRECTORIO_CACHE_FIGURAS'))
+        self.hash_escena = hash_archivo(ruta_escena)
+
+        # {hash del archivo: {id de pieza: content_hash}} de cada versión de la
+        # escena que se cargó, para saber qué piezas mandar a los navegadores
+        # que todavía muestran una anterior
+        self._hashes_versiones = {}
+        self._lock_recarga = threading.Lock()
+
+    def _cargar_modelo(self):
+        if self.reproduccion_en_cliente:
+            return ModeloGenerador(cargar_escena(self.ruta_escena))
+        return ModeloGenerador.desde_flujo(iterar_piezas(self.ruta_escena))
+
+    def recargar(self):
+        """
+        Si el archivo de la escena cambió, carga la versión nueva y devuelve
+        versiones.diferencias entre la anterior y ella; si no, None.
+        """
+        with self._lock_recarga:
+            # La versión cargada se hashea mientras su archivo sigue en disco
+            anterior = self._hashes_version(self.hash_escena)
+            hash_nuevo = hash_archivo(self.ruta_escena)
+            if hash_nuevo == self.hash_escena:
+                return None
+            self.modelo_generador = self._cargar_modelo()
+            self.hash_escena = hash_nuevo
+            return diferencias(anterior, self._hashes_version(hash_nuevo))
+
+    def _hashes_version(self, hash_escena):
+        # Solo se puede calcular para la versión cargada; las demás, si este
+        # proceso no las vio (otro worker), quedan en None
+        if hash_escena not in self._hashes_versiones and hash_escena == self.hash_escena:
+            self._hashes_versiones[hash_escena] = self.modelo_generador.hashes_piezas()
+        return self._hashes_versiones.get(hash_escena)
+
+    def niveles_visibles(self, piezas_visibles):
+        """Nivel de detalle de cada una de las primeras piezas_visibles piezas"""
+        if self.presupuesto_caras is None or piezas_visibles == 0:
+            return [0] * piezas_visibles
+        caras = [self.modelo_generador.caras_por_nivel(indice) for indice in range(piezas_visibles)]
+        return elegir_niveles(caras, self.presupuesto_caras, completas=[piezas_visibles - 1])
+
+    def crear_traza_pieza(self, indice, visible=True, nivel=0, sin_ocultas=False):
+        # Cada pieza es su propia traza para poder agregarla o quitarla sola;
+        # sin sus caras ocultas va opaca, para que no se vea a través de ella el hueco
+        x, y, z, colores, i, j, k = self.modelo_generador.geometria_pieza(indice, nivel, sin_ocultas)
+        return codificar_traza(go.Mesh3d(
+            x=x,
+            y=y,
+            z=z,
+            i=i,
+            j=j,
+            k=k,
+            facecolor=colores,
+            opacity=1.0 if sin_ocultas else 0.7,  # Opacity base
+            showscale=self.showscale,
+            visible=visible
+        ), self.codificacion)
+
+    def crear_traza_instancia(self, indice, original, rotacion, traslacion):
+        # Pieza repetida: viaja sin geometría y el navegador la arma con la de la
+        # traza `original` y su transformación (assets/reproduccion.js)
+        return go.Mesh3d(
+            x=[], y=[], z=[], i=[], j=[], k=[],
+            color=self.modelo_generador.piezas_originales[indice].get('color'),
+            opacity=0.7,
+            showscale=self.showscale,
+            visible=False,
+            meta={'instancia': {'traza': original, 'rotacion': rotacion.tolist(), 'traslacion': traslacion.tolist()}}
+        )
+
+    def trazas_iniciales(self):
+        """Trazas que se envían con la página (ninguna si los pasos se resuelven en el servidor)"""
+        if not self.reproduccion_en_cliente:
+            return []
+        # Todas las piezas viajan juntas, así que el presupuesto se aplica a la escena completa
+        niveles = self.niveles_visibles(len(self.modelo_generador.piezas_originales))
+        # Las piezas repetidas (con el mismo nivel que su original) se envían como instancias
+        instancias = self.modelo_generador.instancias()
+        return [
+            self.crear_traza_instancia(indice, *instancias[indice])
+            if instancias[indice][0] != indice and niveles[instancias[indice][0]] == nivel
+            else self.crear_traza_pieza(indice, visible=False, nivel=nivel)
+            for indice, nivel in enumerate(niveles)
+        ]
+
+    def almacenes(self, trazas_iniciales):
+        """dcc.Store (y el intervalo de recarga) que necesitan los callbacks; van en el layout junto a la gráfica"""
+        almacenes = [
+            dcc.Store(id='piezas-mostradas', data=0),
+            dcc.Store(id='orden-pasos', data=list(range(len(trazas_iniciales)))),
+            dcc.Store(id='indice-paso', data=-1),
+            dcc.Store(id='id-sesion', storage_type='session')
+        ]
+        if self.recarga_activa:
+            almacenes += [
+                dcc.Store(id='version-escena', data=self.hash_escena),
+                dcc.Interval(id='recarga-escena', interval=self.intervalo_recarga * 1000)
+            ]
+        return almacenes
+
+    @property
+    def recarga_activa(self):
+        return not self.reproduccion_en_cliente and self.intervalo_recarga > 0
+
+    def diferencia_pasos(self, piezas_mostradas, piezas_visibles):
+        """
+        Patch de piezas_mostradas a piezas_visibles piezas: solo
+        las que cambian respecto a lo que ya muestra el navegador, incluidas
+        las que cambian de nivel de detalle; el layout (y con él la cámara) no
+        se toca. Con el ensamblaje completo a la vista las piezas van opacas y
+        sin sus caras de contacto; al dejar de estarlo se vuelven a enviar
+        enteras las que las tenían y las demás solo cambian de opacidad.
+        """
+        modelo_generador = self.modelo_generador
+        niveles_antes = self.niveles_visibles(piezas_mostradas)
+        niveles = self.niveles_visibles(piezas_visibles)
+        completo_antes = modelo_generador.ensamblaje_completo(piezas_mostradas)
+        completo = modelo_generador.ensamblaje_completo(piezas_visibles)
+        figura = Patch()
+        for indice in range(min(piezas_mostradas, piezas_visibles)):
+            cambia_ocultas = (completo != completo_antes and niveles[indice] == 0
+                              and modelo_generador.tiene_ocultas(indice))
+            if niveles[indice] != niveles_antes[indice] or cambia_ocultas:
+                figura['data'][indice] = self.crear_traza_pieza(indice, nivel=niveles[indice], sin_ocultas=completo)
+            elif completo != completo_antes:
+                figura['data'][indice]['opacity'] = 1.0 if completo else 0.7
+        for indice in range(piezas_mostradas, piezas_visibles):
+            figura['data'].append(self.crear_traza_pieza(indice, nivel=niveles[indice], sin_ocultas=completo))
+        for _ in range(piezas_visibles, piezas_mostradas):
+            del figura['data'][-1]
+        return figura
+
+    def diferencia_versiones(self, version, piezas_mostradas):
+        """
+        Patch que lleva las piezas_mostradas primeras piezas de la versión
+        `version` de la escena a la actual: reenvía las que cambiaron de
+        contenido o de lugar y quita las que ya no existen. Devuelve
+        (patch, piezas que quedan). Con presupuesto de caras o el ensamblaje
+        completo a la vista un cambio puede afectar a las demás piezas (nivel
+        de detalle, caras ocultas), así que se reenvían todas; también si este
+        proceso no conoce la versión de origen.
+        """
+        anterior = list((self._hashes_version(version) or {}).items())
+        actual = list(self._hashes_version(self.hash_escena).items())
+        piezas_visibles = min(piezas_mostradas, len(actual))
+        niveles = self.niveles_visibles(piezas_visibles)
+        completo = self.modelo_generador.ensamblaje_completo(piezas_visibles)
+        todas = not anterior or self.presupuesto_caras is not None or completo
+
+        figura = Patch()
+        for indice in range(piezas_visibles):
+            if todas or indice >= len(anterior) or anterior[indice] != actual[indice]:
+                figura['data'][indice] = self.crear_traza_pieza(indice, nivel=niveles[indice], sin_ocultas=completo)
+        for _ in range(piezas_visibles, piezas_mostradas):
+            del figura['data'][-1]
+        return figura, piezas_visibles
+
+    def recargar_figura(self, n_intervalos, piezas_mostradas, version, id_sesion):
+        """Callback del intervalo: si la escena cambió desde `version`, envía solo lo que cambió"""
+        self.recargar()
+        if version == self.hash_escena:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+        figura, piezas_visibles = self.diferencia_versiones(version, piezas_mostradas or 0)
+        if id_sesion and piezas_visibles < (piezas_mostradas or 0):
+            self.sesiones.guardar(id_sesion, piezas_visibles - 1)
+
+        anterior = self._hashes_version(version)
+        if anterior is None:
+            mensaje = "Escena actualizada"
+        else:
+            cambios = diferencias(anterior, self._hashes_version(self.hash_escena))
+            mensaje = (f"Escena actualizada: {len(cambios['modificadas'])} modificadas, "
+                       f"{len(cambios['agregadas'])} agregadas, {len(cambios['eliminadas'])} eliminadas")
+        return figura, mensaje, piezas_visibles, self.hash_escena
+
+    def actualizar_modelo(self, n_siguiente, n_anterior, n_completo, piezas_mostradas, id_sesion):
+        ctx = dash.callback_context
+
+        if not ctx.triggered:
+            return dash.no_update, "Piezas generadas: 0", dash.no_update
+
+        boton_presionado = ctx.triggered[0]['prop_id'].split('.')[0]
+
+        # Cada sesión navega con su propio índice sobre la geometría compartida
+        modelo = self.modelo_generador.con_indice(self.sesiones.obtener(id_sesion, -1))
+
+        if boton_presionado == 'btn-pieza-siguiente':
+            resultado = modelo.generar_siguiente_pieza()
+            mensaje = f"Piezas generadas (Adelante): {modelo.indice_actual + 1}"
+        elif boton_presionado == 'btn-pieza-anterior':
+            resultado = modelo.generar_pieza_anterior()
+            mensaje = f"Piezas generadas (Atrás): {modelo.indice_actual + 1}"
+        elif boton_presionado == 'btn-modelo-completo':
+            resultado = modelo.generar_modelo_completo()
+            mensaje = "Modelo completo generado"
+
+        if id_sesion:
+            self.sesiones.guardar(id_sesion, modelo.indice_actual)
+
+        if resultado is None:
+            return dash.no_update, mensaje, dash.no_update
+
+        piezas_visibles = modelo.indice_actual + 1
+        clave = (self.hash_escena, piezas_mostradas, piezas_visibles, self.presupuesto_caras, self.codificacion)
+        figura = self.cache_figuras.obtener(clave, lambda: self.diferencia_pasos(piezas_mostradas, piezas_visibles))
+
+        return figura, mensaje, piezas_visibles
+
+    def registrar_callbacks(self, app):
+        """Callbacks de los botones de navegación (en el navegador o en el servidor)"""
+        botones = [Input('btn-pieza-siguiente', 'n_clicks'),
+                   Input('btn-pieza-anterior', 'n_clicks'),
+                   Input('btn-modelo-completo', 'n_clicks')]
+        if self.reproduccion_en_cliente:
+            app.clientside_callback(
+                ClientsideFunction(namespace='reproduccion', function_name='paso'),
+                [Output('grafica-3d', 'figure'),
+                 Output('contador-piezas', 'children'),
+                 Output('indice-paso', 'data')],
+                botones,
+                [State('grafica-3d', 'figure'),
+                 State('orden-pasos', 'data'),
+                 State('indice-paso', 'data')]
+            )
+            return
+
+        app.callback(
+            [Output('grafica-3d', 'figure'),
+             Output('contador-piezas', 'children'),
+             Output('piezas-mostradas', 'data')],
+            botones,
+            [State('piezas-mostradas', 'data'),
+             State('id-sesion', 'data')]
+        )(self.actualizar_modelo)
+
+        if self.recarga_activa:
+            app.callback(
+                [Output('grafica-3d', 'figure', allow_duplicate=True),
+                 Output('contador-piezas', 'children', allow_duplicate=True),
+                 Output('piezas-mostradas', 'data', allow_duplicate=True),
+                 Output('version-escena', 'data')],
+                Input('recarga-escena', 'n_intervals'),
+                [State('piezas-mostradas', 'data'),
+                 State('version-escena', 'data'),
+                 State('id-sesion', 'data')],
+                prevent_initial_call=True
+            )(self.recargar_figura)
+
+        app.clientside_callback(
+            ClientsideFunction(namespace='sesion', function_name='crear_id'),
+            Output('id-sesion', 'data'),
+            Input('id-sesion', 'modified_timestamp'),
+            State('id-sesion', 'data')
+        )
@@ -0,0 +1,132 @@
+"""
+Lo que main.py necesita de los componentes de un STL además de su
+geometría: el índice espacial para resolver clics (IndiceEspacial), la
+prioridad y dirección sugeridas por el grafo de contactos, por pieza la
+primera pieza que tapa cada cara (utils.ocultas) y los niveles de detalle
+reducidos de cada pieza (utils.lod).
+
+Se calcula una vez por contenido del STL y se guarda en disco junto a los
+componentes (utils.stl.DIRECTORIO_CACHE) y en un LRU del proceso. Las
+recargas de la página y los demás workers lo toman de ahí en lugar de
+recalcularlo, y los callbacks lo piden por la ruta del STL en vez de
+guardarlo en variables globales.
+
+    python -m utils.analisis HACKATHON.1_AllCATPart.stl
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import stl
+from utils.IndiceEspacial import IndiceEspacial
+from utils.contactos import contactos, grafo_contactos, sugerir_ensamblaje, tolerancia_mallas
+from utils.ensamblaje import detectar_eje_vertical
+from utils.lod import generar_niveles
+from utils.ocultas import caras_ocultas
+
+# Se incrementa cuando cambia lo que se guarda o cómo se calcula
+VERSION_ANALISIS = 3
+
+TAM_LRU = 4
+
+_lru = OrderedDict()
+
+
+def analizar_stl(ruta_stl):
+    """
+    {'indice': IndiceEspacial, 'sugerencias': [{'priority', 'direction'}],
+    'ocultas': [arreglo por pieza], 'niveles': [[(vertices, caras)] por pieza]}
+    de los componentes de ruta_stl; los niveles van de más a menos detalle,
+    sin la malla completa.
+    """
+    digest = stl.hash_archivo(ruta_stl)
+    if digest in _lru:
+        _lru.move_to_end(digest)
+        return _lru[digest]
+
+    ruta_cache = os.path.join(stl.DIRECTORIO_CACHE,
+                              f"{stl.clave_cache(digest)}.analisis.v{VERSION_ANALISIS}.npz")
+    if os.path.exists(ruta_cache):
+        analisis = _cargar(ruta_cache)
+    else:
+        inicio = time.perf_counter()
+        analisis = _calcular(stl.cargar_componentes(ruta_stl))
+        logging.info(f"Análisis de {ruta_stl}: {time.perf_counter() - inicio:.2f} s")
+        os.makedirs(stl.DIRECTORIO_CACHE, exist_ok=True)
+        _guardar(ruta_cache, analisis)
+
+    _lru[digest] = analisis
+    while len(_lru) > TAM_LRU:
+        _lru.popitem(last=False)
+    return analisis
+
+
+def _calcular(componentes):
+    mallas = [(c.vertices, c.faces) for c in componentes]
+    tolerancia = tolerancia_mallas(mallas)
+    grafo = grafo_contactos(mallas, contactos(mallas, tolerancia))
+    ocultas = caras_ocultas(mallas)
+    return {
+        'indice': IndiceEspacial(mallas),
+        'sugerencias': sugerir_ensamblaje(mallas, grafo, tolerancia, detectar_eje_vertical(mallas, ocultas)),
+        'ocultas': ocultas,
+        'niveles': [generar_niveles(vertices, caras) for vertices, caras in mallas],
+    }
+
+
+def _guardar(ruta, analisis):
+    ocultas = analisis['ocultas']
+    # Los niveles de todas las piezas, uno detrás de otro
+    niveles = [nivel for niveles_pieza in analisis['niveles'] for nivel in niveles_pieza]
+    # Escribir a un temporal y renombrar, para que otro proceso nunca lea un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        np.savez(
+            archivo,
+            sugerencias=np.array(json.dumps(analisis['sugerencias'], ensure_ascii=False)),
+            ocultas=np.concatenate([np.empty(0, dtype=np.int64)] + list(ocultas)),
+            fin_ocultas=np.cumsum([0] + [len(o) for o in ocultas]),
+            niveles_por_pieza=np.array([len(n) for n in analisis['niveles']], dtype=np.int64),
+            niveles_vertices=np.concatenate([np.empty((0, 3))] + [v for v, _ in niveles]),
+            niveles_caras=np.concatenate([np.empty((0, 3), dtype=np.int64)] + [c for _, c in niveles]),
+            fin_niveles_vertices=np.cumsum([0] + [len(v) for v, _ in niveles]),
+            fin_niveles_caras=np.cumsum([0] + [len(c) for _, c in niveles]),
+            **{f"indice_{nombre}": arreglo for nombre, arreglo in analisis['indice'].arreglos().items()},
+        )
+    os.replace(temporal, ruta)
+
+
+def _cargar(ruta):
+    with np.load(ruta) as datos:
+        ocultas, fin = datos['ocultas'], datos['fin_ocultas']
+        indice = IndiceEspacial.desde_arreglos(
+            datos['indice_triangulos'], datos['indice_piezas'], datos['indice_minimo'], datos['indice_maximo'])
+        sugerencias = json.loads(str(datos['sugerencias']))
+        v, c = datos['niveles_vertices'], datos['niveles_caras']
+        fin_v, fin_c = datos['fin_niveles_vertices'], datos['fin_niveles_caras']
+        niveles = [(v[fin_v[n]:fin_v[n + 1]], c[fin_c[n]:fin_c[n + 1]]) for n in range(len(fin_v) - 1)]
+        inicio_pieza = np.cumsum(np.concatenate(([0], datos['niveles_por_pieza'])))
+    return {
+        'indice': indice,
+        'sugerencias': sugerencias,
+        'ocultas': [ocultas[fin[n]:fin[n + 1]] for n in range(len(fin) - 1)],
+        'niveles': [niveles[inicio_pieza[n]:inicio_pieza[n + 1]] for n in range(len(inicio_pieza) - 1)],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcula (o lee del caché) el análisis de un STL')
+    parser.add_argument('archivos', nargs='+', help='Archivos STL')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        inicio = time.perf_counter()
+        analisis = analizar_stl(ruta)
+        n_ocultas = sum(int((o >= 0).sum()) for o in analisis['ocultas'])
+        print(f"{ruta}: {len(analisis['sugerencias'])} piezas, {n_ocultas} caras ocultas "
+              f"({time.perf_counter() - inicio:.2f} s)")
@@ -0,0 +1,140 @@
+"""
+Codificación de la geometría de las trazas Mesh3d que se envían al navegador.
+
+Con listas, Dash escribe cada coordenada float64 como texto decimal y cada
+color de cara como una tripleta. plotly.js (desde 2.28) acepta en su lugar
+arreglos tipados en base64, {'dtype': 'f4', 'bdata': ...}, que además se
+decodifican sin pasar por el parser de JSON.
+
+Modos (CODIFICACION_GEOMETRIA en los visores):
+    'lista'  como antes: listas de números y un color por cara
+    'f4'     coordenadas float32, índices uint16 o uint32 y, en lugar de un
+             color por cara, un solo color por traza o un índice de paleta
+             (intensity por celda con una escala de colores escalonada)
+    'i2'     como 'f4', con las coordenadas cuantizadas a int16 por traza;
+             la escala y el desplazamiento de cada eje van en
+             meta['cuantizacion'] y las decodifica assets/reproduccion.js
+             (plotly no las entiende por sí solo). Solo sirve en los visores
+             con reproducción en el cliente; los demás (main.py, draw.py,
+             VisorPasos sin reproduccion_en_cliente) usan 'f4' en su lugar
+             y lo avisan en el log (ver modo_visor)
+
+    python benchmark_codificacion.py   mide bytes y tiempo de decodificación
+"""
+import base64
+import logging
+
+import numpy as np
+
+MODOS = ('lista', 'f4', 'i2')
+
+# Pasos de la cuantización a int16 en cada eje
+_NIVELES_I2 = 65535
+
+
+def modo_visor(modo, decodifica_en_cliente=False):
+    """
+    Modo con el que un visor envía la geometría cuando le piden `modo`: sin
+    decodificación en el cliente, 'i2' pasa a 'f4' con una advertencia.
+    ValueError si el modo no existe.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de codificación desconocido: {modo}")
+    if modo == 'i2' and not decodifica_en_cliente:
+        logging.warning("CODIFICACION_GEOMETRIA='i2' necesita la decodificación de assets/reproduccion.js, "
+                        "que este visor no usa; se envía 'f4'")
+        return 'f4'
+    return modo
+
+
+def arreglo_tipado(valores, dtype):
+    """Arreglo tipado de plotly.js: {'dtype', 'bdata'} con los valores en little-endian"""
+    datos = np.ascontiguousarray(valores, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(datos.tobytes()).decode('ascii')}
+
+
+def decodificar_arreglo(arreglo):
+    """Inverso de arreglo_tipado; las listas se devuelven como arreglos de numpy"""
+    if isinstance(arreglo, dict) and 'bdata' in arreglo:
+        return np.frombuffer(base64.b64decode(arreglo['bdata']), dtype=np.dtype(arreglo['dtype']).newbyteorder('<'))
+    return np.asarray(arreglo)
+
+
+def cuantizar(vertices):
+    """
+    (cuantizados int16 (n, 3), escala, desplazamiento) tales que
+    vertices ≈ cuantizados * escala + desplazamiento; el error por eje es a
+    lo sumo la mitad de escala, es decir rango / 131070.
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    minimo = vertices.min(axis=0) if len(vertices) else np.zeros(3)
+    rango = vertices.max(axis=0) - minimo if len(vertices) else np.zeros(3)
+    escala = np.where(rango > 0, rango / _NIVELES_I2, 1.0)
+    cuantizados = np.round((vertices - minimo) / escala) - 32768
+    desplazamiento = minimo + 32768 * escala
+    return cuantizados.astype(np.int16), escala, desplazamiento
+
+
+def codificar_traza(traza, modo):
+    """Traza Mesh3d (objeto de plotly o dict) como dict con su geometría en `modo`"""
+    if modo not in MODOS:
+        raise ValueError(f"Modo de codificación desconocido: {modo}")
+    traza = traza.to_plotly_json() if hasattr(traza, 'to_plotly_json') else dict(traza)
+    if modo == 'lista':
+        return traza
+
+    ejes = [np.asarray(traza.get(eje, ()), dtype=float) for eje in 'xyz']
+    if len(ejes[0]):
+        if modo == 'i2':
+            cuantizados, escala, desplazamiento = cuantizar(np.column_stack(ejes))
+            for n, eje in enumerate('xyz'):
+                traza[eje] = arreglo_tipado(cuantizados[:, n], 'i2')
+            traza['meta'] = {**(traza.get('meta') or {}), 'cuantizacion': {
+                'escala': escala.tolist(), 'desplazamiento': desplazamiento.tolist()}}
+        else:
+            for eje, valores in zip('xyz', ejes):
+                traza[eje] = arreglo_tipado(valores, 'f4')
+
+    indices = [np.asarray(traza.get(eje, ()), dtype=np.int64) for eje in 'ijk']
+    if len(indices[0]):
+        dtype = 'u2' if max(int(i.max()) for i in indices) < 1 << 16 else 'u4'
+        for eje, valores in zip('ijk', indices):
+            traza[eje] = arreglo_tipado(valores, dtype)
+
+    if traza.get('facecolor') is not None and len(traza['facecolor']):
+        _colores_por_paleta(traza)
+    return traza
+
+
+def codificar_figura(figura, modo):
+    """Figura de plotly (o dict con 'data' y 'layout') con todas sus trazas codificadas"""
+    if hasattr(figura, 'to_plotly_json'):
+        figura = figura.to_plotly_json()
+    return {**figura, 'data': [codificar_traza(traza, modo) for traza in figura['data']]}
+
+
+def _colores_por_paleta(traza):
+    # Un color por cara -> un color por traza, o el índice de cada cara en
+    # una paleta que plotly pinta con intensity por celda
+    colores = traza.pop('facecolor')
+    if isinstance(colores[0], str):
+        paleta, indice = np.unique(np.asarray(colores), return_inverse=True)
+    else:
+        valores = np.asarray(colores, dtype=float).reshape(len(colores), -1)
+        if valores.max() <= 1:
+            valores = valores * 255
+        unicos, indice = np.unique(np.round(valores).astype(int), axis=0, return_inverse=True)
+        paleta = np.array([f"rgb({r},{g},{b})" for r, g, b in unicos[:, :3]])
+    indice = indice.ravel()
+
+    if len(paleta) == 1:
+        traza['color'] = str(paleta[0])
+        return
+    n = len(paleta)
+    traza['intensity'] = arreglo_tipado(indice, 'u1' if n <= 256 else 'u2')
+    traza['intensitymode'] = 'cell'
+    # Escala escalonada: el valor k cae en la franja [k/n, (k+1)/n] del color k
+    traza['colorscale'] = [[(k + borde) / n, str(color)] for k, color in enumerate(paleta) for borde in (0, 1)]
+    traza['cmin'] = -0.5
+    traza['cmax'] = n - 0.5
+    traza['showscale'] = False
@@ -0,0 +1,267 @@
+"""
+Grafo de contactos entre piezas y orden de ensamblaje sugerido.
+
+Dos piezas están en contacto si algún vértice de una queda a menos de la
+tolerancia de un triángulo de la otra. Para no comparar todas contra todas,
+vértices y triángulos se reparten en una rejilla uniforme (hash espacial) y
+solo se prueban los pares que caen en la misma celda.
+
+El grafo se guarda con la escena, en scene_configuration['contact_graph'],
+junto al hash de la geometría de cada pieza; al pedirlo de nuevo solo se
+recalculan las piezas que cambiaron y sus vecinas.
+
+    python -m utils.contactos configuracion_unity25.json [--aplicar]
+"""
+import argparse
+import heapq
+import json
+import os
+
+import networkx as nx
+import numpy as np
+
+from utils.IndiceEspacial import punto_mas_cercano_triangulos
+from utils.ensamblaje import detectar_eje_vertical, puede_entrar, vectores_direccion
+from utils.escena import cargar_escena
+from utils.mallas import hash_geometria
+
+# Tolerancia de contacto, relativa a la diagonal de la escena
+TOLERANCIA_RELATIVA = 1e-3
+
+# Dirección de las piezas sin vecinas ya colocadas (la de siempre en el editor)
+DIRECCION_POR_DEFECTO = 'de abajo hacia arriba'
+
+# Pares (vértice, triángulo) que se prueban a la vez
+_TAM_LOTE = 1 << 20
+
+
+def tolerancia_mallas(mallas):
+    vertices = [np.asarray(v, dtype=float).reshape(-1, 3) for v, _ in mallas]
+    vertices = np.concatenate(vertices) if vertices else np.empty((0, 3))
+    if len(vertices) == 0:
+        return TOLERANCIA_RELATIVA
+    return TOLERANCIA_RELATIVA * max(float(np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))), 1.0)
+
+
+def contactos(mallas, tolerancia, afectadas=None):
+    """
+    Contactos entre mallas (vertices, caras) como {(a, b): n}, con a < b
+    índices de las mallas y n la cantidad de vértices en contacto. Con
+    `afectadas` solo se calculan los pares que incluyen alguna de ellas.
+    """
+    vertices = [np.asarray(v, dtype=float).reshape(-1, 3) for v, _ in mallas]
+    triangulos = [v[np.asarray(c, dtype=np.int64).reshape(-1, 3)] for v, (_, c) in zip(vertices, mallas)]
+
+    participantes = np.arange(len(mallas))
+    if afectadas is not None:
+        # Las afectadas y las piezas cuya caja toca la de alguna afectada
+        afectadas = np.asarray(sorted(afectadas), dtype=np.int64)
+        minimos = np.array([v.min(axis=0) if len(v) else np.full(3, np.inf) for v in vertices]).reshape(-1, 3)
+        maximos = np.array([v.max(axis=0) if len(v) else np.full(3, -np.inf) for v in vertices]).reshape(-1, 3)
+        tocan = ((minimos[None, :] <= maximos[afectadas, None] + tolerancia)
+                 & (maximos[None, :] >= minimos[afectadas, None] - tolerancia)).all(axis=2)
+        participantes = np.flatnonzero(tocan.any(axis=0))
+    if len(participantes) < 2:
+        return {}
+
+    V = np.concatenate([vertices[n] for n in participantes])
+    pieza_v = np.repeat(participantes, [len(vertices[n]) for n in participantes])
+    T = np.concatenate([triangulos[n] for n in participantes])
+    pieza_t = np.repeat(participantes, [len(triangulos[n]) for n in participantes])
+    if len(V) == 0 or len(T) == 0:
+        return {}
+
+    # Celdas que cubre cada triángulo, con su caja agrandada en la tolerancia
+    t_min, t_max = T.min(axis=1) - tolerancia, T.max(axis=1) + tolerancia
+    celda = max(float(np.median((t_max - t_min).max(axis=1))), tolerancia)
+    origen = t_min.min(axis=0)
+    c_min = np.floor((t_min - origen) / celda).astype(np.int64)
+    c_max = np.floor((t_max - origen) / celda).astype(np.int64)
+    dimensiones = c_max.max(axis=0) + 1
+
+    lados = c_max - c_min + 1
+    n_celdas = lados.prod(axis=1)
+    triangulo = np.repeat(np.arange(len(T)), n_celdas)
+    local = np.arange(n_celdas.sum()) - np.repeat(np.cumsum(n_celdas) - n_celdas, n_celdas)
+    lado_y, lado_z = np.repeat(lados[:, 1], n_celdas), np.repeat(lados[:, 2], n_celdas)
+    cx = c_min[triangulo, 0] + local // (lado_y * lado_z)
+    cy = c_min[triangulo, 1] + (local // lado_z) % lado_y
+    cz = c_min[triangulo, 2] + local % lado_z
+    claves_t = (cx * dimensiones[1] + cy) * dimensiones[2] + cz
+    orden = np.argsort(claves_t, kind='stable')
+    claves_t, triangulo = claves_t[orden], triangulo[orden]
+
+    # Celda de cada vértice; fuera de la rejilla no hay triángulo cerca
+    celdas_v = np.floor((V - origen) / celda).astype(np.int64)
+    adentro = ((celdas_v >= 0) & (celdas_v < dimensiones)).all(axis=1)
+    claves_v = np.where(adentro, (celdas_v[:, 0] * dimensiones[1] + celdas_v[:, 1]) * dimensiones[2] + celdas_v[:, 2], -1)
+    desde = np.searchsorted(claves_t, claves_v, side='left')
+    cantidad = np.searchsorted(claves_t, claves_v, side='right') - desde
+
+    encontrados = []
+    acumulado = np.concatenate(([0], np.cumsum(cantidad)))
+    inicio = 0
+    while inicio < len(V):
+        # Lotes de vértices con a lo sumo _TAM_LOTE pares candidatos
+        fin = max(inicio + 1, int(np.searchsorted(acumulado, acumulado[inicio] + _TAM_LOTE, side='right')) - 1)
+        fin = min(fin, len(V))
+        lote = np.arange(inicio, fin)
+        v = np.repeat(lote, cantidad[lote])
+        t = triangulo[np.arange(len(v)) - np.repeat(acumulado[lote] - acumulado[inicio], cantidad[lote])
+                      + np.repeat(desde[lote], cantidad[lote])]
+
+        otra = pieza_v[v] != pieza_t[t]
+        if afectadas is not None:
+            otra &= np.isin(pieza_v[v], afectadas) | np.isin(pieza_t[t], afectadas)
+        v, t = v[otra], t[otra]
+        cercanos = punto_mas_cercano_triangulos(V[v], T[t])
+        toca = ((cercanos - V[v]) ** 2).sum(axis=1) <= tolerancia ** 2
+        encontrados.append(np.column_stack((v[toca], pieza_t[t[toca]])))
+        inicio = fin
+
+    # Cada vértice cuenta una vez por pieza con la que toca
+    pares = np.unique(np.concatenate(encontrados), axis=0)
+    if len(pares) == 0:
+        return {}
+    a, b = pieza_v[pares[:, 0]], pares[:, 1]
+    aristas, conteo = np.unique(np.column_stack((np.minimum(a, b), np.maximum(a, b))), axis=0, return_counts=True)
+    return {(int(x), int(y)): int(n) for (x, y), n in zip(aristas, conteo)}
+
+
+def grafo_contactos(mallas, aristas):
+    """Grafo de networkx con un nodo por malla y el atributo 'contactos' en cada arista"""
+    grafo = nx.Graph()
+    grafo.add_nodes_from(range(len(mallas)))
+    grafo.add_edges_from((a, b, {'contactos': n}) for (a, b), n in aristas.items())
+    return grafo
+
+
+def grafo_escena(config_data):
+    """
+    Grafo de contactos de una escena (nodos = índices de sus piezas). Usa y
+    actualiza el grafo guardado en scene_configuration['contact_graph']: las
+    piezas cuya geometría no cambió conservan sus aristas.
+    """
+    escena = config_data['scene_configuration']
+    piezas = escena['pieces']
+    ids = [p.get('id', n) for n, p in enumerate(piezas)]
+    hashes = [hash_geometria(p) for p in piezas]
+    mallas = [(p['mesh']['vertices'], p['mesh']['faces']) for p in piezas]
+    posicion = {id_pieza: n for n, id_pieza in enumerate(ids)}
+
+    guardado = escena.get('contact_graph')
+    if guardado is None:
+        tolerancia = tolerancia_mallas(mallas)
+        aristas = contactos(mallas, tolerancia)
+    else:
+        tolerancia = guardado['tolerance']
+        anteriores = {id_pieza: h for id_pieza, h in guardado['pieces']}
+        afectadas = {n for n, (id_pieza, h) in enumerate(zip(ids, hashes)) if anteriores.get(id_pieza) != h}
+        aristas = {
+            (posicion[a], posicion[b]): n for a, b, n in guardado['edges']
+            if a in posicion and b in posicion
+            and posicion[a] not in afectadas and posicion[b] not in afectadas
+        }
+        if afectadas:
+            aristas.update(contactos(mallas, tolerancia, afectadas))
+        aristas = {(min(a, b), max(a, b)): n for (a, b), n in aristas.items()}
+
+    escena['contact_graph'] = {
+        'tolerance': tolerancia,
+        'pieces': [[id_pieza, h] for id_pieza, h in zip(ids, hashes)],
+        'edges': [[ids[a], ids[b], n] for (a, b), n in sorted(aristas.items())],
+    }
+    return grafo_contactos(mallas, aristas)
+
+
+def sugerir_ensamblaje(mallas, grafo, tolerancia=None, eje_vertical=None):
+    """
+    Prioridad y dirección sugeridas para cada malla, como lista de
+    {'priority', 'direction'} en el orden de `mallas`. Sin `eje_vertical`
+    se detecta de las mallas (utils.ensamblaje.detectar_eje_vertical).
+
+    Cada grupo conectado empieza por su pieza más baja; después entra la
+    pieza con más contactos con las ya colocadas (a igualdad, la más baja).
+    La dirección es la que lleva a la pieza hacia sus vecinas ya colocadas,
+    descartando las que chocan con ellas.
+    """
+    if tolerancia is None:
+        tolerancia = tolerancia_mallas(mallas)
+    if eje_vertical is None:
+        eje_vertical = detectar_eje_vertical(mallas)
+    vertices = [np.asarray(v, dtype=float).reshape(-1, 3) for v, _ in mallas]
+    centros = np.array([v.mean(axis=0) if len(v) else np.zeros(3) for v in vertices]).reshape(-1, 3)
+    bajo = np.array([v[:, eje_vertical].min() if len(v) else np.inf for v in vertices])
+
+    colocadas = {}
+    componentes = sorted(nx.connected_components(grafo), key=lambda c: min(bajo[n] for n in c))
+    for componente in componentes:
+        base = min(componente, key=lambda n: (bajo[n], -grafo.degree(n, weight='contactos')))
+        peso = {base: 0}
+        pendientes = [(0, bajo[base], base)]
+        while pendientes:
+            negativo, _, pieza = heapq.heappop(pendientes)
+            if pieza in colocadas or -negativo != peso[pieza]:
+                continue
+            colocadas[pieza] = _direccion_sugerida(pieza, grafo, colocadas, centros, mallas, tolerancia,
+                                                   eje_vertical)
+            for vecina, datos in grafo[pieza].items():
+                if vecina not in colocadas:
+                    peso[vecina] = peso.get(vecina, 0) + datos['contactos']
+                    heapq.heappush(pendientes, (-peso[vecina], bajo[vecina], vecina))
+
+    # colocadas conserva el orden de inserción: ese es el orden de ensamblaje
+    sugerencias = [None] * len(mallas)
+    for prioridad, (pieza, direccion) in enumerate(colocadas.items()):
+        sugerencias[pieza] = {'priority': prioridad, 'direction': direccion}
+    return sugerencias
+
+
+def _direccion_sugerida(pieza, grafo, colocadas, centros, mallas, tolerancia, eje_vertical):
+    vecinas = [v for v in grafo[pieza] if v in colocadas]
+    if not vecinas:
+        return DIRECCION_POR_DEFECTO
+
+    # Hacia dónde quedan las vecinas ya colocadas, ponderado por contactos
+    pesos = np.array([grafo[pieza][v]['contactos'] for v in vecinas], dtype=float)
+    hacia = ((centros[vecinas] - centros[pieza]) * pesos[:, None]).sum(axis=0)
+    vectores = vectores_direccion(eje_vertical)
+    candidatas = sorted(vectores, key=lambda d: -float(np.dot(vectores[d], hacia)))
+
+    fijas = [mallas[v] for v in vecinas]
+    for direccion in candidatas:
+        if puede_entrar(mallas[pieza], fijas, direccion, tolerancia, eje_vertical):
+            return direccion
+    return candidatas[0]
+
+
+def aplicar_sugerencia(config_data):
+    """Escribe en cada pieza la prioridad y dirección sugeridas (y guarda el grafo con la escena)"""
+    piezas = config_data['scene_configuration']['pieces']
+    grafo = grafo_escena(config_data)
+    mallas = [(p['mesh']['vertices'], p['mesh']['faces']) for p in piezas]
+    tolerancia = config_data['scene_configuration']['contact_graph']['tolerance']
+    for pieza, sugerencia in zip(piezas, sugerir_ensamblaje(mallas, grafo, tolerancia)):
+        pieza.update(sugerencia)
+    return config_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grafo de contactos y orden de ensamblaje sugerido')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json')
+    parser.add_argument('--aplicar', action='store_true',
+                        help='Guardar la escena con las prioridades y direcciones sugeridas (<archivo>_sugerido.json)')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        config_data = aplicar_sugerencia(cargar_escena(ruta))
+        piezas = config_data['scene_configuration']['pieces']
+        grafo = config_data['scene_configuration']['contact_graph']
+        print(f"{ruta}: {len(piezas)} piezas, {len(grafo['edges'])} contactos")
+        for pieza in sorted(piezas, key=lambda p: p['priority']):
+            print(f"  {pieza['priority']:>4}  pieza {pieza.get('id')}  {pieza['direction']}")
+
+        if args.aplicar:
+            base, extension = os.path.splitext(ruta)
+            with open(f"{base}_sugerido{extension}", 'w') as archivo:
+                json.dump(config_data, archivo, separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,386 @@
+"""
+Validación de la secuencia de ensamblaje.
+
+Cada pieza entra a su posición final desplazándose según su `direction` y en
+el orden de su `priority`. Una pieza queda bloqueada si en el camino choca
+con alguna de las ya colocadas: esto es, si alguna pieza anterior está
+"aguas arriba" de ella, en la zona que la pieza barre al llegar.
+
+Fase amplia: barrido y poda (sweep and prune) entre la caja de cada pieza
+estirada hacia atrás en su dirección y las cajas de las piezas anteriores.
+Fase fina: rayos desde los vértices y centroides de una pieza contra los
+triángulos de la otra, en ambos sentidos, emparejados con una rejilla 2D en
+el plano perpendicular a la dirección y vectorizados; y, para los choques
+de arista contra arista que ningún rayo detecta, los cruces de las aristas
+de ambas piezas proyectadas en ese mismo plano, emparejadas también por
+rejilla. La rejilla de los triángulos de cada pieza se arma una vez por eje
+y la comparten todos los pares en los que aparece (ver benchmark_ensamblaje.py).
+
+"Arriba" es el eje vertical de la escena: y en Unity, z en las escenas que
+vienen del CAD. Si no se indica se detecta de la geometría (ver
+detectar_eje_vertical).
+
+    python -m utils.ensamblaje configuracion_unity25.json [--eje-vertical z]
+"""
+import argparse
+
+import numpy as np
+
+from utils.escena import cargar_escena
+from utils.ocultas import caras_ocultas
+
+EJES = 'xyz'
+
+# Eje vertical de Unity, para escenas sin caras de contacto de las que deducirlo
+EJE_VERTICAL_UNITY = 1
+
+# Tolerancia relativa al tamaño de la escena: contactos más cercanos no bloquean
+TOLERANCIA = 1e-6
+
+# Pares de aristas que se prueban a la vez
+_TAM_LOTE = 1 << 20
+
+
+def vectores_direccion(eje_vertical):
+    """Sentido de avance de cada dirección de main.direcciones, con `eje_vertical` (0, 1 o 2) hacia arriba"""
+    arriba = np.eye(3)[eje_vertical]
+    # Izquierda y derecha van por x, salvo que x sea el vertical
+    derecha = np.eye(3)[1 if eje_vertical == 0 else 0]
+    return {
+        'de abajo hacia arriba': tuple(arriba),
+        'de arriba hacia abajo': tuple(-arriba),
+        'de derecha a izquierda': tuple(-derecha),
+        'de izquierda a derecha': tuple(derecha),
+    }
+
+
+def detectar_eje_vertical(mallas, ocultas=None):
+    """
+    Eje vertical (0, 1 o 2) de las mallas (vertices, caras): el de la normal
+    de las caras por las que las piezas se apoyan unas en otras, ponderadas
+    por área. `ocultas` es la salida de caras_ocultas, si ya se calculó. Sin
+    caras de contacto, el de Unity.
+    """
+    if ocultas is None:
+        ocultas = caras_ocultas(mallas)
+    area = np.zeros(3)
+    for (vertices, caras), oculta in zip(mallas, ocultas):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        triangulos = vertices[np.asarray(caras, dtype=np.int64).reshape(-1, 3)[oculta >= 0]]
+        normales = np.cross(triangulos[:, 1] - triangulos[:, 0], triangulos[:, 2] - triangulos[:, 0])
+        area += np.abs(normales).sum(axis=0)
+    return int(np.argmax(area)) if area.any() else EJE_VERTICAL_UNITY
+
+
+def orden_ensamblaje(piezas):
+    """Índices de las piezas ordenados por prioridad; sin prioridad, al final y en el orden del archivo"""
+    return sorted(range(len(piezas)), key=lambda n: piezas[n].get('priority', float('inf')))
+
+
+def validar_ensamblaje(config_data, eje_vertical=None):
+    """
+    Conflictos de la secuencia de ensamblaje de una escena, como lista de
+    {'pieza', 'direction', 'priority', 'bloqueada_por'} (ids de pieza).
+    Una lista vacía significa que todas las piezas pueden entrar. Sin
+    `eje_vertical` se detecta de la escena.
+    """
+    piezas = config_data['scene_configuration']['pieces']
+    if not piezas:
+        return []
+
+    # Las listas del JSON se convierten una vez, no en cada paso
+    mallas = [(np.asarray(p['mesh']['vertices'], dtype=float).reshape(-1, 3),
+               np.asarray(p['mesh']['faces'], dtype=np.int64).reshape(-1, 3)) for p in piezas]
+    if eje_vertical is None:
+        eje_vertical = detectar_eje_vertical(mallas)
+    vectores = vectores_direccion(eje_vertical)
+
+    preparadas = [_preparar(*malla) for malla in mallas]
+    triangulos = [p[1] for p in preparadas]
+    direcciones = np.array([_vector_direccion(p, vectores) for p in piezas])
+    minimos = np.array([t.reshape(-1, 3).min(axis=0) if len(t) else np.full(3, np.inf) for t in triangulos])
+    maximos = np.array([t.reshape(-1, 3).max(axis=0) if len(t) else np.full(3, -np.inf) for t in triangulos])
+
+    validas = np.isfinite(minimos).all(axis=1)
+    limite_min, limite_max = minimos[validas].min(axis=0), maximos[validas].max(axis=0)
+    tolerancia = TOLERANCIA * max(float((limite_max - limite_min).max()), 1.0)
+
+    # Zona que barre cada pieza: su caja estirada hacia atrás hasta el borde de la escena
+    barrido_min = np.where(direcciones > 0, limite_min, minimos)
+    barrido_max = np.where(direcciones < 0, limite_max, maximos)
+
+    posicion = np.empty(len(piezas), dtype=np.int64)
+    posicion[orden_ensamblaje(piezas)] = np.arange(len(piezas))
+
+    bloqueos = {}
+    for movil, fija in _barrer_y_podar(barrido_min, barrido_max, minimos, maximos, tolerancia):
+        if posicion[fija] < posicion[movil] and validas[movil] and validas[fija]:
+            if _bloquea(preparadas[movil], preparadas[fija], direcciones[movil], tolerancia):
+                bloqueos.setdefault(int(movil), []).append(int(fija))
+
+    return [
+        {
+            'pieza': piezas[movil].get('id', movil),
+            'direction': piezas[movil].get('direction'),
+            'priority': piezas[movil].get('priority'),
+            'bloqueada_por': [piezas[n].get('id', n) for n in sorted(fijas, key=lambda n: posicion[n])],
+        }
+        for movil, fijas in sorted(bloqueos.items(), key=lambda item: posicion[item[0]])
+    ]
+
+
+def puede_entrar(malla, colocadas, direccion, tolerancia, eje_vertical):
+    """
+    ¿La malla (vertices, caras) llega a su lugar desplazándose en `direccion`
+    (una de vectores_direccion) sin chocar con ninguna de las mallas `colocadas`?
+    """
+    movil = _preparar(*malla)
+    vector = np.asarray(vectores_direccion(eje_vertical)[direccion])
+    return not any(_bloquea(movil, _preparar(*fija), vector, tolerancia) for fija in colocadas)
+
+
+def _preparar(vertices, caras):
+    # Puntos desde los que se lanzan rayos (vértices y centroides, que cubren
+    # tanto piezas finas como caras grandes), triángulos y aristas de la pieza,
+    # y las rejillas de sus triángulos por eje (ver _rejilla), que se arman al usarlas
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+    triangulos = vertices[caras]
+    # Aristas (a, b) con a < b, sin repetir; unique sobre un entero por arista es
+    # mucho más rápido que sobre filas
+    aristas = np.sort(caras[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    n = max(len(vertices), 1)
+    claves = np.unique(aristas[:, 0] * n + aristas[:, 1])
+    aristas = np.column_stack((claves // n, claves % n))
+    return np.concatenate((vertices, triangulos.mean(axis=1))), triangulos, vertices[aristas], {}
+
+
+def _vector_direccion(pieza, vectores):
+    direccion = pieza.get('direction', 'de abajo hacia arriba')
+    if direccion not in vectores:
+        raise ValueError(f"Dirección desconocida en la pieza {pieza.get('id')}: {direccion!r}")
+    return vectores[direccion]
+
+
+def _barrer_y_podar(min_a, max_a, min_b, max_b, tolerancia):
+    """
+    Pares (a, b) cuyas cajas se superan en más de `tolerancia` en los tres
+    ejes. Se ordenan las cajas b por su mínimo en el eje más discriminante y
+    para cada caja a se toma solo el tramo de b que puede solaparla.
+    """
+    if len(min_a) == 0 or len(min_b) == 0:
+        return []
+
+    # El eje en el que las cajas barridas se estiran menos separa mejor
+    eje = int(np.argmin((max_a - min_a).sum(axis=0)))
+    orden = np.argsort(min_b[:, eje], kind='stable')
+    inicios_b = min_b[orden, eje]
+    extension = float((max_b[:, eje] - min_b[:, eje]).max())
+
+    desde = np.searchsorted(inicios_b, min_a[:, eje] - extension, side='left')
+    hasta = np.searchsorted(inicios_b, max_a[:, eje] - tolerancia, side='left')
+    cantidad = np.maximum(hasta - desde, 0)
+
+    a = np.repeat(np.arange(len(min_a)), cantidad)
+    b = orden[np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad) + np.repeat(desde, cantidad)]
+
+    solapan = ((np.minimum(max_a[a], max_b[b]) - np.maximum(min_a[a], min_b[b])) > tolerancia).all(axis=1)
+    return list(zip(a[solapan], b[solapan]))
+
+
+def _bloquea(movil, fija, direccion, tolerancia):
+    """
+    ¿Choca la pieza `movil` con `fija` al llegar a su lugar desplazándose en
+    `direccion`? Cada pieza es (muestras, triangulos, aristas, rejillas) de _preparar.
+    """
+    direccion = np.asarray(direccion)
+    muestras_movil, _, aristas_movil, _ = movil
+    muestras_fija, _, aristas_fija, _ = fija
+
+    # Un punto de la pieza móvil venía de p - t·d: hay choque si ese rayo
+    # hacia atrás cruza la pieza fija, o si un rayo hacia adelante desde la
+    # pieza fija cruza la móvil
+    if _algun_cruce(muestras_movil, fija, -direccion, tolerancia):
+        return True
+    if _algun_cruce(muestras_fija, movil, direccion, tolerancia):
+        return True
+    return _cruce_aristas(aristas_movil, aristas_fija, direccion, tolerancia)
+
+
+def _cruce_aristas(aristas_movil, aristas_fija, direccion, tolerancia):
+    """
+    ¿Alguna arista de la pieza móvil pasa a través de una de la fija? Pasa
+    si, proyectadas en el plano perpendicular a la dirección, se cruzan por
+    dentro de ambas y en el cruce la fija queda detrás de la móvil.
+    """
+    eje = int(np.argmax(np.abs(direccion)))
+    plano = [n for n in range(3) if n != eje]
+    signo = np.sign(direccion[eje])
+
+    if len(aristas_movil) == 0 or len(aristas_fija) == 0:
+        return False
+    # Solo los pares de aristas cuyas cajas 2D se tocan
+    p_plano, q_plano = aristas_movil[:, :, plano], aristas_fija[:, :, plano]
+    extension = np.concatenate(((p_plano.max(axis=1) - p_plano.min(axis=1)).max(axis=1),
+                                (q_plano.max(axis=1) - q_plano.min(axis=1)).max(axis=1)))
+    celda = max(float(np.median(extension)), tolerancia)
+    movil, fija = _pares_rejilla(p_plano.min(axis=1), p_plano.max(axis=1),
+                                 q_plano.min(axis=1), q_plano.max(axis=1), celda)
+    eps = 1e-9
+
+    # Una fila por coordenada (x0, y0, x1, y1 en el plano y la profundidad de
+    # cada punta): los pares se arman con take y se opera sobre arreglos 1D
+    columnas = [plano[0], plano[1], 3 + plano[0], 3 + plano[1], eje, 3 + eje]
+    escala = np.array([1, 1, 1, 1, signo, signo])[:, None]
+    filas_movil = np.ascontiguousarray(aristas_movil.reshape(-1, 6)[:, columnas].T * escala)
+    filas_fija = np.ascontiguousarray(aristas_fija.reshape(-1, 6)[:, columnas].T * escala)
+    for inicio in range(0, len(movil), _TAM_LOTE):
+        px, py, px1, py1, prof_p0, prof_p1 = filas_movil.take(movil[inicio:inicio + _TAM_LOTE], axis=1)
+        qx, qy, qx1, qy1, prof_q0, prof_q1 = filas_fija.take(fija[inicio:inicio + _TAM_LOTE], axis=1)
+        dpx, dpy, dqx, dqy = px1 - px, py1 - py, qx1 - qx, qy1 - qy
+
+        # p0 + s·dp = q0 + r·dq, con s y r estrictamente entre 0 y 1
+        denominador = dpx * dqy - dpy * dqx
+        validos = np.abs(denominador) > 1e-12 * np.sqrt((dpx ** 2 + dpy ** 2) * (dqx ** 2 + dqy ** 2))
+        denominador = np.where(validos, denominador, 1.0)
+        wx, wy = qx - px, qy - py
+        s = (wx * dqy - wy * dqx) / denominador
+        r = (wx * dpy - wy * dpx) / denominador
+
+        # La móvil venía de atrás: la fija está en su camino si queda detrás en el cruce
+        detras = prof_q0 + r * (prof_q1 - prof_q0) < prof_p0 + s * (prof_p1 - prof_p0) - tolerancia
+        if (validos & (s > eps) & (s < 1 - eps) & (r > eps) & (r < 1 - eps) & detras).any():
+            return True
+    return False
+
+
+def _pares_rejilla(min_a, max_a, min_b, max_b, celda):
+    """
+    Pares (i, j) de cajas 2D de a y de b que comparten alguna celda de lado
+    `celda` (entre ellos, todos los que se solapan). Cada par sale una sola
+    vez: de la celda de la esquina mínima de su intersección.
+    """
+    if len(min_a) == 0 or len(min_b) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    origen = np.minimum(min_a.min(axis=0), min_b.min(axis=0))
+    c_min_a, c_max_a, c_min_b, c_max_b = (np.floor((c - origen) / celda).astype(np.int64)
+                                          for c in (min_a, max_a, min_b, max_b))
+    ancho = int(max(c_max_a[:, 1].max(), c_max_b[:, 1].max())) + 1
+    claves_a, item_a = _celdas(c_min_a, c_max_a, ancho)
+    claves_b, item_b = _celdas(c_min_b, c_max_b, ancho)
+
+    desde = np.searchsorted(claves_a, claves_b, side='left')
+    cantidad = np.searchsorted(claves_a, claves_b, side='right') - desde
+    j = np.repeat(item_b, cantidad)
+    clave = np.repeat(claves_b, cantidad)
+    i = item_a[np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+               + np.repeat(desde, cantidad)]
+
+    x, y = (np.floor((np.maximum(min_a[:, n].take(i), min_b[:, n].take(j)) - origen[n]) / celda).astype(np.int64)
+            for n in (0, 1))
+    unico = x * ancho + y == clave
+    return i[unico], j[unico]
+
+
+def _celdas(c_min, c_max, ancho):
+    # Claves (ordenadas) de las celdas entre c_min y c_max de cada caja, y la caja de cada una
+    n_celdas = (c_max - c_min + 1).prod(axis=1)
+    item = np.repeat(np.arange(len(c_min)), n_celdas)
+    desplazamiento = np.arange(n_celdas.sum()) - np.repeat(np.cumsum(n_celdas) - n_celdas, n_celdas)
+    alto = np.repeat(c_max[:, 1] - c_min[:, 1] + 1, n_celdas)
+    claves = ((np.repeat(c_min[:, 0], n_celdas) + desplazamiento // alto) * ancho
+              + np.repeat(c_min[:, 1], n_celdas) + desplazamiento % alto)
+    orden = np.argsort(claves, kind='stable')
+    return claves[orden], item[orden]
+
+
+def _rejilla(pieza, eje, tolerancia):
+    """
+    Triángulos de una pieza de _preparar proyectados en el plano perpendicular
+    a `eje`, anotados en las celdas de una rejilla 2D que cubre la caja de
+    cada uno: (origen, celda, ancho, claves ordenadas, triángulo de cada clave,
+    esquinas y profundidades). Se arma una vez por pieza y eje, y la reusan
+    todas las piezas que se prueban contra esta.
+    """
+    _, triangulos, _, rejillas = pieza
+    if (eje, tolerancia) not in rejillas:
+        plano = [n for n in range(3) if n != eje]
+        esquinas = triangulos[:, :, plano]
+        caja_min, caja_max = esquinas.min(axis=1), esquinas.max(axis=1)
+        # Celdas de la mitad del triángulo típico: cada una suma pocos
+        # triángulos cuya caja no contiene al punto
+        celda = max(0.5 * float(np.median((caja_max - caja_min).max(axis=1))), tolerancia)
+        origen = caja_min.min(axis=0)
+        c_min = np.floor((caja_min - origen) / celda).astype(np.int64)
+        c_max = np.floor((caja_max - origen) / celda).astype(np.int64)
+        ancho = int(c_max[:, 1].max()) + 1
+        claves, triangulo = _celdas(c_min, c_max, ancho)
+        # Una fila por coordenada: los candidatos se toman con take y se opera sobre arreglos 1D
+        rejillas[eje, tolerancia] = (origen, celda, ancho, claves, triangulo,
+                                     np.ascontiguousarray(esquinas.reshape(-1, 6).T),
+                                     np.ascontiguousarray(triangulos[:, :, eje].T))
+    return rejillas[eje, tolerancia]
+
+
+def _algun_cruce(origenes, pieza, direccion, tolerancia):
+    """
+    ¿Algún rayo origen + t·direccion (t > tolerancia) atraviesa el interior
+    de algún triángulo de la pieza? Las direcciones van por un eje, así que
+    todo se proyecta al plano perpendicular y los pares (origen, triángulo)
+    salen de la rejilla 2D de la pieza en vez de probar todos contra todos.
+    """
+    eje = int(np.argmax(np.abs(direccion)))
+    plano = [n for n in range(3) if n != eje]
+    signo = np.sign(direccion[eje])
+    if len(pieza[1]) == 0 or len(origenes) == 0:
+        return False
+    origen, celda, ancho, claves_t, triangulo, esquinas, profundidades = _rejilla(pieza, eje, tolerancia)
+
+    # Solo los orígenes que quedan detrás de algún triángulo
+    profundidad = origenes[:, eje] * signo
+    atras = profundidad < (profundidades * signo).max() - tolerancia
+    puntos, profundidad = origenes[atras][:, plano], profundidad[atras]
+
+    # Celda de cada origen; los que caen fuera de la rejilla no tocan nada
+    celdas_o = np.floor((puntos - origen) / celda).astype(np.int64)
+    adentro = (celdas_o >= 0).all(axis=1) & (celdas_o[:, 1] < ancho)
+    claves_o = np.where(adentro, celdas_o[:, 0] * ancho + celdas_o[:, 1], -1)
+    desde = np.searchsorted(claves_t, claves_o, side='left')
+    cantidad = np.searchsorted(claves_t, claves_o, side='right') - desde
+    o = np.repeat(np.arange(len(puntos)), cantidad)
+    t = triangulo[np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+                  + np.repeat(desde, cantidad)]
+    if len(o) == 0:
+        return False
+
+    # Coordenadas baricéntricas del origen proyectado en cada triángulo candidato
+    ax, ay, bx, by, cx, cy = esquinas.take(t, axis=1)
+    ox, oy = np.ascontiguousarray(puntos.T).take(o, axis=1)
+    v0x, v0y, v1x, v1y, v2x, v2y = bx - ax, by - ay, cx - ax, cy - ay, ox - ax, oy - ay
+    area = v0x * v1y - v0y * v1x
+    validos = np.abs(area) > 1e-12 * np.maximum(v0x ** 2 + v0y ** 2, 1e-300)
+    area = np.where(validos, area, 1.0)
+    u = (v2x * v1y - v2y * v1x) / area
+    v = (v0x * v2y - v0y * v2x) / area
+    eps = 1e-9
+
+    # Estrictamente dentro del triángulo (rozar un borde no es un choque) y
+    # con el triángulo por delante del origen en la dirección del rayo
+    p0, p1, p2 = profundidades.take(t, axis=1) * signo
+    cruce = p0 + u * (p1 - p0) + v * (p2 - p0)
+    return bool((validos & (u > eps) & (v > eps) & (u + v < 1 - eps)
+                 & (cruce > profundidad.take(o) + tolerancia)).any())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Valida dirección y prioridad de ensamblaje de escenas de Unity')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json o .escena')
+    parser.add_argument('--eje-vertical', choices=EJES, help='Eje hacia arriba (por defecto se detecta de la escena)')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        eje_vertical = EJES.index(args.eje_vertical) if args.eje_vertical else None
+        conflictos = validar_ensamblaje(cargar_escena(ruta), eje_vertical)
+        print(f"{ruta}: {len(conflictos)} conflicto(s)")
+        for conflicto in conflictos:
+            print(f"  pieza {conflicto['pieza']} ({conflicto['direction']}, prioridad {conflicto['priority']}) "
+                  f"bloqueada por {conflicto['bloqueada_por']}")
@@ -0,0 +1,239 @@
+"""
+Lectura de escenas de Unity.
+
+Esquema v1 (el que consume Unity hoy): cada pieza guarda sus vértices dos
+veces, en mesh.vertices y repartidos en position.x/y/z.
+
+Esquema v2: scene_configuration.schema_version = 2 y position es el centroide
+de la pieza ({'x': float, 'y': float, 'z': float}); la geometría solo vive en
+mesh. Los lectores trabajan siempre sobre v2, las escenas v1 se convierten al
+cargarlas.
+
+Esquema v3 (escena instanciada, ver utils.instancias): v2 con cada malla
+repetida guardada una vez en scene_configuration.meshes y referenciada desde
+las piezas. Al cargarla se expande a v2.
+
+iterar_piezas lee las piezas de una en una para escenas grandes, sin cargar
+el archivo completo (también de un JSON comprimido con gzip, como los que
+deja la exportación). Solo si una escena v3 trae las mallas después de las
+piezas tiene que guardar las piezas instanciadas hasta llegar a ellas.
+
+Migración masiva de archivos existentes (con --instancias, a v3):
+    python -m utils.escena configuracion_unity*.json [--en-sitio] [--instancias]
+"""
+import argparse
+import gzip
+import json
+import os
+
+from utils.escena_binaria import cargar_escena_binaria, es_escena_binaria
+from utils.instancias import VERSION_INSTANCIAS, expandir_pieza, instanciar_escena
+from utils.mallas import centroide
+
+VERSION_ESQUEMA = 2
+
+
+def version_esquema(config_data):
+    return config_data['scene_configuration'].get('schema_version', 1)
+
+
+def _pieza_a_v2(pieza):
+    pieza = dict(pieza)
+    pieza['position'] = centroide(pieza['mesh']['vertices'])
+    return pieza
+
+
+def leer_escena(config_data):
+    """Acepta una escena v1, v2 o v3 (dict o texto JSON) y la devuelve en esquema v2"""
+    if isinstance(config_data, str):
+        config_data = json.loads(config_data)
+
+    version = version_esquema(config_data)
+    if version == VERSION_ESQUEMA:
+        return config_data
+    if version == VERSION_INSTANCIAS:
+        escena = dict(config_data['scene_configuration'])
+        meshes = escena.pop('meshes')
+        escena['schema_version'] = VERSION_ESQUEMA
+        escena['pieces'] = [expandir_pieza(pieza, meshes) for pieza in escena['pieces']]
+        return {**config_data, 'scene_configuration': escena}
+    if version != 1:
+        raise ValueError(f"Versión de esquema de escena no soportada: {version}")
+
+    escena = {**config_data['scene_configuration'], 'schema_version': VERSION_ESQUEMA}
+    escena['pieces'] = [_pieza_a_v2(pieza) for pieza in escena['pieces']]
+    return {**config_data, 'scene_configuration': escena}
+
+
+class _LectorIncremental:
+    """Lee un documento JSON por bloques, valor por valor, sin cargarlo completo"""
+
+    def __init__(self, archivo, tam_bloque):
+        self._archivo = archivo
+        self._tam_bloque = tam_bloque
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._fin = False
+
+    def _leer(self, tam):
+        # Descartar lo ya consumido para que el buffer no crezca con el archivo
+        bloque = self._archivo.read(tam)
+        self._buffer = self._buffer[self._pos:] + bloque
+        self._pos = 0
+        self._fin = not bloque
+
+    def caracter(self):
+        """Siguiente carácter significativo, sin consumirlo ('' al final del archivo)"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._fin:
+                return self._buffer[self._pos:self._pos + 1]
+            self._leer(self._tam_bloque)
+
+    def consumir(self, esperado):
+        encontrado = self.caracter()
+        if encontrado != esperado:
+            raise ValueError(f"JSON inválido: se esperaba {esperado!r} y se encontró {encontrado!r}")
+        self._pos += 1
+
+    def valor(self):
+        self.caracter()
+        tam = self._tam_bloque
+        while True:
+            try:
+                valor, fin = self._decoder.raw_decode(self._buffer, self._pos)
+                # Un número que toca el final del buffer podría estar cortado
+                if fin < len(self._buffer) or self._fin:
+                    self._pos = fin
+                    return valor
+            except json.JSONDecodeError:
+                if self._fin:
+                    raise
+            self._leer(tam)
+            tam *= 2
+
+    def buscar_clave(self, clave, anteriores=None):
+        """
+        Recorre un objeto hasta `clave` y deja el lector sobre su valor; las
+        claves que aparecen antes se guardan en `anteriores` si se indica.
+        """
+        self.consumir('{')
+        if self.caracter() == '}':
+            return False
+        while True:
+            actual = self.valor()
+            self.consumir(':')
+            if actual == clave:
+                return True
+            valor = self.valor()
+            if anteriores is not None:
+                anteriores[actual] = valor
+            if self.caracter() == '}':
+                return False
+            self.consumir(',')
+
+    def resto_objeto(self, siguientes):
+        """Tras el valor de una clave, lee las claves que quedan del objeto y las guarda en `siguientes`"""
+        while self.caracter() == ',':
+            self.consumir(',')
+            clave = self.valor()
+            self.consumir(':')
+            siguientes[clave] = self.valor()
+        self.consumir('}')
+
+
+def _abrir_texto(ruta_archivo):
+    # JSON plano o comprimido con gzip (se reconoce por sus dos primeros bytes)
+    with open(ruta_archivo, 'rb') as archivo:
+        comprimido = archivo.read(2) == b'\x1f\x8b'
+    return (gzip.open if comprimido else open)(ruta_archivo, 'rt', encoding='utf-8')
+
+
+def iterar_piezas(ruta_archivo, tam_bloque=1 << 16):
+    """
+    Generador que entrega las piezas de una escena (en esquema v2) una a una,
+    en el orden del archivo. Del JSON solo se mantiene en memoria la pieza
+    que se está leyendo.
+    """
+    if es_escena_binaria(ruta_archivo):
+        yield from cargar_escena_binaria(ruta_archivo)['scene_configuration']['pieces']
+        return
+
+    with _abrir_texto(ruta_archivo) as archivo:
+        lector = _LectorIncremental(archivo, tam_bloque)
+        escena = {}
+        if not lector.buscar_clave('scene_configuration') or not lector.buscar_clave('pieces', escena):
+            raise ValueError(f"{ruta_archivo} no contiene scene_configuration.pieces")
+
+        lector.consumir('[')
+        if lector.caracter() == ']':
+            return
+        # leer_escena e instanciar_escena escriben schema_version y meshes
+        # antes de las piezas. Si las mallas vienen después, las piezas
+        # instanciadas se guardan hasta leerlas
+        pendientes = []
+        while True:
+            pieza = lector.valor()
+            if pendientes or ('mesh_instance' in pieza and 'meshes' not in escena):
+                pendientes.append(pieza)
+            else:
+                yield _pieza_leida_a_v2(pieza, escena)
+            if lector.caracter() == ']':
+                break
+            lector.consumir(',')
+
+        if pendientes:
+            lector.consumir(']')
+            lector.resto_objeto(escena)
+            if 'meshes' not in escena:
+                raise ValueError(f"{ruta_archivo} tiene piezas instanciadas pero no scene_configuration.meshes")
+            for pieza in pendientes:
+                yield _pieza_leida_a_v2(pieza, escena)
+
+
+def _pieza_leida_a_v2(pieza, escena):
+    # `escena` tiene las claves de scene_configuration leídas hasta ahora;
+    # sin schema_version (la escena es v1, o la versión viene después de las
+    # piezas) se recalcula position, que en v2 ya es el centroide
+    if 'mesh_instance' in pieza:
+        return expandir_pieza(pieza, escena['meshes'])
+    return pieza if escena.get('schema_version', 1) != 1 else _pieza_a_v2(pieza)
+
+
+def cargar_escena(ruta_archivo):
+    """Carga una escena desde JSON (v1, v2 o v3, plano o con gzip) o desde el formato binario (.escena)"""
+    if es_escena_binaria(ruta_archivo):
+        return cargar_escena_binaria(ruta_archivo)
+    with _abrir_texto(ruta_archivo) as archivo:
+        return leer_escena(json.load(archivo))
+
+
+def migrar_archivo(ruta_origen, ruta_destino=None, instancias=False):
+    """Reescribe una escena JSON en esquema v2, o v3 (instanciada) si se pide"""
+    if ruta_destino is None:
+        base, extension = os.path.splitext(ruta_origen)
+        ruta_destino = f"{base}_v{VERSION_INSTANCIAS if instancias else VERSION_ESQUEMA}{extension}"
+
+    with _abrir_texto(ruta_origen) as archivo:
+        config_data = leer_escena(json.load(archivo))
+    if instancias:
+        config_data = instanciar_escena(config_data)
+    with open(ruta_destino, 'w') as archivo:
+        json.dump(config_data, archivo, separators=(',', ':'), ensure_ascii=False)
+    return ruta_destino
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migra escenas JSON de Unity al esquema v2 (o v3 instanciado)')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json')
+    parser.add_argument('--en-sitio', action='store_true', help='Sobrescribir los archivos originales')
+    parser.add_argument('--instancias', action='store_true',
+                        help='Guardar una vez cada malla repetida (esquema v3)')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        tam_origen = os.path.getsize(ruta)
+        destino = migrar_archivo(ruta, ruta if args.en_sitio else None, args.instancias)
+        print(f"{ruta} ({tam_origen} bytes) -> {destino} ({os.path.getsize(destino)} bytes)")
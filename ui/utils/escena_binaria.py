@@ -0,0 +1,146 @@
+"""
+Formato binario de escena (.escena).
+
+Estructura del archivo (little-endian):
+    - cabecera fija: magic b'ESCN', versión (uint32), longitud del encabezado (uint64)
+    - encabezado JSON UTF-8 con los metadatos de cada pieza y la ubicación de
+      su geometría dentro de los bloques
+    - bloque de vértices float32 (n, 3), alineado a 16 bytes
+    - bloque de caras uint32 (m, 3), alineado a 16 bytes
+
+Las caras guardan índices locales a cada pieza, igual que en el JSON de Unity.
+Al cargar, el archivo se mapea en memoria y cada pieza recibe vistas sobre los
+bloques, sin parsear ni copiar la geometría.
+
+Conversión desde JSON:
+    python -m utils.escena_binaria configuracion_unity25.json [...]
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from utils.mallas import centroide
+
+MAGIC = b'ESCN'
+VERSION = 1
+EXTENSION = '.escena'
+ALINEACION = 16
+
+_CABECERA = struct.Struct('<4sIQ')
+_DTYPE_VERTICES = np.dtype('<f4')
+_DTYPE_CARAS = np.dtype('<u4')
+
+
+def _alinear(n):
+    return -(-n // ALINEACION) * ALINEACION
+
+
+def es_escena_binaria(ruta):
+    with open(ruta, 'rb') as archivo:
+        return archivo.read(len(MAGIC)) == MAGIC
+
+
+def escribir_escena_binaria(config_data, ruta):
+    """Escribe una escena con el esquema de configuracion_unity en formato binario"""
+    escena = config_data['scene_configuration']
+    piezas = escena['pieces']
+
+    vertices = [np.asarray(p['mesh']['vertices'], dtype=_DTYPE_VERTICES).reshape(-1, 3) for p in piezas]
+    caras = [np.asarray(p['mesh']['faces'], dtype=_DTYPE_CARAS).reshape(-1, 3) for p in piezas]
+
+    metadatos = []
+    inicio_v = inicio_c = 0
+    for pieza, v, c in zip(piezas, vertices, caras):
+        # Como en el esquema v2, la posición es el centroide y no una copia de los vértices
+        meta = {k: val for k, val in pieza.items() if k != 'mesh'}
+        meta['position'] = centroide(v)
+        meta['vertex_start'], meta['vertex_count'] = inicio_v, len(v)
+        meta['face_start'], meta['face_count'] = inicio_c, len(c)
+        metadatos.append(meta)
+        inicio_v += len(v)
+        inicio_c += len(c)
+
+    encabezado = json.dumps({
+        'scene': {**{k: val for k, val in escena.items() if k != 'pieces'}, 'schema_version': 2},
+        'pieces': metadatos,
+        'vertex_count': inicio_v,
+        'face_count': inicio_c,
+    }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    offset_vertices = _alinear(_CABECERA.size + len(encabezado))
+    with open(ruta, 'wb') as archivo:
+        archivo.write(_CABECERA.pack(MAGIC, VERSION, len(encabezado)))
+        archivo.write(encabezado)
+        archivo.write(b'\0' * (offset_vertices - _CABECERA.size - len(encabezado)))
+        for v in vertices:
+            archivo.write(v.tobytes())
+        tam_vertices = inicio_v * 3 * _DTYPE_VERTICES.itemsize
+        archivo.write(b'\0' * (_alinear(tam_vertices) - tam_vertices))
+        for c in caras:
+            archivo.write(c.tobytes())
+
+
+def cargar_escena_binaria(ruta):
+    """
+    Abre una escena binaria y devuelve un diccionario con el mismo esquema que
+    el JSON de Unity, donde la geometría de cada pieza son vistas de solo
+    lectura sobre el archivo mapeado en memoria.
+    """
+    datos = np.memmap(ruta, dtype=np.uint8, mode='r')
+    magic, version, tam_encabezado = _CABECERA.unpack(bytes(datos[:_CABECERA.size]))
+    if magic != MAGIC:
+        raise ValueError(f"{ruta} no es una escena binaria")
+    if version != VERSION:
+        raise ValueError(f"Versión de escena binaria no soportada: {version}")
+
+    fin_encabezado = _CABECERA.size + tam_encabezado
+    encabezado = json.loads(bytes(datos[_CABECERA.size:fin_encabezado]).decode('utf-8'))
+
+    offset_vertices = _alinear(fin_encabezado)
+    tam_vertices = encabezado['vertex_count'] * 3 * _DTYPE_VERTICES.itemsize
+    offset_caras = offset_vertices + _alinear(tam_vertices)
+    tam_caras = encabezado['face_count'] * 3 * _DTYPE_CARAS.itemsize
+
+    vertices = datos[offset_vertices:offset_vertices + tam_vertices].view(_DTYPE_VERTICES).reshape(-1, 3)
+    caras = datos[offset_caras:offset_caras + tam_caras].view(_DTYPE_CARAS).reshape(-1, 3)
+
+    piezas = []
+    for meta in encabezado['pieces']:
+        pieza = dict(meta)
+        inicio_v, n_v = pieza.pop('vertex_start'), pieza.pop('vertex_count')
+        inicio_c, n_c = pieza.pop('face_start'), pieza.pop('face_count')
+        pieza['mesh'] = {
+            'vertices': vertices[inicio_v:inicio_v + n_v],
+            'faces': caras[inicio_c:inicio_c + n_c],
+        }
+        piezas.append(pieza)
+
+    escena = dict(encabezado['scene'])
+    escena['pieces'] = piezas
+    return {'scene_configuration': escena}
+
+
+def convertir_json_a_binario(ruta_json, ruta_binaria=None):
+    """Convierte una escena JSON de cualquier versión de esquema (v1, v2 o v3) al formato binario"""
+    # utils.escena importa este módulo
+    from utils.escena import leer_escena
+
+    if ruta_binaria is None:
+        ruta_binaria = os.path.splitext(ruta_json)[0] + EXTENSION
+    with open(ruta_json, 'r') as archivo:
+        config_data = leer_escena(json.load(archivo))
+    escribir_escena_binaria(config_data, ruta_binaria)
+    return ruta_binaria
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convierte escenas JSON de Unity al formato binario')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        destino = convertir_json_a_binario(ruta)
+        print(f"{ruta} ({os.path.getsize(ruta)} bytes) -> {destino} ({os.path.getsize(destino)} bytes)")
@@ -0,0 +1,200 @@
+"""
+Exportación de la escena de Unity (esquema v1, el que consume Unity hoy) a
+partir de los componentes del STL y de la configuración guardada en el editor.
+
+exportar_escena es el trabajo que main.py encola en la ColaTrabajos: corre en
+un proceso aparte, informa su avance y deja el JSON en DIRECTORIO_EXPORTACIONES,
+de donde se borra pasadas EXPORTACIONES_TTL horas (el navegador lo descarga
+apenas termina).
+
+El JSON se escribe pieza por pieza desde los arreglos de NumPy (ver
+fragmentos_escena), así que la exportación no arma la escena completa en
+memoria. Los mismos fragmentos sirven para un archivo, un gzip o el cuerpo
+de una respuesta HTTP en streaming.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+
+from utils.AlmacenEscenas import AlmacenEscenas
+from utils.analisis import analizar_stl
+from utils.escena import VERSION_ESQUEMA, iterar_piezas
+from utils.instancias import VERSION_INSTANCIAS, detectar_instancias
+from utils.mallas import centroide
+from utils.stl import cargar_componentes
+
+DIRECTORIO_EXPORTACIONES = os.environ.get('DIRECTORIO_EXPORTACIONES', '.exportaciones')
+
+# Horas que se conserva cada archivo exportado
+EXPORTACIONES_TTL = float(os.environ.get('EXPORTACIONES_TTL', 24))
+
+DIRECCION_POR_DEFECTO = 'de abajo hacia arriba'
+
+# Filas de cada arreglo que se convierten a texto de una vez
+FILAS_POR_TRAMO = 4096
+
+
+def _datos_pieza(indice, configuraciones, colores, sugerencias):
+    # Lo guardado en el editor manda; si no, la sugerencia del grafo de contactos
+    guardada = configuraciones.get(str(indice), {})
+    sugerida = sugerencias[indice] if sugerencias else {}
+    prioridad = guardada.get('prioridad')
+    if prioridad is None:
+        prioridad = sugerida.get('priority', indice)
+    return {
+        'direction': guardada.get('direccion') or sugerida.get('direction', DIRECCION_POR_DEFECTO),
+        'color': colores[indice % len(colores)],
+        'priority': prioridad,
+        'help_text': guardada.get('ayuda') or '',
+    }
+
+
+def _json(valor):
+    return json.dumps(valor, separators=(',', ':'), ensure_ascii=False)
+
+
+def _arreglo_json(arreglo):
+    # Mismo texto que _json(arreglo.tolist()), pero convirtiendo por tramos de
+    # FILAS_POR_TRAMO filas para no duplicar la pieza entera en listas de Python
+    yield '['
+    for inicio in range(0, len(arreglo), FILAS_POR_TRAMO):
+        if inicio:
+            yield ','
+        yield _json(arreglo[inicio:inicio + FILAS_POR_TRAMO].tolist())[1:-1]
+    yield ']'
+
+
+def fragmentos_escena(componentes, configuraciones, colores, sugerencias=None, progreso=None):
+    """
+    Texto de la escena de Unity (esquema v1) en fragmentos, pieza por pieza y
+    directo desde los arreglos de NumPy. Concatenados son idénticos a
+    json.dumps de la escena con separators=(',', ':') y ensure_ascii=False.
+
+    configuraciones es {str(indice): {'direccion', 'prioridad', 'ayuda'}} con
+    lo guardado en el editor; las piezas sin configuración toman la sugerencia.
+    """
+    yield f'{{"scene_configuration":{{"total_pieces":{len(componentes)},"pieces":['
+    for indice, componente in enumerate(componentes):
+        datos = _datos_pieza(indice, configuraciones, colores, sugerencias)
+        vertices = componente.vertices
+
+        yield f'{"," if indice else ""}{{"id":{indice},"direction":{_json(datos["direction"])},"position":{{'
+        for n, eje in enumerate('xyz'):
+            yield f'{"," if n else ""}"{eje}":'
+            yield from _arreglo_json(vertices[:, n])
+        yield f'}},"rotation":{{"x":0,"y":0,"z":0}},"color":{_json(datos["color"])},"enabled":true,'
+        yield '"mesh":{"vertices":'
+        yield from _arreglo_json(vertices)
+        yield ',"faces":'
+        yield from _arreglo_json(componente.faces)
+        yield f'}},"priority":{_json(datos["priority"])},"help_text":{_json(datos["help_text"])}}}'
+
+        if progreso:
+            progreso(indice + 1, len(componentes))
+    yield ']}}'
+
+
+def fragmentos_escena_instanciada(componentes, configuraciones, colores, sugerencias=None, progreso=None):
+    """
+    Como fragmentos_escena, pero en esquema v3: cada malla repetida se escribe
+    una vez en "meshes" y las piezas la referencian con su transformación
+    (ver utils.instancias). position es el centroide, como en v2.
+    """
+    asignaciones = detectar_instancias([(c.vertices, c.faces) for c in componentes])
+    numero = {}
+    for original, _, _ in asignaciones:
+        numero.setdefault(original, len(numero))
+
+    yield f'{{"scene_configuration":{{"schema_version":{VERSION_INSTANCIAS},"total_pieces":{len(componentes)},"meshes":['
+    for n, original in enumerate(numero):
+        yield f'{"," if n else ""}{{"vertices":'
+        yield from _arreglo_json(componentes[original].vertices)
+        yield ',"faces":'
+        yield from _arreglo_json(componentes[original].faces)
+        yield '}'
+    yield '],"pieces":['
+    for indice, (componente, (original, rotacion, traslacion)) in enumerate(zip(componentes, asignaciones)):
+        datos = _datos_pieza(indice, configuraciones, colores, sugerencias)
+        instancia = {'mesh': numero[original], 'rotation': rotacion.tolist(), 'translation': traslacion.tolist()}
+        yield (f'{"," if indice else ""}{{"id":{indice},"direction":{_json(datos["direction"])},'
+               f'"position":{_json(centroide(componente.vertices))},"rotation":{{"x":0,"y":0,"z":0}},'
+               f'"color":{_json(datos["color"])},"enabled":true,"mesh_instance":{_json(instancia)},'
+               f'"priority":{_json(datos["priority"])},"help_text":{_json(datos["help_text"])}}}')
+
+        if progreso:
+            progreso(indice + 1, len(componentes))
+    yield ']}}'
+
+
+def escribir_escena(destino, fragmentos, comprimir=False):
+    """Escribe los fragmentos de la escena en `destino` (ruta), con gzip si se pide"""
+    abrir = gzip.open if comprimir else open
+    with abrir(destino, 'wt', encoding='utf-8') as archivo:
+        for fragmento in fragmentos:
+            archivo.write(fragmento)
+    return destino
+
+
+def limpiar_exportaciones(antiguedad=None):
+    """Borra de DIRECTORIO_EXPORTACIONES los archivos con más de `antiguedad` horas (EXPORTACIONES_TTL)"""
+    limite = time.time() - 3600 * (EXPORTACIONES_TTL if antiguedad is None else antiguedad)
+    if not os.path.isdir(DIRECTORIO_EXPORTACIONES):
+        return
+    for entrada in os.scandir(DIRECTORIO_EXPORTACIONES):
+        try:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+        except FileNotFoundError:
+            # Otro trabajador lo borró primero
+            pass
+
+
+def exportar_escena(parametros, progreso):
+    """
+    Trabajo de exportación. parametros: {'ruta_stl', 'configuraciones',
+    'colores', 'firestore', 'gzip', 'instancias'}. Devuelve {'ruta', 'nombre'}
+    del JSON generado.
+    """
+    limpiar_exportaciones()
+    progreso(0.0, 'Cargando componentes')
+    componentes = cargar_componentes(parametros['ruta_stl'])
+
+    # El mismo orden sugerido que muestra el editor (con el eje vertical
+    # detectado), del caché del análisis si ya se calculó
+    progreso(0.1, 'Calculando el orden sugerido')
+    sugerencias = analizar_stl(parametros['ruta_stl'])['sugerencias']
+
+    def avance_piezas(hechas, total):
+        progreso(0.2 + 0.7 * hechas / total, f'Pieza {hechas} de {total}')
+
+    # Con 'instancias' se exporta en esquema v3; Unity necesita entenderlo
+    generar = fragmentos_escena_instanciada if parametros.get('instancias') else fragmentos_escena
+    fragmentos = generar(componentes, parametros.get('configuraciones') or {},
+                         parametros['colores'], sugerencias, avance_piezas)
+
+    # Las piezas se escriben a medida que se generan
+    os.makedirs(DIRECTORIO_EXPORTACIONES, exist_ok=True)
+    comprimir = bool(parametros.get('gzip'))
+    nombre = 'configuracion_unity.json.gz' if comprimir else 'configuracion_unity.json'
+    ruta = os.path.abspath(os.path.join(DIRECTORIO_EXPORTACIONES, f"{uuid.uuid4().hex}_{nombre}"))
+    escribir_escena(ruta, fragmentos, comprimir)
+
+    if parametros.get('firestore'):
+        progreso(0.9, 'Guardando en Firebase')
+        try:
+            # El almacén reparte la escena en varios documentos. Las piezas se
+            # releen del archivo de a una: iterar_piezas las da en v2 (las de
+            # una escena v3 ya expandidas) y position no se guarda, se rearma
+            # al cargar según schema_version, así que queda la escena escrita
+            escena = {'total_pieces': len(componentes), 'pieces': iterar_piezas(ruta)}
+            if parametros.get('instancias'):
+                escena['schema_version'] = VERSION_ESQUEMA
+            AlmacenEscenas().guardar({'scene_configuration': escena})
+        except Exception as e:
+            # El archivo ya está listo para descargar aunque Firebase falle
+            logging.error(f"Error saving export to Firebase: {e}")
+
+    return {'ruta': ruta, 'nombre': nombre}
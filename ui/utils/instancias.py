@@ -0,0 +1,214 @@
+"""
+Instancias de piezas repetidas (tornillos, soportes, perfiles...).
+
+Dos piezas son la misma malla si los vértices de una son los de la otra
+tras una rotación y una traslación, en cualquier orden, y sus triángulos
+son los mismos (con el mismo sentido). Las candidatas se agrupan por una
+forma normalizada que no cambia al mover, girar ni renumerar la pieza: la
+cantidad de vértices y caras y las longitudes de sus ejes principales
+(PCA sobre los vértices centrados en su centroide), cuantizadas. Dentro de
+cada grupo se prueban la identidad y los giros que alinean los ejes
+principales; con el giro de prueba cada vértice se empareja con el más
+cercano del original, Kabsch (SVD) ajusta la rotación sobre esos pares y se
+acepta si reproduce la pieza dentro de la tolerancia. Las reflexiones no
+cuentan como instancias, y las piezas con ejes principales de igual
+longitud (esferas, cubos) solo se reconocen si están trasladadas sin girar.
+
+Una instancia se reconstruye con los vértices (en su orden) y las caras del
+original, así que la pieza expandida es la misma superficie pero puede
+tener otra numeración que la del archivo de origen.
+
+En una escena instanciada (schema_version 3) cada malla distinta se guarda una
+vez en scene_configuration['meshes'] y cada pieza lleva, en lugar de 'mesh',
+'mesh_instance': {'mesh': índice, 'rotation': matriz 3x3, 'translation': [x, y, z]};
+sus vértices son vertices_malla @ rotation.T + translation.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils.mallas import centroide
+
+# Error máximo aceptado al reproducir una pieza, relativo a la diagonal de la escena
+TOLERANCIA_RELATIVA = 1e-6
+
+# Los vértices de los STL (y de muchas escenas) son float32: la tolerancia no
+# baja de unos pocos ulp de la coordenada más grande
+ULP_FLOAT32 = 8
+
+# Paso de cuantización de los ejes principales, en múltiplos de la tolerancia
+PASO_FORMA = 100
+
+# Giros propios que cambian el signo de dos ejes principales
+_SIGNOS = [np.diag(s) for s in ((1, 1, 1), (1, -1, -1), (-1, 1, -1), (-1, -1, 1))]
+
+VERSION_INSTANCIAS = 3
+
+
+def detectar_instancias(mallas, tolerancia=None):
+    """
+    Para cada malla (vertices, caras), (original, rotacion, traslacion): la
+    primera malla igual a ella y la transformación que la lleva a su lugar.
+    Las mallas únicas son su propio original, con la identidad.
+    """
+    mallas = [(np.asarray(v, dtype=float).reshape(-1, 3), np.asarray(c, dtype=np.int64).reshape(-1, 3))
+              for v, c in mallas]
+    if tolerancia is None:
+        tolerancia = max(TOLERANCIA_RELATIVA * _diagonal(mallas),
+                         ULP_FLOAT32 * float(np.finfo(np.float32).eps) * _coordenada_maxima(mallas))
+
+    resultado = []
+    originales = {}
+    for indice, (vertices, caras) in enumerate(mallas):
+        centro = vertices.mean(axis=0) if len(vertices) else np.zeros(3)
+        centrados = vertices - centro
+        ejes, longitudes = _ejes_principales(centrados)
+        # Distancias al centro ordenadas: descartan rápido las que no pueden coincidir
+        firma = np.sort(np.sqrt((centrados ** 2).sum(axis=1)))
+
+        clave = (len(vertices), len(caras), tuple(np.round(longitudes / (PASO_FORMA * tolerancia)).astype(np.int64)))
+        asignada = None
+        for original, datos_o in originales.get(clave, ()):
+            if len(firma) and np.abs(firma - datos_o['firma']).max() > 2 * tolerancia:
+                continue
+            rotacion = _emparejar(datos_o, centrados, caras, ejes, tolerancia)
+            if rotacion is not None:
+                asignada = (original, rotacion, centro - rotacion @ datos_o['centro'])
+                break
+
+        if asignada is None:
+            arbol = cKDTree(centrados) if len(vertices) else None
+            separacion = float(arbol.query(centrados, k=2)[0][:, 1].min()) if len(vertices) > 1 else np.inf
+            originales.setdefault(clave, []).append((indice, {
+                'centrados': centrados, 'centro': centro, 'caras': _caras_canonicas(caras), 'ejes': ejes,
+                'firma': firma, 'arbol': arbol, 'separacion': separacion,
+            }))
+            asignada = (indice, np.eye(3), np.zeros(3))
+        resultado.append(asignada)
+    return resultado
+
+
+def _ejes_principales(centrados):
+    # Ejes (columnas) y longitudes (desvío en cada eje), de mayor a menor
+    if len(centrados) == 0:
+        return np.eye(3), np.zeros(3)
+    valores, ejes = np.linalg.eigh(centrados.T @ centrados / len(centrados))
+    return ejes[:, ::-1], np.sqrt(np.maximum(valores[::-1], 0.0))
+
+
+def _emparejar(original, centrados, caras, ejes, tolerancia):
+    """
+    Rotación que lleva los vértices centrados del original a `centrados`
+    (cada uno a algún vértice, en cualquier orden) y sus caras a `caras`, o
+    None si no hay.
+    """
+    if len(centrados) == 0:
+        return np.eye(3)
+    # Identidad primero: las copias en CAD suelen estar solo trasladadas
+    for prueba in [np.eye(3)] + [ejes @ signos @ original['ejes'].T for signos in _SIGNOS]:
+        if np.linalg.det(prueba) < 0:
+            continue
+        # Vértice del original que le corresponde a cada vértice de la pieza
+        # (más cerca que la mitad de la separación entre vértices del original, sin ambigüedad)
+        distancia, correspondencia = original['arbol'].query(centrados @ prueba)
+        if distancia.max() > max(original['separacion'] / 2, tolerancia):
+            continue
+        if len(np.unique(correspondencia)) != len(centrados):
+            continue
+        rotacion = _kabsch(original['centrados'][correspondencia], centrados)
+        if np.abs(original['centrados'][correspondencia] @ rotacion.T - centrados).max() > tolerancia:
+            continue
+        if _caras_canonicas(correspondencia[caras]) == original['caras']:
+            return rotacion
+    return None
+
+
+def _caras_canonicas(caras):
+    # Triángulos como conjunto, cada uno rotado a su índice menor (conserva el sentido)
+    caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+    giro = np.argmin(caras, axis=1)
+    filas = np.arange(len(caras))[:, None]
+    return set(map(tuple, caras[filas, (giro[:, None] + np.arange(3)) % 3].tolist()))
+
+
+def instanciar_piezas(piezas, tolerancia=None):
+    """
+    (meshes, piezas_instanciadas) a partir de piezas en esquema v2: cada malla
+    distinta una vez y cada pieza con su 'mesh_instance' en lugar de 'mesh'.
+    Los niveles de detalle ('lod') pasan a la malla compartida.
+    """
+    asignaciones = detectar_instancias([(p['mesh']['vertices'], p['mesh']['faces']) for p in piezas], tolerancia)
+
+    meshes, numero = [], {}
+    instanciadas = []
+    for pieza, (original, rotacion, traslacion) in zip(piezas, asignaciones):
+        if original not in numero:
+            numero[original] = len(meshes)
+            malla = dict(piezas[original]['mesh'])
+            if 'lod' in piezas[original]:
+                malla['lod'] = piezas[original]['lod']
+            meshes.append(malla)
+
+        instancia = {'mesh': numero[original], 'rotation': rotacion.tolist(), 'translation': traslacion.tolist()}
+        # 'mesh_instance' ocupa el lugar de 'mesh' para conservar el orden de las claves
+        instanciadas.append({
+            ('mesh_instance' if clave == 'mesh' else clave): (instancia if clave == 'mesh' else valor)
+            for clave, valor in pieza.items() if clave != 'lod'
+        })
+    return meshes, instanciadas
+
+
+def instanciar_escena(config_data, tolerancia=None):
+    """Escena v2 -> escena instanciada (schema_version 3), con 'meshes' antes que 'pieces'"""
+    escena = dict(config_data['scene_configuration'])
+    piezas = escena.pop('pieces')
+    meshes, instanciadas = instanciar_piezas(piezas, tolerancia)
+    escena['schema_version'] = VERSION_INSTANCIAS
+    escena['meshes'] = meshes
+    escena['pieces'] = instanciadas
+    return {**config_data, 'scene_configuration': escena}
+
+
+def expandir_pieza(pieza, meshes):
+    """Pieza de una escena instanciada -> pieza v2 con su propia 'mesh'"""
+    if 'mesh_instance' not in pieza:
+        return pieza
+    instancia = pieza['mesh_instance']
+    malla = meshes[instancia['mesh']]
+    rotacion = np.asarray(instancia['rotation'], dtype=float)
+    traslacion = np.asarray(instancia['translation'], dtype=float)
+
+    def ubicar(vertices):
+        return (np.asarray(vertices, dtype=float).reshape(-1, 3) @ rotacion.T + traslacion).tolist()
+
+    vertices = ubicar(malla['vertices'])
+    expandida = {}
+    for clave, valor in pieza.items():
+        if clave == 'mesh_instance':
+            expandida['mesh'] = {'vertices': vertices, 'faces': malla['faces']}
+        elif clave == 'position':
+            expandida['position'] = centroide(vertices)
+        else:
+            expandida[clave] = valor
+    if 'lod' in malla:
+        expandida['lod'] = [{'vertices': ubicar(n['vertices']), 'faces': n['faces']} for n in malla['lod']]
+    return expandida
+
+
+def _kabsch(a, b):
+    # Rotación (sin reflexión) que mejor lleva los puntos centrados a sobre b
+    u, _, vt = np.linalg.svd(a.T @ b)
+    signo = np.sign(np.linalg.det(vt.T @ u.T)) or 1.0
+    return vt.T @ np.diag([1.0, 1.0, signo]) @ u.T
+
+
+def _coordenada_maxima(mallas):
+    return max((float(np.abs(v).max()) for v, _ in mallas if len(v)), default=0.0)
+
+
+def _diagonal(mallas):
+    con_vertices = [v for v, _ in mallas if len(v)]
+    if not con_vertices:
+        return 1.0
+    minimo = np.min([v.min(axis=0) for v in con_vertices], axis=0)
+    maximo = np.max([v.max(axis=0) for v in con_vertices], axis=0)
+    return max(float(np.linalg.norm(maximo - minimo)), 1.0)
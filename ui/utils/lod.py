@@ -0,0 +1,141 @@
+"""
+Niveles de detalle (LOD) por pieza.
+
+Cada nivel se obtiene por agrupamiento de vértices: la pieza se divide en una
+rejilla de celdas cúbicas, los vértices de una misma celda se reemplazan por
+su promedio y se descartan las caras que quedan degeneradas o repetidas.
+
+El nivel 0 es siempre la malla original. Los niveles reducidos se pueden
+guardar con la escena, en pieza['lod'] (lista de {'vertices', 'faces'} de más
+a menos detalle, sin el nivel 0):
+    python -m utils.lod configuracion_unity25.json [--en-sitio]
+
+elegir_niveles reparte un presupuesto total de caras entre las piezas.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from utils.escena import cargar_escena
+
+# Celdas a lo largo del lado mayor de cada pieza, de más a menos detalle
+RESOLUCIONES = (24, 12, 6)
+
+# Un nivel con menos caras ya no conserva la forma de la pieza
+MIN_CARAS_NIVEL = 4
+
+
+def decimar(vertices, caras, resolucion):
+    """Malla reducida por agrupamiento de vértices en una rejilla de `resolucion` celdas por lado"""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+    if len(caras) == 0:
+        return vertices, caras
+
+    minimo = vertices.min(axis=0)
+    lado = (vertices.max(axis=0) - minimo).max()
+    if lado == 0:
+        return vertices, caras
+
+    celdas = np.minimum(((vertices - minimo) * (resolucion / lado)).astype(np.int64), resolucion - 1)
+    claves = (celdas[:, 0] * resolucion + celdas[:, 1]) * resolucion + celdas[:, 2]
+    _, grupo = np.unique(claves, return_inverse=True)
+    grupo = grupo.reshape(-1)
+
+    # Promedio de los vértices de cada celda
+    cuenta = np.bincount(grupo)
+    promedios = np.column_stack([np.bincount(grupo, weights=vertices[:, eje]) for eje in range(3)])
+    promedios /= cuenta[:, None]
+
+    caras = grupo[caras]
+    validas = (caras[:, 0] != caras[:, 1]) & (caras[:, 1] != caras[:, 2]) & (caras[:, 0] != caras[:, 2])
+    caras = caras[validas]
+    _, primeras = np.unique(np.sort(caras, axis=1), axis=0, return_index=True)
+    caras = caras[np.sort(primeras)]
+
+    # Compactar: solo los vértices que siguen en uso
+    usados, caras = np.unique(caras, return_inverse=True)
+    return promedios[usados], caras.reshape(-1, 3)
+
+
+def generar_niveles(vertices, caras, resoluciones=RESOLUCIONES):
+    """
+    Niveles reducidos de una malla, de más a menos detalle. Solo se conservan
+    los que efectivamente tienen menos caras que el anterior y al menos
+    MIN_CARAS_NIVEL.
+    """
+    niveles = []
+    n_caras = len(np.asarray(caras).reshape(-1, 3))
+    for resolucion in resoluciones:
+        v, c = decimar(vertices, caras, resolucion)
+        if MIN_CARAS_NIVEL <= len(c) < n_caras:
+            niveles.append((v, c))
+            n_caras = len(c)
+    return niveles
+
+
+def elegir_niveles(caras_por_nivel, presupuesto, completas=()):
+    """
+    Nivel de cada pieza para que el total de caras quepa en `presupuesto`.
+
+    caras_por_nivel[p] es la lista de caras de la pieza p en cada nivel (el
+    primero es la malla completa). Las piezas en `completas` van siempre con
+    nivel 0; el resto parte del nivel más bajo y sube de a un nivel a la vez,
+    empezando por las piezas a las que les cuesta menos caras. Si ni los
+    niveles más bajos caben, se devuelven esos igual.
+    """
+    n_piezas = len(caras_por_nivel)
+    if n_piezas == 0:
+        return []
+
+    # Matriz (piezas, niveles) rellenando con el último nivel de cada pieza
+    n_niveles = max(len(c) for c in caras_por_nivel)
+    caras = np.array([list(c) + [c[-1]] * (n_niveles - len(c)) for c in caras_por_nivel], dtype=np.int64)
+    filas = np.arange(n_piezas)
+
+    niveles = np.array([len(c) - 1 for c in caras_por_nivel])
+    niveles[list(completas)] = 0
+    disponible = presupuesto - caras[filas, niveles].sum()
+
+    for nivel in range(n_niveles - 2, -1, -1):
+        candidatas = np.flatnonzero(niveles > nivel)
+        costo = caras[candidatas, nivel] - caras[candidatas, niveles[candidatas]]
+        orden = np.argsort(costo, kind='stable')
+        caben = np.cumsum(costo[orden]) <= disponible
+        niveles[candidatas[orden[caben]]] = nivel
+        disponible -= costo[orden[caben]].sum()
+        if not caben.all():
+            break
+
+    return niveles.tolist()
+
+
+def agregar_niveles(config_data, resoluciones=RESOLUCIONES):
+    """Calcula y guarda en cada pieza sus niveles reducidos (pieza['lod'])"""
+    for pieza in config_data['scene_configuration']['pieces']:
+        pieza['lod'] = [
+            {'vertices': v.tolist(), 'faces': c.tolist()}
+            for v, c in generar_niveles(pieza['mesh']['vertices'], pieza['mesh']['faces'], resoluciones)
+        ]
+    return config_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agrega niveles de detalle a escenas JSON de Unity')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json')
+    parser.add_argument('--en-sitio', action='store_true', help='Sobrescribir los archivos originales')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        base, extension = os.path.splitext(ruta)
+        destino = ruta if args.en_sitio else f"{base}_lod{extension}"
+        config_data = agregar_niveles(cargar_escena(ruta))
+        with open(destino, 'w') as archivo:
+            json.dump(config_data, archivo, separators=(',', ':'), ensure_ascii=False)
+
+        caras = [[len(p['mesh']['faces'])] + [len(n['faces']) for n in p['lod']]
+                 for p in config_data['scene_configuration']['pieces']]
+        totales = [sum(c[min(n, len(c) - 1)] for c in caras) for n in range(len(RESOLUCIONES) + 1)]
+        print(f"{ruta} -> {destino}: caras por nivel {totales}")
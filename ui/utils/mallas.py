@@ -0,0 +1,52 @@
+import hashlib
+
+import numpy as np
+
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    return rgb
+
+
+def fusionar_piezas(piezas):
+    """
+    Fusiona la geometría de varias piezas en un solo conjunto de arreglos.
+
+    Cada pieza se convierte una sola vez; los índices de las caras se
+    desplazan con una suma en bloque y todo se concatena en una pasada.
+    Devuelve (vertices, caras, colores, fin_vertices, fin_caras), donde
+    fin_*[n] es la cantidad de vértices/caras de las primeras n piezas.
+    """
+    vertices = [np.asarray(p['mesh']['vertices'], dtype=float).reshape(-1, 3) for p in piezas]
+    caras = [np.asarray(p['mesh']['faces'], dtype=np.int64).reshape(-1, 3) for p in piezas]
+    n_vertices = np.array([len(v) for v in vertices], dtype=np.int64)
+    n_caras = np.array([len(c) for c in caras], dtype=np.int64)
+
+    fin_vertices = np.concatenate(([0], np.cumsum(n_vertices)))
+    fin_caras = np.concatenate(([0], np.cumsum(n_caras)))
+
+    if not vertices:
+        return (np.empty((0, 3)), np.empty((0, 3), dtype=np.int64), np.empty((0, 3)),
+                fin_vertices, fin_caras)
+
+    caras = np.concatenate(caras) + np.repeat(fin_vertices[:-1], n_caras)[:, None]
+    rgb = np.array([hex_to_rgb(p['color']) for p in piezas], dtype=float).reshape(-1, 3) / 255.0
+    colores = np.repeat(rgb, n_caras, axis=0)
+
+    return np.concatenate(vertices), caras, colores, fin_vertices, fin_caras
+
+
+def centroide(vertices):
+    """Centroide de una pieza como diccionario {'x', 'y', 'z'}"""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    centro = vertices.mean(axis=0) if len(vertices) else np.zeros(3)
+    return dict(zip('xyz', centro.tolist()))
+
+
+def hash_geometria(pieza):
+    """Hash SHA-1 de la geometría de una pieza: cambia si se mueve o se edita su malla"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(pieza['mesh']['vertices'], dtype='<f8').tobytes())
+    digest.update(np.ascontiguousarray(pieza['mesh']['faces'], dtype='<i8').tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,272 @@
+"""
+Caras ocultas entre piezas que se tocan.
+
+Cuando dos piezas se apoyan una en otra, sus caras de contacto quedan en el
+mismo plano, mirando en sentidos opuestos, y con el ensamblaje completo no se
+ven nunca. Para encontrarlas, cada triángulo se indexa por su plano (normal
+cuantizada, con el signo llevado a una forma canónica, y distancia al origen)
+y por las celdas de una rejilla que cubre su caja. Las caras cuyas tres
+esquinas caen en triángulos opuestos de otra pieza, en el mismo plano, son
+candidatas; una candidata está oculta solo si, al recortarle todos esos
+triángulos de la otra pieza, no le queda área (más allá de la tolerancia).
+Antes de armar la rejilla se descartan las caras cuyo plano no comparte
+ninguna cara enfrentada de otra pieza, que en escenas con pocos contactos
+son casi todas.
+
+Cada cara guarda la primera pieza que la oculta, así que una vista parcial
+puede quitar solo las que ya tienen a su vecina colocada.
+
+    python -m utils.ocultas configuracion_unity25.json
+"""
+import argparse
+
+import numpy as np
+
+from utils.escena import cargar_escena
+
+# Distancia máxima entre planos coincidentes, relativa a la diagonal de la escena
+TOLERANCIA_RELATIVA = 1e-5
+
+# Paso de la cuantización de las normales (unitarias)
+TOLERANCIA_NORMAL = 1e-3
+
+
+def caras_ocultas(mallas, tolerancia=None):
+    """
+    Para cada malla (vertices, caras), un arreglo con una entrada por cara:
+    el índice de la primera malla que la oculta, o -1 si ninguna.
+    """
+    vertices = [np.asarray(v, dtype=float).reshape(-1, 3) for v, _ in mallas]
+    caras = [np.asarray(c, dtype=np.int64).reshape(-1, 3) for _, c in mallas]
+    n_caras = [len(c) for c in caras]
+    resultado = np.full(sum(n_caras), -1, dtype=np.int64)
+    if len(resultado) == 0:
+        return [resultado[:0] for _ in mallas]
+
+    T = np.concatenate([v[c] for v, c in zip(vertices, caras)])
+    pieza = np.repeat(np.arange(len(mallas)), n_caras)
+    if tolerancia is None:
+        puntos = T.reshape(-1, 3)
+        tolerancia = TOLERANCIA_RELATIVA * max(float(np.linalg.norm(puntos.max(axis=0) - puntos.min(axis=0))), 1.0)
+
+    normal = np.cross(T[:, 1] - T[:, 0], T[:, 2] - T[:, 0])
+    largo = np.linalg.norm(normal, axis=1)
+    validos = np.flatnonzero(largo > 0)
+    normal = normal[validos] / largo[validos, None]
+    T, pieza_t = T[validos], pieza[validos]
+
+    # Plano canónico: la normal cuantizada o su opuesta, la que sea mayor
+    # lexicográficamente; dos caras enfrentadas comparten plano con signo distinto
+    q = np.round(normal / TOLERANCIA_NORMAL).astype(np.int64)
+    invertir = _lexicografico_menor(q, -q)
+    signo = np.where(invertir, -1, 1)
+    q *= signo[:, None]
+    normal_c = normal * signo[:, None]
+    distancia = (normal_c * T.mean(axis=1)).sum(axis=1)
+
+    # Solo pueden quedar ocultas las caras que comparten plano con caras de
+    # otra pieza que miran al revés; las demás no entran en la rejilla
+    fin = np.cumsum([0] + n_caras)
+    compartidos = _plano_compartido(q, distancia, signo, pieza_t, tolerancia)
+    if not compartidos.any():
+        return [resultado[fin[n]:fin[n + 1]] for n in range(len(mallas))]
+    validos, normal, T, pieza_t = validos[compartidos], normal[compartidos], T[compartidos], pieza_t[compartidos]
+    q, signo, distancia = q[compartidos], signo[compartidos], distancia[compartidos]
+
+    # Cada triángulo se registra en los bins de distancia y las celdas que toca su caja
+    t_min, t_max = T.min(axis=1) - tolerancia, T.max(axis=1) + tolerancia
+    # Celdas del tamaño de casi todos los triángulos: los grandes, que son
+    # pocos, ocupan varias; con la mediana ocuparían miles
+    celda = max(float(np.percentile((t_max - t_min).max(axis=1), 90)), tolerancia)
+    origen = t_min.min(axis=0)
+    c_min = np.floor((t_min - origen) / celda).astype(np.int64)
+    c_max = np.floor((t_max - origen) / celda).astype(np.int64)
+    d_min = np.floor((distancia - tolerancia) / tolerancia).astype(np.int64)
+    d_max = np.floor((distancia + tolerancia) / tolerancia).astype(np.int64)
+    lados = np.column_stack((d_max - d_min, c_max - c_min)) + 1
+    n_entradas = lados.prod(axis=1)
+    triangulo = np.repeat(np.arange(len(T)), n_entradas)
+    local = np.arange(n_entradas.sum()) - np.repeat(np.cumsum(n_entradas) - n_entradas, n_entradas)
+    desplazamiento = np.empty((len(triangulo), 4), dtype=np.int64)
+    for eje in range(3, -1, -1):
+        lado = lados[triangulo, eje]
+        desplazamiento[:, eje] = local % lado
+        local //= lado
+    claves_t = np.column_stack((q[triangulo],
+                                np.column_stack((d_min, c_min))[triangulo] + desplazamiento))
+
+    # Puntos de prueba de cada cara: sus tres esquinas
+    cara_p = np.repeat(np.arange(len(T)), 3)
+    puntos = T.reshape(-1, 3)
+    claves_p = np.column_stack((q[cara_p],
+                                np.floor((distancia[cara_p] / tolerancia)).astype(np.int64),
+                                np.floor((puntos - origen) / celda).astype(np.int64)))
+
+    # Las claves (filas de 7 enteros) se reducen a un hash de 64 bits; una
+    # colisión solo agrega candidatos, que las pruebas de abajo descartan
+    ids_t, ids_p = _hash_filas(claves_t), _hash_filas(claves_p)
+    orden = np.argsort(ids_t, kind='stable')
+    ids_t, triangulo = ids_t[orden], triangulo[orden]
+    desde = np.searchsorted(ids_t, ids_p, side='left')
+    cantidad = np.searchsorted(ids_t, ids_p, side='right') - desde
+
+    p = np.repeat(np.arange(len(puntos)), cantidad)
+    t = triangulo[np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+                  + np.repeat(desde, cantidad)]
+    a = cara_p[p]
+    candidatos = ((pieza_t[a] != pieza_t[t]) & (signo[a] != signo[t])
+                  & (np.abs(distancia[a] - distancia[t]) <= tolerancia)
+                  & ((normal[a] * normal[t]).sum(axis=1) <= -1 + TOLERANCIA_NORMAL))
+    p, t, a = p[candidatos], t[candidatos], a[candidatos]
+    dentro = _dentro_triangulo(puntos[p], T[t], normal[t], tolerancia)
+    p, t, a = p[dentro], t[dentro], a[dentro]
+
+    # Candidata a oculta por una pieza: sus tres esquinas caen en caras de esa
+    # pieza; se confirma si esas caras (y las que hay entre ellas) la cubren entera
+    cubiertos = np.unique(np.column_stack((a, pieza_t[t], p % 3)), axis=0)
+    pares, conteo = np.unique(cubiertos[:, :2], axis=0, return_counts=True)
+    pares = pares[conteo == 3]
+    caja_min, caja_max = T.min(axis=1), T.max(axis=1)
+    # Los triángulos de cada pieza están juntos y en orden
+    limites = np.searchsorted(pieza_t, np.arange(len(mallas) + 1))
+    confirmadas = []
+    for cara, otra in pares:
+        rango = slice(limites[otra], limites[otra + 1])
+        opuestos = np.flatnonzero(np.all(q[rango] == q[cara], axis=1) & (signo[rango] != signo[cara])
+                                  & (np.abs(distancia[rango] - distancia[cara]) <= tolerancia)
+                                  & np.all(caja_min[rango] <= caja_max[cara] + tolerancia, axis=1)
+                                  & np.all(caja_max[rango] >= caja_min[cara] - tolerancia, axis=1))
+        confirmadas.append(_cubierta(T[cara], normal[cara], T[rango][opuestos], tolerancia))
+    ocultas = pares[np.asarray(confirmadas, dtype=bool)]
+    # unique deja los pares ordenados por cara y luego por pieza: la primera es la menor
+    primeras = np.unique(ocultas[:, 0], return_index=True)[1]
+    resultado[validos[ocultas[primeras, 0]]] = ocultas[primeras, 1]
+
+    return [resultado[fin[n]:fin[n + 1]] for n in range(len(mallas))]
+
+
+def _plano_compartido(q, distancia, signo, pieza, tolerancia):
+    # Cada cara se anota en su bin de distancia y el siguiente: dos caras a
+    # menos de `tolerancia` comparten alguno. Un grupo con los dos signos y más
+    # de una pieza puede tener caras enfrentadas (o colisiones del hash, que
+    # solo agregan caras de más)
+    bins = np.floor(distancia / tolerancia).astype(np.int64)
+    cara = np.repeat(np.arange(len(q)), 2)
+    claves = _hash_filas(np.column_stack((q[cara], bins[cara] + np.tile([0, 1], len(q)))))
+    orden = np.argsort(claves)
+    claves, cara = claves[orden], cara[orden]
+    nuevo = np.empty(len(claves), dtype=bool)
+    nuevo[0] = True
+    np.not_equal(claves[1:], claves[:-1], out=nuevo[1:])
+    inicios = np.flatnonzero(nuevo)
+    mezclado = ((np.minimum.reduceat(signo[cara], inicios) != np.maximum.reduceat(signo[cara], inicios))
+                & (np.minimum.reduceat(pieza[cara], inicios) != np.maximum.reduceat(pieza[cara], inicios)))
+    compartido = np.zeros(len(q), dtype=bool)
+    compartido[cara[mezclado[np.cumsum(nuevo) - 1]]] = True
+    return compartido
+
+
+def _hash_filas(filas):
+    multiplicadores = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5,
+                                0x85EBCA77C2B2AE63, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53], dtype=np.uint64)
+    return np.bitwise_xor.reduce(filas.astype(np.uint64) * multiplicadores[:filas.shape[1]], axis=1)
+
+
+def _lexicografico_menor(a, b):
+    # a < b fila por fila, comparando en orden x, y, z
+    menor = np.zeros(len(a), dtype=bool)
+    decidido = np.zeros(len(a), dtype=bool)
+    for eje in range(a.shape[1]):
+        menor |= ~decidido & (a[:, eje] < b[:, eje])
+        decidido |= a[:, eje] != b[:, eje]
+    return menor
+
+
+def _cubierta(cara, normal, triangulos, tolerancia):
+    # True si la unión de `triangulos` (coplanares) cubre el triángulo `cara`:
+    # se le restan uno por uno y se mira el área que queda, en el plano de la cara
+    eje_u = (cara[1] - cara[0]) / np.linalg.norm(cara[1] - cara[0])
+    eje_v = np.cross(normal, eje_u)
+    def plano(puntos):
+        return np.column_stack((puntos @ eje_u, puntos @ eje_v))
+    restos = [plano(cara)]
+    for triangulo in triangulos:
+        triangulo = plano(triangulo)
+        if _area(triangulo) < 0:
+            triangulo = triangulo[::-1]
+        restos = [pedazo for resto in restos for pedazo in _restar_triangulo(resto, triangulo)]
+        if not restos:
+            return True
+    perimetro = sum(np.linalg.norm(cara[n] - cara[n - 1]) for n in range(3))
+    return sum(abs(_area(resto)) for resto in restos) <= tolerancia * perimetro
+
+
+def _restar_triangulo(poligono, triangulo):
+    # Pedazos convexos de `poligono` (convexo) fuera de `triangulo` (antihorario):
+    # lo que queda afuera de cada arista, y se sigue con lo de adentro
+    aristas = []
+    for n in range(3):
+        a, b = triangulo[n], triangulo[(n + 1) % 3]
+        aristas.append((a, np.array([a[1] - b[1], b[0] - a[0]]) / np.linalg.norm(b - a)))
+        if ((poligono - a) @ aristas[-1][1] <= 0).all():
+            # Del todo afuera de una arista: no se tocan
+            return [poligono]
+    pedazos = []
+    for a, normal_arista in aristas:
+        lado = (poligono - a) @ normal_arista
+        afuera = _recortar(poligono, -lado)
+        if len(afuera) >= 3:
+            pedazos.append(afuera)
+        poligono = _recortar(poligono, lado)
+        if len(poligono) < 3:
+            return pedazos
+    return pedazos
+
+
+def _recortar(poligono, lado):
+    # Parte del polígono con lado > 0 (Sutherland-Hodgman contra una recta)
+    resultado = []
+    for n in range(len(poligono)):
+        p, q = poligono[n - 1], poligono[n]
+        lp, lq = lado[n - 1], lado[n]
+        if (lp > 0) != (lq > 0):
+            resultado.append(p + (q - p) * (lp / (lp - lq)))
+        if lq > 0:
+            resultado.append(q)
+    return np.array(resultado).reshape(-1, 2)
+
+
+def _area(poligono):
+    # Área con signo (positiva en sentido antihorario)
+    x, y = poligono[:, 0], poligono[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _dentro_triangulo(puntos, triangulos, normales, tolerancia):
+    # Punto sobre el plano del triángulo y dentro de él (coordenadas baricéntricas)
+    a, b, c = triangulos[:, 0], triangulos[:, 1], triangulos[:, 2]
+    cerca = np.abs(((puntos - a) * normales).sum(axis=1)) <= tolerancia
+    v0, v1, v2 = c - a, b - a, puntos - a
+    d00, d01, d11 = (v0 * v0).sum(axis=1), (v0 * v1).sum(axis=1), (v1 * v1).sum(axis=1)
+    d02, d12 = (v0 * v2).sum(axis=1), (v1 * v2).sum(axis=1)
+    denominador = d00 * d11 - d01 * d01
+    u = (d11 * d02 - d01 * d12) / denominador
+    v = (d00 * d12 - d01 * d02) / denominador
+    margen = 1e-9
+    return cerca & (u >= -margen) & (v >= -margen) & (u + v <= 1 + margen)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Caras ocultas entre piezas que se tocan')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        piezas = cargar_escena(ruta)['scene_configuration']['pieces']
+        ocultas = caras_ocultas([(p['mesh']['vertices'], p['mesh']['faces']) for p in piezas])
+        total = sum(len(o) for o in ocultas)
+        n_ocultas = sum(int((o >= 0).sum()) for o in ocultas)
+        print(f"{ruta}: {n_ocultas} de {total} caras ocultas en el ensamblaje completo")
+        for n, o in enumerate(ocultas):
+            if (o >= 0).any():
+                print(f"  pieza {n}: {int((o >= 0).sum())} de {len(o)} caras, ocultas por {sorted(set(o[o >= 0].tolist()))}")
@@ -0,0 +1,291 @@
+"""
+Soldadura de vértices y compactación de índices por pieza.
+
+Los vértices a menos de `tolerancia` se unen: se reparten en una rejilla de
+celdas de ese lado, cada vértice se compara solo con los de su celda y las
+vecinas (todo vectorizado) y los pares cercanos se agrupan por componentes
+conexas. Cada grupo queda en la posición de su primer vértice. Después se
+quitan las caras degeneradas (con vértices repetidos o de altura menor que
+la tolerancia) y las duplicadas.
+
+Para la caché de vértices de la GPU, las caras se reordenan con el algoritmo
+de Forsyth ("Linear-Speed Vertex Cache Optimisation"): se emite siempre el
+triángulo de mayor puntaje, que premia los vértices recién usados y los que
+les quedan pocas caras. Después los vértices se renumeran en el orden en que
+los usan las caras, para que también se lean en orden. El reordenamiento es
+un bucle en Python (unos 25 µs por cara): las componentes con más de
+MAX_CARAS_ORDEN caras se dejan en su orden, y soldar_componentes puede
+repartir las componentes entre procesos.
+
+    python -m utils.soldadura configuracion_unity25.json [--tolerancia 1e-6] [--en-sitio]
+    python -m utils.soldadura modelo.stl
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from utils.mallas import centroide
+
+# Tolerancia relativa a la diagonal de la pieza (TOLERANCIA_SOLDADURA)
+TOLERANCIA_RELATIVA = float(os.environ.get('TOLERANCIA_SOLDADURA', 1e-6))
+
+# Las componentes con más caras no se reordenan (MAX_CARAS_ORDEN);
+# cambia el resultado, así que es parte de la clave del caché de utils.stl
+MAX_CARAS_ORDEN = int(os.environ.get('MAX_CARAS_ORDEN', 100000))
+
+# Parámetros del reordenamiento de Forsyth: caché LRU simulada, peso de su
+# posición en ella y premio a los vértices con pocas caras por emitir
+TAM_CACHE_VERTICES = 32
+_POTENCIA_CACHE = 1.5
+_PUNTAJE_ULTIMO_TRIANGULO = 0.75
+_ESCALA_VALENCIA = 2.0
+_POTENCIA_VALENCIA = 0.5
+
+# Mitad de las 27 celdas vecinas (más la propia): cada par se prueba una vez
+_VECINAS = [d for d in itertools.product((-1, 0, 1), repeat=3) if d > (0, 0, 0)]
+
+
+def soldar(vertices, caras, tolerancia=None):
+    """
+    (vertices, caras, estadisticas) de la malla soldada. estadisticas es
+    {'vertices_antes', 'vertices_despues', 'caras_antes', 'caras_despues',
+    'degeneradas', 'duplicadas'}.
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+    estadisticas = {'vertices_antes': len(vertices), 'caras_antes': len(caras)}
+    if tolerancia is None:
+        diagonal = float(np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))) if len(vertices) else 0.0
+        tolerancia = TOLERANCIA_RELATIVA * diagonal
+
+    grupo = _agrupar(vertices, tolerancia)
+    caras = grupo[caras]
+
+    # Degeneradas: vértices repetidos o triángulos sin altura
+    repetidos = (caras[:, 0] == caras[:, 1]) | (caras[:, 1] == caras[:, 2]) | (caras[:, 2] == caras[:, 0])
+    a, b, c = vertices[caras[:, 0]], vertices[caras[:, 1]], vertices[caras[:, 2]]
+    doble_area = np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    lado = np.sqrt(np.max([((b - a) ** 2).sum(axis=1), ((c - b) ** 2).sum(axis=1), ((a - c) ** 2).sum(axis=1)],
+                          axis=0)) if len(caras) else np.empty(0)
+    degeneradas = repetidos | (doble_area <= tolerancia * lado)
+    caras = caras[~degeneradas]
+
+    # Duplicadas: los mismos tres vértices, en cualquier orden; queda la primera
+    _, primeras = np.unique(np.sort(caras, axis=1), axis=0, return_index=True)
+    duplicadas = len(caras) - len(primeras)
+    caras = caras[np.sort(primeras)]
+
+    # Orden de las caras para la caché de vértices de la GPU
+    if len(caras) <= MAX_CARAS_ORDEN:
+        caras = caras[ordenar_para_cache(caras)]
+
+    # Vértices usados, numerados en el orden en que aparecen en las caras
+    usados, primera_vez = np.unique(caras.ravel(), return_index=True)
+    orden = usados[np.argsort(primera_vez, kind='stable')]
+    nuevo_indice = np.empty(len(vertices), dtype=np.int64)
+    nuevo_indice[orden] = np.arange(len(orden))
+
+    estadisticas.update(vertices_despues=len(orden), caras_despues=len(caras),
+                        degeneradas=int(degeneradas.sum()), duplicadas=int(duplicadas))
+    return vertices[orden], nuevo_indice[caras], estadisticas
+
+
+def ordenar_para_cache(caras, tam_cache=TAM_CACHE_VERTICES):
+    """
+    Orden de las caras (índices) que reduce los fallos de la caché de
+    vértices, con el algoritmo de Forsyth. No cambia el sentido de las caras.
+    """
+    caras = np.asarray(caras, dtype=np.int64).reshape(-1, 3)
+    if len(caras) == 0:
+        return np.empty(0, dtype=np.int64)
+    n_vertices = int(caras.max()) + 1
+
+    # Caras de cada vértice (listas de adyacencia en CSR)
+    valencia = np.bincount(caras.ravel(), minlength=n_vertices)
+    inicio = np.concatenate(([0], np.cumsum(valencia)))
+    adyacentes = np.argsort(caras.ravel(), kind='stable') // 3
+
+    puntaje_posicion = [_PUNTAJE_ULTIMO_TRIANGULO] * 3 + [
+        (1.0 - (p - 3) / (tam_cache - 3)) ** _POTENCIA_CACHE for p in range(3, tam_cache)]
+    puntaje_valencia = [0.0] + [_ESCALA_VALENCIA * v ** -_POTENCIA_VALENCIA for v in range(1, int(valencia.max()) + 1)]
+
+    caras_de = [adyacentes[inicio[v]:inicio[v + 1]].tolist() for v in range(n_vertices)]
+    restantes = valencia.tolist()
+    posicion = [-1] * n_vertices
+    puntaje = [puntaje_valencia[r] for r in restantes]
+    lista_caras = caras.tolist()
+    puntaje_cara = [puntaje[a] + puntaje[b] + puntaje[c] for a, b, c in lista_caras]
+    emitida = [False] * len(lista_caras)
+
+    orden = []
+    cache = []
+    mejor = max(range(len(lista_caras)), key=puntaje_cara.__getitem__)
+    siguiente_libre = 0
+    while True:
+        orden.append(mejor)
+        emitida[mejor] = True
+        triangulo = lista_caras[mejor]
+        for v in triangulo:
+            restantes[v] -= 1
+            caras_de[v].remove(mejor)
+
+        # LRU: los vértices del triángulo al frente, sin repetir
+        cache = triangulo + [v for v in cache if v not in triangulo]
+        expulsados = cache[tam_cache:]
+        cache = cache[:tam_cache]
+        for v in expulsados:
+            posicion[v] = -1
+            puntaje[v] = puntaje_valencia[restantes[v]]
+        for p, v in enumerate(cache):
+            posicion[v] = p
+            puntaje[v] = (puntaje_posicion[p] + puntaje_valencia[restantes[v]]) if restantes[v] else 0.0
+
+        # Solo cambian los puntajes de las caras de vértices que se movieron
+        mejor, mejor_puntaje = -1, -1.0
+        for v in cache + expulsados:
+            for t in caras_de[v]:
+                a, b, c = lista_caras[t]
+                puntaje_cara[t] = puntaje[a] + puntaje[b] + puntaje[c]
+                if posicion[v] >= 0 and puntaje_cara[t] > mejor_puntaje:
+                    mejor, mejor_puntaje = t, puntaje_cara[t]
+
+        if mejor < 0:
+            # Nada por emitir junto a la caché: la primera cara pendiente
+            while siguiente_libre < len(lista_caras) and emitida[siguiente_libre]:
+                siguiente_libre += 1
+            if siguiente_libre == len(lista_caras):
+                break
+            mejor = siguiente_libre
+    return np.array(orden, dtype=np.int64)
+
+
+def soldar_componentes(componentes, tolerancia=None, procesos=1):
+    """
+    (componentes soldados, estadísticas por componente) para mallas de
+    trimesh. Con `procesos` > 1 (y fork disponible) las componentes se
+    reparten en tramos contiguos con una cantidad de caras parecida.
+    """
+    import trimesh
+
+    mallas = [(np.asarray(c.vertices), np.asarray(c.faces)) for c in componentes]
+    if procesos > 1 and len(mallas) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        lotes = _lotes_por_caras(mallas, 4 * procesos)
+        with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('fork')) as pool:
+            resultados = [r for lote in pool.map(_soldar_lote, lotes, [tolerancia] * len(lotes)) for r in lote]
+    else:
+        resultados = _soldar_lote(mallas, tolerancia)
+
+    soldados = [trimesh.Trimesh(vertices=vertices, faces=caras, process=False) for vertices, caras, _ in resultados]
+    return soldados, [datos for _, _, datos in resultados]
+
+
+def _soldar_lote(mallas, tolerancia):
+    return [soldar(vertices, caras, tolerancia) for vertices, caras in mallas]
+
+
+def _lotes_por_caras(mallas, n_lotes):
+    # Cortes donde la suma acumulada de caras cruza cada fracción del total
+    acumuladas = np.cumsum([len(caras) for _, caras in mallas])
+    cortes = np.searchsorted(acumuladas, acumuladas[-1] * np.arange(1, n_lotes) / n_lotes, side='right')
+    limites = np.unique(np.concatenate(([0], cortes, [len(mallas)])))
+    return [mallas[inicio:fin] for inicio, fin in zip(limites[:-1], limites[1:])]
+
+
+def soldar_escena(config_data, tolerancia=None):
+    """Suelda la malla de cada pieza de una escena v2; devuelve las estadísticas por pieza"""
+    estadisticas = []
+    for pieza in config_data['scene_configuration']['pieces']:
+        vertices, caras, datos = soldar(pieza['mesh']['vertices'], pieza['mesh']['faces'], tolerancia)
+        pieza['mesh'] = {'vertices': vertices.tolist(), 'faces': caras.tolist()}
+        if 'position' in pieza:
+            pieza['position'] = centroide(vertices)
+        estadisticas.append(datos)
+    return estadisticas
+
+
+def resumen(estadisticas):
+    """Totales de una lista de estadísticas de soldar()"""
+    claves = ('vertices_antes', 'vertices_despues', 'caras_antes', 'caras_despues', 'degeneradas', 'duplicadas')
+    return {clave: sum(datos[clave] for datos in estadisticas) for clave in claves}
+
+
+def _agrupar(vertices, tolerancia):
+    # Grupo (índice del primer vértice del grupo) de cada vértice
+    n = len(vertices)
+    if n == 0 or tolerancia <= 0:
+        return _agrupar_exacto(vertices)
+
+    celdas = np.floor((vertices - vertices.min(axis=0)) / tolerancia).astype(np.int64)
+    ancho = celdas.max(axis=0) + 3
+    claves = ((celdas[:, 0] + 1) * ancho[1] + celdas[:, 1] + 1) * ancho[2] + celdas[:, 2] + 1
+    orden = np.argsort(claves, kind='stable')
+    ordenadas = claves[orden]
+
+    pares = []
+    for desplazamiento in [(0, 0, 0)] + _VECINAS:
+        d = (desplazamiento[0] * ancho[1] + desplazamiento[1]) * ancho[2] + desplazamiento[2]
+        desde = np.searchsorted(ordenadas, claves + d, side='left')
+        hasta = np.searchsorted(ordenadas, claves + d, side='right')
+        cantidad = hasta - desde
+        i = np.repeat(np.arange(n), cantidad)
+        j = orden[np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+                  + np.repeat(desde, cantidad)]
+        cerca = ((vertices[i] - vertices[j]) ** 2).sum(axis=1) <= tolerancia ** 2
+        if desplazamiento == (0, 0, 0):
+            cerca &= i < j
+        pares.append(np.column_stack((i[cerca], j[cerca])))
+
+    pares = np.concatenate(pares)
+    if len(pares) == 0:
+        return np.arange(n)
+    grafo = sparse.coo_matrix((np.ones(len(pares), dtype=bool), (pares[:, 0], pares[:, 1])), shape=(n, n))
+    _, etiquetas = csgraph.connected_components(grafo, directed=False)
+    primero = np.full(etiquetas.max() + 1, n, dtype=np.int64)
+    np.minimum.at(primero, etiquetas, np.arange(n))
+    return primero[etiquetas]
+
+
+def _agrupar_exacto(vertices):
+    # Sin tolerancia solo se unen los vértices idénticos
+    if len(vertices) == 0:
+        return np.empty(0, dtype=np.int64)
+    _, primeros, inversa = np.unique(vertices, axis=0, return_index=True, return_inverse=True)
+    return primeros[inversa.ravel()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Suelda vértices y compacta las mallas de escenas o STL')
+    parser.add_argument('archivos', nargs='+', help='Archivos configuracion_unity*.json o .stl')
+    parser.add_argument('--tolerancia', type=float, default=None,
+                        help='Distancia absoluta de soldadura (por defecto, relativa a cada pieza)')
+    parser.add_argument('--en-sitio', action='store_true', help='Sobrescribir las escenas originales')
+    args = parser.parse_args()
+
+    for ruta in args.archivos:
+        if ruta.lower().endswith('.stl'):
+            from utils.stl import separar_componentes
+            _, estadisticas = soldar_componentes(separar_componentes(ruta), args.tolerancia)
+        else:
+            from utils.escena import cargar_escena
+            config_data = cargar_escena(ruta)
+            estadisticas = soldar_escena(config_data, args.tolerancia)
+            base, extension = os.path.splitext(ruta)
+            destino = ruta if args.en_sitio else f"{base}_soldada{extension}"
+            with open(destino, 'w') as archivo:
+                json.dump(config_data, archivo, separators=(',', ':'), ensure_ascii=False)
+
+        print(f"{ruta}:")
+        for n, datos in enumerate(estadisticas):
+            print(f"  pieza {n}: vértices {datos['vertices_antes']} -> {datos['vertices_despues']}, "
+                  f"caras {datos['caras_antes']} -> {datos['caras_despues']} "
+                  f"({datos['degeneradas']} degeneradas, {datos['duplicadas']} duplicadas)")
+        total = resumen(estadisticas)
+        print(f"  total: vértices {total['vertices_antes']} -> {total['vertices_despues']}, "
+              f"caras {total['caras_antes']} -> {total['caras_despues']}")
@@ -0,0 +1,302 @@
+"""
+Ingesta de modelos STL: carga del archivo y separación en componentes.
+
+Los STL binarios se leen con un dtype estructurado sobre el archivo mapeado
+en memoria y se sueldan con un ordenamiento vectorizado, sin el cargador de
+trimesh.
+
+Separar un STL grande es caro, así que el resultado se guarda en disco
+(DIRECTORIO_CACHE_STL) con el hash SHA-256 del contenido como clave, y además
+en un LRU dentro del proceso. Si el archivo cambia, cambia su hash y la
+entrada anterior simplemente deja de usarse.
+
+En mallas grandes la separación se reparte entre procesos (PROCESOS_STL,
+por defecto todos los núcleos): cada uno agrupa las aristas que le tocan por
+hash y las uniones se combinan en un solo paso de componentes conexas. El
+resultado es el mismo que el de mesh.split(), en el mismo orden.
+
+Cada componente se suelda después con tolerancia (utils.soldadura): se
+unen los vértices casi coincidentes, se quitan las caras degeneradas o
+repetidas y los índices se renumeran en orden de uso.
+"""
+import copy
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import trimesh
+from scipy import sparse
+from scipy.sparse import csgraph
+from trimesh import grouping
+
+from utils import soldadura
+from utils.soldadura import resumen, soldar_componentes
+
+DIRECTORIO_CACHE = os.environ.get('DIRECTORIO_CACHE_STL', '.cache_stl')
+TAM_LRU = 4
+
+PROCESOS = int(os.environ.get('PROCESOS_STL', 0)) or os.cpu_count() or 1
+# Por debajo de este tamaño no compensa levantar procesos
+MIN_CARAS_PARALELO = 100000
+
+# Se incrementa cuando cambia la forma de separar o soldar, para no leer entradas viejas
+VERSION_CACHE = 4
+
+# Registro de un triángulo en un STL binario, después de la cabecera de 84 bytes
+_TAM_CABECERA_STL = 84
+_DTYPE_TRIANGULO_STL = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('atributos', '<u2'),
+])
+
+_lru = OrderedDict()
+_hashes = {}
+
+# Malla (y claves de sus aristas) que heredan los procesos del pool por fork,
+# sin copiarla ni serializarla
+_malla_compartida = None
+_claves_compartidas = None
+
+
+def clave_cache(digest):
+    """Nombre de las entradas del caché de un STL: su hash, la versión y lo que cambia el resultado"""
+    return f"{digest}.v{VERSION_CACHE}.o{soldadura.MAX_CARAS_ORDEN}"
+
+
+def hash_archivo(ruta):
+    # El hash se recuerda mientras el archivo no cambie de tamaño ni de fecha
+    estado = os.stat(ruta)
+    firma = (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+    if firma not in _hashes:
+        digest = hashlib.sha256()
+        with open(ruta, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(1 << 20), b''):
+                digest.update(bloque)
+        _hashes[firma] = digest.hexdigest()
+    return _hashes[firma]
+
+
+def leer_stl_binario(ruta):
+    """
+    Lee un STL binario mapeado en memoria y suelda las esquinas idénticas.
+
+    Devuelve (vertices, caras) como float64 (n, 3) e int64 (m, 3); los vértices
+    quedan en orden de primera aparición y las caras en el orden del archivo.
+    Lanza ValueError si el archivo no es un STL binario válido.
+    """
+    datos = np.memmap(ruta, dtype=np.uint8, mode='r')
+    if len(datos) < _TAM_CABECERA_STL:
+        raise ValueError(f"{ruta} es demasiado corto para ser un STL binario")
+
+    n_triangulos = int(datos[80:_TAM_CABECERA_STL].view('<u4')[0])
+    if len(datos) != _TAM_CABECERA_STL + n_triangulos * _DTYPE_TRIANGULO_STL.itemsize:
+        raise ValueError(f"{ruta} no es un STL binario (longitud inesperada)")
+
+    triangulos = datos[_TAM_CABECERA_STL:].view(_DTYPE_TRIANGULO_STL)
+    # Sumar 0 convierte -0.0 en 0.0 para que ambos se suelden
+    esquinas = triangulos['vertices'].reshape(-1, 3) + np.float32(0)
+
+    primero, inversa = _soldar_exacto(esquinas)
+
+    # Renumerar los vértices por orden de primera aparición
+    orden = np.argsort(primero)
+    nuevo_indice = np.empty_like(orden)
+    nuevo_indice[orden] = np.arange(len(orden))
+
+    vertices = esquinas[primero[orden]].astype(np.float64)
+    caras = nuevo_indice[inversa].reshape(-1, 3).astype(np.int64)
+    return vertices, caras
+
+
+def _soldar_exacto(puntos):
+    """
+    Agrupa filas float32 (n, 3) idénticas bit a bit. Devuelve, por grupo, el
+    índice de su primera aparición y, por fila, el grupo al que pertenece.
+    """
+    if len(puntos) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    bits = np.ascontiguousarray(puntos).view(np.uint32)
+
+    # Ordenar una sola clave de 64 bits es mucho más rápido que comparar las
+    # filas completas; las colisiones del hash se detectan abajo
+    multiplicadores = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9],
+                               dtype=np.uint64)
+    claves = np.bitwise_xor.reduce(bits.astype(np.uint64) * multiplicadores, axis=1)
+    orden = np.argsort(claves)
+    ordenadas = claves[orden]
+
+    nuevo = np.empty(len(orden), dtype=bool)
+    nuevo[0] = True
+    np.not_equal(ordenadas[1:], ordenadas[:-1], out=nuevo[1:])
+    inicios = np.flatnonzero(nuevo)
+
+    primero = np.minimum.reduceat(orden, inicios)
+    inversa = np.empty(len(orden), dtype=np.int64)
+    inversa[orden] = np.cumsum(nuevo) - 1
+
+    if np.array_equal(bits[primero][inversa], bits):
+        return primero, inversa
+
+    # Hubo una colisión: ordenar por las tres coordenadas, que es exacto
+    orden = np.lexsort(bits.T[::-1])
+    filas = bits[orden]
+    nuevo[1:] = np.any(filas[1:] != filas[:-1], axis=1)
+    inicios = np.flatnonzero(nuevo)
+    primero = np.minimum.reduceat(orden, inicios)
+    inversa[orden] = np.cumsum(nuevo) - 1
+    return primero, inversa
+
+
+def cargar_stl(ruta):
+    """Malla de un STL; los binarios se leen sin pasar por el cargador de trimesh"""
+    try:
+        vertices, caras = leer_stl_binario(ruta)
+    except ValueError:
+        # STL ASCII u otro formato que trimesh sepa leer
+        return trimesh.load_mesh(ruta)
+    return trimesh.Trimesh(vertices=vertices, faces=caras, process=False)
+
+
+def separar_componentes(ruta, procesos=None):
+    mesh = cargar_stl(ruta)
+    return separar_malla(mesh, procesos)
+
+
+def separar_malla(mesh, procesos=None):
+    """
+    Equivalente a mesh.split() (solo componentes cerradas, en el mismo orden)
+    repartiendo el trabajo entre `procesos`. Sin fork disponible, o con mallas
+    pequeñas, se usa directamente mesh.split().
+    """
+    global _malla_compartida, _claves_compartidas
+    procesos = procesos or PROCESOS
+    if (procesos <= 1 or len(mesh.faces) < MIN_CARAS_PARALELO
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        return mesh.split()
+
+    # Las normales y las claves de arista se calculan una vez aquí y los procesos las heredan
+    mesh.face_normals
+    _malla_compartida = mesh
+    _claves_compartidas = _claves_aristas(mesh)
+    try:
+        with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('fork')) as pool:
+            # 1) Cada proceso agrupa las aristas de su cubeta de hash y devuelve
+            #    los pares de caras que comparten una arista con exactamente dos caras
+            pares = np.concatenate(list(pool.map(_pares_adyacentes, range(procesos), [procesos] * procesos)))
+
+            # 2) Unión de todos los pares; scipy etiqueta las componentes en
+            #    orden de su cara más baja, igual que dentro de mesh.split()
+            n_caras = len(mesh.faces)
+            grafo = sparse.coo_matrix((np.ones(len(pares), dtype=bool), (pares[:, 0], pares[:, 1])),
+                                      shape=(n_caras, n_caras))
+            _, etiquetas = csgraph.connected_components(grafo, directed=False)
+            componentes = grouping.group(etiquetas, min_len=4)
+
+            # 3) Submallas por tramos contiguos, para conservar el orden
+            tramos = np.array_split(np.arange(len(componentes)), procesos)
+            lotes = [[componentes[n] for n in tramo] for tramo in tramos if len(tramo)]
+            resultado = []
+            for lote in pool.map(_submallas, lotes):
+                resultado.extend(
+                    trimesh.Trimesh(vertices=v, faces=f, face_normals=n,
+                                    metadata=copy.deepcopy(mesh.metadata), process=False)
+                    for v, f, n in lote
+                )
+            return resultado
+    finally:
+        _malla_compartida = _claves_compartidas = None
+
+
+def _claves_aristas(mesh):
+    # Aristas (a, b) con a < b, codificadas en un entero; la arista k es de la cara k // 3
+    aristas = np.sort(mesh.faces.view(np.ndarray)[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    return aristas[:, 0].astype(np.int64) * len(mesh.vertices) + aristas[:, 1]
+
+
+def _pares_adyacentes(cubeta, n_cubetas):
+    propias = np.flatnonzero(_claves_compartidas % n_cubetas == cubeta)
+    claves = _claves_compartidas[propias]
+    orden = np.argsort(claves, kind='stable')
+    claves = claves[orden]
+    cara = propias[orden] // 3
+
+    # Los grupos de la misma clave son contiguos; como en trimesh, solo
+    # cuentan las aristas compartidas por exactamente dos caras distintas
+    nuevo = np.ones(len(claves) + 1, dtype=bool)
+    np.not_equal(claves[1:], claves[:-1], out=nuevo[1:-1])
+    inicios = np.flatnonzero(nuevo)
+    dobles = inicios[:-1][np.diff(inicios) == 2]
+    pares = np.column_stack((cara[dobles], cara[dobles + 1]))
+    return pares[pares[:, 0] != pares[:, 1]]
+
+
+def _submallas(componentes):
+    partes = _malla_compartida.submesh(componentes, only_watertight=True)
+    return [(np.asarray(p.vertices), np.asarray(p.faces), np.asarray(p.face_normals)) for p in partes]
+
+
+def _guardar_componentes(ruta, componentes):
+    vertices = [np.asarray(c.vertices) for c in componentes]
+    caras = [np.asarray(c.faces) for c in componentes]
+
+    # Escribir a un temporal y renombrar, para que otro proceso nunca lea un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        np.savez(
+            archivo,
+            vertices=np.concatenate(vertices) if vertices else np.empty((0, 3)),
+            caras=np.concatenate(caras) if caras else np.empty((0, 3), dtype=np.int64),
+            fin_vertices=np.cumsum([0] + [len(v) for v in vertices]),
+            fin_caras=np.cumsum([0] + [len(c) for c in caras]),
+        )
+    os.replace(temporal, ruta)
+
+
+def _cargar_componentes(ruta):
+    with np.load(ruta) as datos:
+        vertices, caras = datos['vertices'], datos['caras']
+        fin_v, fin_c = datos['fin_vertices'], datos['fin_caras']
+
+    return [
+        trimesh.Trimesh(vertices=vertices[fin_v[n]:fin_v[n + 1]],
+                        faces=caras[fin_c[n]:fin_c[n + 1]],
+                        process=False)
+        for n in range(len(fin_v) - 1)
+    ]
+
+
+def cargar_componentes(ruta_stl):
+    """
+    Componentes de un STL, reutilizando el caché en memoria o en disco si
+    existe. Cada llamada devuelve copias: modificar una malla no toca el caché.
+    """
+    digest = hash_archivo(ruta_stl)
+
+    if digest in _lru:
+        _lru.move_to_end(digest)
+        return [c.copy() for c in _lru[digest]]
+
+    ruta_cache = os.path.join(DIRECTORIO_CACHE, f"{clave_cache(digest)}.npz")
+    if os.path.exists(ruta_cache):
+        componentes = _cargar_componentes(ruta_cache)
+    else:
+        separados = separar_componentes(ruta_stl)
+        # Soldar (y reordenar para la caché de vértices) también en paralelo en mallas grandes
+        procesos = PROCESOS if sum(len(c.faces) for c in separados) >= MIN_CARAS_PARALELO else 1
+        componentes, estadisticas = soldar_componentes(separados, procesos=procesos)
+        total = resumen(estadisticas)
+        logging.info(f"Soldadura de {ruta_stl}: vértices {total['vertices_antes']} -> {total['vertices_despues']}, "
+                     f"caras {total['caras_antes']} -> {total['caras_despues']}")
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        _guardar_componentes(ruta_cache, componentes)
+
+    _lru[digest] = componentes
+    while len(_lru) > TAM_LRU:
+        _lru.popitem(last=False)
+    return [c.copy() for c in componentes]
@@ -0,0 +1,103 @@
+"""
+Hashes de contenido por pieza y diferencias entre versiones de una escena.
+
+Cada pieza puede llevar en pieza['content_hash'] un hash de su geometría y
+sus metadatos. Con los hashes guardados, comparar dos versiones es comparar
+diccionarios id -> hash, sin tocar la geometría; las piezas sin hash se
+hashean al vuelo. Quedan fuera del hash position (se deriva de los vértices
+en ambos esquemas) y el propio content_hash, así que una escena y su
+migración a v2 dan los mismos hashes.
+
+    python -m utils.versiones configuracion_unity16.json configuracion_unity25.json
+    python -m utils.versiones --hashear configuracion_unity25.json [--en-sitio]
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.escena import cargar_escena
+
+_EXCLUIDOS = ('mesh', 'position', 'content_hash')
+
+
+def hash_pieza(pieza):
+    """Hash BLAKE2b (128 bits, hexadecimal) de la geometría y los metadatos de una pieza"""
+    vertices = np.ascontiguousarray(pieza['mesh']['vertices'], dtype='<f8')
+    caras = np.ascontiguousarray(pieza['mesh']['faces'], dtype='<i8')
+    metadatos = {k: v for k, v in pieza.items() if k not in _EXCLUIDOS}
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(metadatos, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    # Los tamaños separan vértices de caras: sin ellos dos mallas distintas
+    # podrían dar la misma secuencia de bytes
+    digest.update(np.array([vertices.size, caras.size], dtype='<i8').tobytes())
+    digest.update(vertices.tobytes())
+    digest.update(caras.tobytes())
+    return digest.hexdigest()
+
+
+def hash_guardado(pieza):
+    """El content_hash de la pieza, o el calculado si no lo trae"""
+    return pieza.get('content_hash') or hash_pieza(pieza)
+
+
+def agregar_hashes(config_data):
+    """Calcula y guarda el content_hash de cada pieza"""
+    for pieza in config_data['scene_configuration']['pieces']:
+        pieza['content_hash'] = hash_pieza(pieza)
+    return config_data
+
+
+def hashes_escena(config_data):
+    """{id de pieza: content_hash}; sin id se usa la posición en la lista"""
+    return {pieza.get('id', n): hash_guardado(pieza)
+            for n, pieza in enumerate(config_data['scene_configuration']['pieces'])}
+
+
+def diferencias(anterior, nueva):
+    """
+    Piezas agregadas, eliminadas y modificadas de `anterior` a `nueva`
+    (escenas o diccionarios id -> hash como los de hashes_escena), como
+    {'agregadas', 'eliminadas', 'modificadas': [ids], 'iguales': cantidad}.
+    """
+    if 'scene_configuration' in anterior:
+        anterior = hashes_escena(anterior)
+    if 'scene_configuration' in nueva:
+        nueva = hashes_escena(nueva)
+
+    comunes = anterior.keys() & nueva.keys()
+    modificadas = [id_pieza for id_pieza in nueva if id_pieza in comunes and anterior[id_pieza] != nueva[id_pieza]]
+    return {
+        'agregadas': [id_pieza for id_pieza in nueva if id_pieza not in anterior],
+        'eliminadas': [id_pieza for id_pieza in anterior if id_pieza not in nueva],
+        'modificadas': modificadas,
+        'iguales': len(comunes) - len(modificadas),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara versiones de escenas de Unity por hash de pieza')
+    parser.add_argument('archivos', nargs='+', help='Dos escenas a comparar, o las escenas a hashear')
+    parser.add_argument('--hashear', action='store_true',
+                        help='Guardar content_hash en cada pieza (<archivo>_hash.json)')
+    parser.add_argument('--en-sitio', action='store_true', help='Con --hashear, sobrescribir los archivos')
+    args = parser.parse_args()
+
+    if args.hashear:
+        for ruta in args.archivos:
+            base, extension = os.path.splitext(ruta)
+            destino = ruta if args.en_sitio else f"{base}_hash{extension}"
+            config_data = agregar_hashes(cargar_escena(ruta))
+            with open(destino, 'w') as archivo:
+                json.dump(config_data, archivo, separators=(',', ':'), ensure_ascii=False)
+            print(f"{ruta} -> {destino}: {len(config_data['scene_configuration']['pieces'])} piezas")
+    else:
+        if len(args.archivos) != 2:
+            parser.error('para comparar hacen falta exactamente dos escenas')
+        resultado = diferencias(cargar_escena(args.archivos[0]), cargar_escena(args.archivos[1]))
+        print(f"{args.archivos[0]} -> {args.archivos[1]}: {resultado['iguales']} iguales")
+        for clave in ('agregadas', 'eliminadas', 'modificadas'):
+            print(f"  {clave} ({len(resultado[clave])}): {resultado[clave]}")